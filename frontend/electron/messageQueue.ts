@@ -10,6 +10,13 @@ export interface Message {
   data: any;
 }
 
+// Framings offered to Python in the handshake, most preferred first (see python/framing.py).
+// framed-json is a 4 byte big-endian length followed by that many bytes of JSON; 'json' is one JSON object per line.
+const OFFERED_FRAMINGS = ['framed-json'];
+// Largest frame accepted, matching Python's maxFrameSize; a bigger length means the stream is out of sync
+const MAX_FRAME_SIZE = 256 * 1024 * 1024;
+const FRAME_HEADER_SIZE = 4;
+
 // Connection states
 export enum ConnectionState {
   DISCONNECTED,
@@ -26,6 +33,13 @@ export class MessageQueue extends EventEmitter {
   private readonly MAX_RECONNECT_ATTEMPTS = 3;
   private reconnectTimeout: NodeJS.Timeout | null = null;
   private pythonProcessExited: boolean = false;
+  // Python session to resume after a reconnect, and the last message sequence number received from it
+  private sessionId: string | null = null;
+  private lastSeq: number = 0;
+  // Framing of the current connection: every connection starts with JSON lines until the 'hi!' reply switches it
+  private framing: string = 'json';
+  // Bytes received that don't make up a whole message yet
+  private received: Buffer = Buffer.alloc(0);
 
   constructor() {
     super();
@@ -120,6 +134,8 @@ export class MessageQueue extends EventEmitter {
         }
         
         console.log("Electron connected to Python");
+        this.framing = 'json';
+        this.received = Buffer.alloc(0);
         this.state = ConnectionState.CONNECTED;
         this.reconnectAttempts = 0;
         this.setupListeners();
@@ -136,34 +152,21 @@ export class MessageQueue extends EventEmitter {
   }
 
   private setupListeners(): void {
-    // Socket data handler for raw data
+    // Socket data handler for raw data; a message can be split across chunks, or a chunk hold several
     ipc.of.python.on('data', (buffer: Buffer) => {
+      this.received = this.received.length ? Buffer.concat([this.received, buffer]) : buffer;
       try {
-        const messageStr = buffer.toString().trim();
-        if (!messageStr) return;
-      
-        
-        const messages = messageStr.split('\n').filter(msg => msg.trim());
-        
-        for (const msg of messages) {
-          try {
-            const message = JSON.parse(msg);
-            console.log('Electron recieved message:', message);
-            
-            
-            if (message.type === 'python ready') {
-              this.sendOnSocket({ type: 'electron ready', data: null });
-            }
-            if (message.type == "hi!"){
-              this.state = ConnectionState.READY;
-            }
-            this.emit('message', message);
-          } catch (e) {
-            console.error('Failed to parse message part:', msg, e);
+        let message: any;
+        while ((message = this.nextMessage()) !== undefined) {
+          if (message !== null) {
+            this.handleMessage(message);
           }
         }
       } catch (error) {
+        // A bad frame length leaves no way to find the next message, so start over on a new connection
         console.error('Error processing socket data:', error);
+        this.received = Buffer.alloc(0);
+        ipc.disconnect('python');
       }
     });
 
@@ -194,6 +197,63 @@ export class MessageQueue extends EventEmitter {
     });
   }
 
+  // Takes the next whole message off the received bytes: undefined if there isn't one yet,
+  // null if it couldn't be parsed (the stream is still in sync, so it's skipped)
+  private nextMessage(): any {
+    let payload: Buffer;
+    if (this.framing === 'framed-json') {
+      if (this.received.length < FRAME_HEADER_SIZE) return undefined;
+      const length = this.received.readUInt32BE(0);
+      if (length > MAX_FRAME_SIZE) {
+        throw new Error(`Frame of ${length} bytes is larger than the maximum of ${MAX_FRAME_SIZE}`);
+      }
+      if (this.received.length < FRAME_HEADER_SIZE + length) return undefined;
+      payload = this.received.subarray(FRAME_HEADER_SIZE, FRAME_HEADER_SIZE + length);
+      this.received = this.received.subarray(FRAME_HEADER_SIZE + length);
+    } else {
+      const end = this.received.indexOf(0x0a);
+      if (end < 0) return undefined;
+      payload = this.received.subarray(0, end);
+      this.received = this.received.subarray(end + 1);
+      if (!payload.toString().trim()) return null;
+    }
+    try {
+      return JSON.parse(payload.toString('utf8'));
+    } catch (e) {
+      console.error('Failed to parse message part:', payload.toString('utf8').slice(0, 200), e);
+      return null;
+    }
+  }
+
+  private handleMessage(message: any): void {
+    console.log('Electron recieved message:', message);
+
+    if (typeof message.seq === 'number') {
+      this.lastSeq = message.seq;
+    }
+    if (message.type === 'python ready') {
+      // On a reconnect, ask Python to replay what we missed instead of starting over
+      const hello: any = { framing: OFFERED_FRAMINGS };
+      if (this.sessionId) {
+        hello.session = this.sessionId;
+        hello.last_seq = this.lastSeq;
+      }
+      this.sendOnSocket({ type: 'electron ready', data: hello });
+    }
+    if (message.type == "hi!"){
+      if (message.data && message.data.session) {
+        if (message.data.session !== this.sessionId) {
+          this.lastSeq = 0;
+        }
+        this.sessionId = message.data.session;
+      }
+      // The reply came in the old framing; everything after it, both ways, uses the chosen one
+      this.framing = (message.data && message.data.framing) || 'json';
+      this.state = ConnectionState.READY;
+    }
+    this.emit('message', message);
+  }
+
   private handleDisconnect(): void {
     if (this.state === ConnectionState.STOPPED || this.pythonProcessExited) return;
     
@@ -229,10 +289,18 @@ export class MessageQueue extends EventEmitter {
   }
 
   async sendOnSocket(message:Message) : Promise<void> {
-    const jsonMessage = JSON.stringify(message) + '\n';
+    const jsonMessage = JSON.stringify(message);
     console.log(`Electron sending to Python: ${jsonMessage}`);
-    // Format the message as a JSON string with a newline
-    ipc.of.python.socket.write(jsonMessage);
+    if (this.framing === 'framed-json') {
+      // A 4 byte big-endian length, then the JSON
+      const payload = Buffer.from(jsonMessage, 'utf8');
+      const header = Buffer.alloc(FRAME_HEADER_SIZE);
+      header.writeUInt32BE(payload.length, 0);
+      ipc.of.python.socket.write(Buffer.concat([header, payload]));
+    } else {
+      // Format the message as a JSON string with a newline
+      ipc.of.python.socket.write(jsonMessage + '\n');
+    }
   }
 
   async send(message: Message): Promise<void> {
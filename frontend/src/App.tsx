@@ -7,12 +7,16 @@ import Button from './components/UI/Button';
 import SettingsButton from './components/UI/SettingsButton';
 import SettingsModal from './components/Settings/SettingsModal';
 import CommandSummaryModal from './components/SummaryModal';
+import ResultsTable from './components/ResultsTable';
 import { useSettings, AppSettings } from './contexts/SettingsContext';
 import { 
   currentCommandState, 
   CommandMap, 
   hasCommandSelectedState, 
   currentStepState, 
+  etaState,
+  profileState,
+  resultTablesState,
   animationState, 
   settingsModalOpenState,
   nodelockState,
@@ -76,6 +80,9 @@ const RecoilApp: React.FC = () => {
   const [isSettingsOpen, setIsSettingsOpen] = useRecoilState(settingsModalOpenState);
   const [isRunning, setIsRunning] = useRecoilState(isRunningState);
   const [currentStep, setCurrentStep] = useRecoilState(currentStepState);
+  const [eta, setEta] = useRecoilState(etaState);
+  const [profile, setProfile] = useRecoilState(profileState);
+  const [resultTables, setResultTables] = useRecoilState(resultTablesState);
   const currentCommand = useRecoilValue(currentCommandState);
   const [animation, setAnimation] = useRecoilState(animationState);
   const [solveType, setSolveType] = useRecoilState(solveTypeState);
@@ -136,6 +143,38 @@ const RecoilApp: React.FC = () => {
         }
       }
       
+      // Handle progress estimates
+      else if (data.type === 'eta') {
+        const { done, total, seconds_left } = data.data;
+        setEta(seconds_left === null
+          ? `${done} of ${total} files done`
+          : `${done} of ${total} files done, about ${Math.ceil(seconds_left / 60)} min left`);
+      }
+      
+      // Handle result rows as each file finishes; the first row of a table carries its columns.
+      // seq numbers the rows of a table from 0, so rows replayed after a reconnect that are already shown are skipped
+      else if (data.type === 'result_row') {
+        const { table, seq, columns, values } = data.data;
+        setResultTables(tables => {
+          const rows = tables[table]?.rows ?? [];
+          if (typeof seq === 'number' && seq < rows.length) return tables;
+          return {
+            ...tables,
+            [table]: {
+              columns: columns ?? tables[table]?.columns ?? [],
+              rows: [...rows, values]
+            }
+          };
+        });
+      }
+      
+      // Handle profiles of a run: show where the time went
+      else if (data.type === 'profile') {
+        const { seconds, solver_wait, hot } = data.data;
+        const top = hot.slice(0, 3).map((h: any) => h.function).join(', ');
+        setCurrentStep(`Profiled ${seconds.toFixed(1)}s, ${solver_wait.toFixed(1)}s waiting for the solver. Hottest: ${top}`);
+      }
+      
       // Handle command summary messages
       else if (data.type === 'command_summary') {
         console.log('Received command summary:', data.data);
@@ -184,6 +223,8 @@ const RecoilApp: React.FC = () => {
     if (!currentCommand || !isSolverPathSet) return;
     
     setIsRunning(true);
+    setEta('');
+    setResultTables({});
     const collectedInputs: { [key: string]: string } = {};
     
     // Get required inputs for the command
@@ -282,7 +323,8 @@ const RecoilApp: React.FC = () => {
         type: 'command',
         data: {
           type: currentCommand.name,
-          args: collectedInputs
+          args: collectedInputs,
+          ...(profile !== 'off' && { profile })
         }
       });
     } catch (error) {
@@ -334,7 +376,16 @@ const RecoilApp: React.FC = () => {
                   </ExecutionTitle>
                   <Spinner />
                   <ExecutionStep>{currentStep}</ExecutionStep>
+                  {eta && <ExecutionStep>{eta}</ExecutionStep>}
+                  {typeof currentCommand === 'object' && currentCommand.name === 'run_progressive' && (
+                    <Button variant="secondary" onClick={() => window.electron.sendToPython({ type: 'stop', data: null })}>
+                      Stop after current file
+                    </Button>
+                  )}
                 </ExecutionStatus>
+                {Object.entries(resultTables).map(([name, table]) => (
+                  <ResultsTable key={name} name={name} table={table} />
+                ))}
               </ExecutionContainer>
             ) : (
               <>
@@ -460,6 +511,42 @@ const RecoilApp: React.FC = () => {
 
                     </ToggleContainer>
                   </ToggleGroup>
+
+                  <ToggleGroup>
+                    <ToggleLabel>Profile</ToggleLabel>
+                    <ToggleContainer>
+                      <ToggleOption 
+                        $active={profile === 'off'} 
+                        onClick={() => isSolverPathSet && setProfile('off')}
+                        style={{ 
+                          opacity: !isSolverPathSet ? 0.5 : 1,
+                          cursor: !isSolverPathSet ? 'not-allowed' : 'pointer'
+                        }}
+                      >
+                        off
+                      </ToggleOption>
+                      <ToggleOption 
+                        $active={profile === 'deterministic'} 
+                        onClick={() => isSolverPathSet && setProfile('deterministic')}
+                        style={{ 
+                          opacity: !isSolverPathSet ? 0.5 : 1,
+                          cursor: !isSolverPathSet ? 'not-allowed' : 'pointer'
+                        }}
+                      >
+                        deterministic
+                      </ToggleOption>
+                      <ToggleOption 
+                        $active={profile === 'sampling'} 
+                        onClick={() => isSolverPathSet && setProfile('sampling')}
+                        style={{ 
+                          opacity: !isSolverPathSet ? 0.5 : 1,
+                          cursor: !isSolverPathSet ? 'not-allowed' : 'pointer'
+                        }}
+                      >
+                        sampling
+                      </ToggleOption>
+                    </ToggleContainer>
+                  </ToggleGroup>
                   
                   </Toggles>
 
@@ -0,0 +1,96 @@
+import React, { useMemo, useState } from 'react';
+import styled from 'styled-components';
+import { ResultTable } from '../recoil/atoms';
+
+interface ResultsTableProps {
+  name: string;
+  table: ResultTable;
+}
+
+// rows past this are still kept and sorted, just not rendered
+const maxRenderedRows = 500;
+
+const TableTitle = styled.h4`
+  margin: 16px 0 8px;
+  font-size: 14px;
+  color: ${({ theme }) => theme.colors.primary};
+  font-family: Inter;
+`;
+
+const TableContainer = styled.div`
+  max-height: 300px;
+  max-width: 100%;
+  overflow: auto;
+  background-color: rgba(0, 0, 0, 0.2);
+  border-radius: 6px;
+`;
+
+const Table = styled.table`
+  border-collapse: collapse;
+  font-family: 'JetBrains Mono', monospace;
+  font-size: 12px;
+  color: ${({ theme }) => theme.colors.textSecondary};
+
+  th, td {
+    padding: 4px 8px;
+    text-align: right;
+    white-space: nowrap;
+  }
+
+  th {
+    position: sticky;
+    top: 0;
+    cursor: pointer;
+    background-color: ${({ theme }) => theme.colors.surfaceLight};
+  }
+`;
+
+// a live table of the rows a command has streamed so far ('result_row' messages); click a column to sort by it
+const ResultsTable: React.FC<ResultsTableProps> = ({ name, table }) => {
+  const [sortColumn, setSortColumn] = useState<number | null>(null);
+  const [descending, setDescending] = useState(false);
+
+  const sortedRows = useMemo(() => {
+    if (sortColumn === null) return table.rows;
+    const sorted = [...table.rows].sort((a, b) => {
+      const x = a[sortColumn];
+      const y = b[sortColumn];
+      if (typeof x === 'number' && typeof y === 'number') return x - y;
+      return String(x).localeCompare(String(y));
+    });
+    return descending ? sorted.reverse() : sorted;
+  }, [table.rows, sortColumn, descending]);
+
+  const sortBy = (column: number) => {
+    setDescending(column === sortColumn ? !descending : false);
+    setSortColumn(column);
+  };
+
+  return (
+    <>
+      <TableTitle>{name} ({table.rows.length} rows)</TableTitle>
+      <TableContainer>
+        <Table>
+          <thead>
+            <tr>
+              {table.columns.map((column, index) => (
+                <th key={index} onClick={() => sortBy(index)}>
+                  {column}{sortColumn === index ? (descending ? ' ▼' : ' ▲') : ''}
+                </th>
+              ))}
+            </tr>
+          </thead>
+          <tbody>
+            {sortedRows.slice(0, maxRenderedRows).map((row, rowIndex) => (
+              <tr key={rowIndex}>
+                {row.map((value, index) => <td key={index}>{value}</td>)}
+              </tr>
+            ))}
+          </tbody>
+        </Table>
+      </TableContainer>
+    </>
+  );
+};
+
+export default ResultsTable;
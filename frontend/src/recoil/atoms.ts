@@ -67,6 +67,26 @@ export const CommandMap: CommandMapType = {
     name: "save_no_turns",
     inputs: [Inputs.cfrFolder]
   },
+  RUN_PROGRESSIVE: {
+    name: "run_progressive",
+    inputs: [Inputs.cfrFolder, Inputs.nodeBook]
+  },
+  EXTRACT_SUBTREES: {
+    name: "extract_subtrees",
+    inputs: [Inputs.cfrFolder, Inputs.nodeBook]
+  },
+  PREFLIGHT: {
+    name: "preflight",
+    inputs: [Inputs.cfrFolder, Inputs.weights, Inputs.nodeBook]
+  },
+  WEIGHT_SWEEP: {
+    name: "weight_sweep",
+    inputs: [Inputs.cfrFolder, Inputs.weights, Inputs.nodeBook]
+  },
+  AUTOTUNE: {
+    name: "autotune",
+    inputs: [Inputs.cfrFolder]
+  },
   NONE: {
     name: "none"
   }
@@ -109,6 +129,31 @@ export const currentStepState = atom({
   default: ''
 });
 
+// estimated time left in the running command, from 'eta' messages
+export const etaState = atom({
+  key: 'etaState',
+  default: ''
+});
+
+// rows streamed by the running command ('result_row' messages), by table name
+export type ResultTable = {
+  columns: string[];
+  rows: (string | number)[][];
+};
+
+export const resultTablesState = atom({
+  key: 'resultTablesState',
+  default: {} as Record<string, ResultTable>
+});
+
+export type ProfileMode = 'off' | 'deterministic' | 'sampling';
+
+// profile the next commands run (python/profiling.py); off adds no overhead
+export const profileState = atom({
+  key: 'profileState',
+  default: 'off' as ProfileMode
+});
+
 export const animationState = atom({
   key: 'animationState',
   default: 'intro' as AnimationState
@@ -209,6 +254,14 @@ export const commandDescriptionState = selector({
         return 'Resave files without rivers to reduce file size';
       case 'save_no_turns':
         return 'Resave files without turns to reduce file size';
+      case 'run_progressive':
+        return `Solve every file coarsely first and publish results, then refine them in passes until an accuracy of ${accuracy}`;
+      case 'extract_subtrees':
+        return `Cut out the subtree at the node of each file and solve it to an accuracy of ${accuracy} in a new folder`;
+      case 'weight_sweep':
+        return `Nodelock every file at each weight listed for one category and tabulate EVs and frequencies against the weight`;
+      case 'autotune':
+        return 'Time a sample of the files with different numbers of solver processes and threads, and use the fastest for later runs on files like these';
       case 'none':
         return 'No command selected';
       default:
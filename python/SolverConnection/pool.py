@@ -0,0 +1,105 @@
+from __future__ import annotations
+from SolverConnection.solver import Solver
+from runtimes import longestFirst
+import threading
+import queue
+import unittest
+
+
+# a fixed number of solver processes that work through a list of items in parallel, one item per process at a time.
+# processes are started in parallel the first time they're needed and reused for every later map().
+class SolverPool():
+
+    def __init__(self, path : str, size : int = 2, accuracy : float = None, spawn = Solver) -> None:
+        self.solverPath = path
+        self.size = max(1, size)
+        self.accuracy = accuracy
+        self.spawn = spawn
+        self.solvers : list = []
+
+    def start(self) -> None:
+        if self.solvers:
+            return
+        started = [None] * self.size
+        errors = []
+        def startOne(i):
+            try:
+                started[i] = self.spawn(self.solverPath)
+                if self.accuracy is not None:
+                    started[i].accuracy = self.accuracy
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=startOne, args=[i], daemon=True) for i in range(self.size)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.solvers = [s for s in started if s is not None]
+        if not self.solvers:
+            raise errors[0]
+
+    # calls func(solver, item) for every item, each on whichever process is free next.
+    # costs : the predicted cost of each item; the most expensive are started first so one big item doesn't finish last
+    # returns the results in the order of items; an item whose call raised gets the exception as its result
+    def map(self, func, items : list, costs : list = None) -> list:
+        self.start()
+        results = [None] * len(items)
+        work = queue.Queue()
+        order = longestFirst(costs) if costs else range(len(items))
+        for i in order:
+            work.put((i, items[i]))
+
+        def worker(solver):
+            while True:
+                try:
+                    i, item = work.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    results[i] = func(solver, item)
+                except Exception as e:
+                    results[i] = e
+
+        threads = [threading.Thread(target=worker, args=[s], daemon=True) for s in self.solvers]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def exit(self) -> None:
+        for s in self.solvers:
+            try:
+                s.exit()
+            except Exception:
+                pass
+        self.solvers = []
+
+
+class Tests(unittest.TestCase):
+
+    def testMapUsesEveryProcess(self):
+        from SolverConnection.supervisor import FakeSolver
+        import time
+        pool = SolverPool("pio.exe", size=3, spawn=FakeSolver)
+        def work(solver, item):
+            time.sleep(0.01)
+            if item == 4:
+                raise Exception("bad file")
+            return [id(solver), item * 2]
+        results = pool.map(work, list(range(9)))
+        self.assertEqual([r[1] for r in results if type(r) is list], [0, 2, 4, 6, 10, 12, 14, 16])
+        self.assertEqual(str(results[4]), "bad file")
+        self.assertEqual(len({r[0] for r in results if type(r) is list}), 3)
+        pool.exit()
+
+    def testLongestFirst(self):
+        from SolverConnection.supervisor import FakeSolver
+        pool = SolverPool("pio.exe", size=1, spawn=FakeSolver)
+        started = []
+        pool.map(lambda solver, item: started.append(item), ["a", "b", "c"], costs=[1, 30, 2])
+        self.assertEqual(started, ["b", "c", "a"])
+
+
+if __name__ == '__main__':
+    unittest.main()
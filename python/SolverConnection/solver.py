@@ -1,48 +1,133 @@
 import subprocess
+import threading
+import queue
+import time
 import os
 import pathlib
+import tracing
+from SolverConnection import transcript
 
 printConsole = False
 
 class SolverException(Exception):
     pass
 
+# the solver process stopped answering in time or went away; the session has to be restarted
+class SolverFailure(Exception):
+    pass
+
+class SolverTimeout(SolverFailure):
+    pass
+
+class SolverDied(SolverFailure):
+    pass
+
+# how long each command may take before the solver is considered hung, in seconds.
+# the deadline of the last command written applies to everything read after it.
+defaultDeadline = 300
+deadlines = {
+    "go": 6 * 3600,
+    "wait_for_solver": 6 * 3600,
+    "load_tree": 1800,
+    "load_all_nodes": 1800,
+    "rebuild_forgotten_streets": 1800,
+    "dump_tree": 1800,
+    "build_tree": 1800,
+    "free_tree": 600,
+}
+
 
     
 class Solver(object):
-    def __init__(self, path : str):
+    def __init__(self, path : str, deadlines : dict = deadlines, record : bool = True):
         """
         Create a new solver instance.
+        record: False doesn't start a transcript of its own with PIOSPEED_RECORD (its owner attaches one, see attach)
         """
         self.solverPath = path
+        self.deadlines = deadlines
+        self.deadline = None
+        # what is written to and read from the process, when recording (see transcript.py)
+        self.transcript = None
+        # whether the transcript belongs to someone else, who closes it
+        self.shared_transcript = False
+        if record and transcript.recordFolder:
+            self.record(transcript.newTranscriptPath(transcript.recordFolder))
+        self.spawn()
+        self._hand_order = None
         
+        self.accuracy = 0.2
+
+    # starts recording this connection to a transcript at path (absolute: spawn changes the working directory)
+    def record(self, path : str):
+        self.attach(transcript.Transcript(os.path.abspath(path), self.solverPath), shared = False)
+
+    # records the rest of this connection to a transcript that may already hold earlier processes (a supervisor's)
+    def attach(self, recording, shared : bool = True):
+        self.transcript = recording
+        self.shared_transcript = shared
+        if getattr(self, "process", None) is not None:
+            # already running: start from the handshake spawn did, so every transcript replays from a spawn
+            self.transcript.spawned()
+            self.transcript.wrote(["set_end_string END"])
+            self.transcript.read("END", [], 0)
+
+    def spawn(self):
+        if self.transcript is not None:
+            self.transcript.spawned()
         workingdirectory = pathlib.Path(self.solverPath).parent
         os.chdir(workingdirectory)
 
         self.process = subprocess.Popen(
             [self.solverPath], bufsize=0, stdin=subprocess.PIPE, stdout=subprocess.PIPE, universal_newlines=True)
+        # output is read on a separate thread so reads can give up once a command's deadline passes
+        self.lines = queue.Queue()
+        self.reader = threading.Thread(target=self.readOutput, args=[self.process.stdout, self.lines], daemon=True)
+        self.reader.start()
         self.write_line("set_end_string END")
         self.wait_line("END")
-        self._hand_order = None
-        
-        self.accuracy = 0.2
+
+    # kills the process and starts a fresh one with the same executable; any loaded tree is lost
+    def restart(self):
+        self.kill()
+        self.spawn()
 
     def exit(self):
+        if self.transcript is not None and not self.shared_transcript:
+            self.transcript.close()
+        self.transcript = None
+        self.kill()
+
+    def kill(self):
         self.process.kill()
         self.process.wait(1)
         self.process.__exit__(None, None, None)
 
+    def is_alive(self):
+        return self.process.poll() is None
+
+    @staticmethod
+    def readOutput(stdout, lines : queue.Queue):
+        try:
+            for line in stdout:
+                lines.put(line)
+        except (OSError, ValueError):
+            pass
+        # end of output
+        lines.put(None)
+
     def commands(self, lines):
         for line in lines:
             self.command(line)
 
     def command(self, line):
-        try:
-            self.write_line(line)
-            return self.read_until_end()
-        except SolverException:
-            self.read_until_end()
-            raise
+        with tracing.span(line.split(" ")[0], "solver", self.process.pid):
+            try:
+                self.write_line(line)
+                return self.read_until_end()
+            except SolverException:
+                self.read_until_end()
+                raise
 
     def printCommands(self, lines):
         for line in lines:
@@ -57,8 +142,16 @@ class Solver(object):
         if printConsole:
             for line in lines:
                 print(line)
-        self.process.stdin.write("\n".join(lines))
-        self.process.stdin.write("\n")
+        verb = lines[-1].split(" ")[0] if lines else ""
+        timeout = self.deadlines.get(verb, defaultDeadline) if self.deadlines is not None else None
+        if self.transcript is not None:
+            self.transcript.wrote(lines)
+        self.deadline = time.monotonic() + timeout if timeout else None
+        try:
+            self.process.stdin.write("\n".join(lines))
+            self.process.stdin.write("\n")
+        except (OSError, ValueError) as e:
+            raise SolverDied("Solver process is not accepting input: " + str(e))
 
     def wait_line(self, target):
         self.read_until(target)
@@ -67,6 +160,18 @@ class Solver(object):
         return self.read_until("END")
 
     def read_until(self, target):
+        if self.transcript is None:
+            return self.read_lines_until(target)
+        started = time.perf_counter()
+        try:
+            lines = self.read_lines_until(target)
+        except (SolverException, SolverFailure) as e:
+            self.transcript.read(target, [], time.perf_counter() - started, e)
+            raise
+        self.transcript.read(target, lines, time.perf_counter() - started)
+        return lines
+
+    def read_lines_until(self, target):
         lines = []
         while True:
             line = self.read_line()
@@ -80,9 +185,17 @@ class Solver(object):
                 lines.append(line.strip())
 
     def read_line(self):
-        line = self.process.stdout.readline()
+        timeout = None
+        if self.deadline is not None:
+            timeout = max(self.deadline - time.monotonic(), 0)
+        try:
+            line = self.lines.get(timeout=timeout)
+        except queue.Empty:
+            raise SolverTimeout("Solver did not answer within its deadline.")
         if not line:
-            raise Exception("Unexpected end of output.")
+            # keep the end marker so later reads fail the same way
+            self.lines.put(None)
+            raise SolverDied("Unexpected end of output.")
         return line
 
 
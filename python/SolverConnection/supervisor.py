@@ -0,0 +1,383 @@
+from __future__ import annotations
+from SolverConnection.solver import Solver, SolverFailure, SolverException
+from SolverConnection import transcript
+import threading
+import unittest
+
+printConsole = False
+
+# commands whose effect has to be redone on a fresh process to get back to the same session
+# (everything else only reads the tree). load_tree starts a new session, free_tree ends it.
+stateVerbs = ["load_tree", "load_all_nodes", "rebuild_forgotten_streets", "set_accuracy",
+              "set_isomorphism", "set_range", "set_board", "set_pot", "set_eff_stack", "clear_lines", "add_line",
+              "remove_line", "build_tree", "set_strategy", "lock_node", "unlock_node", "set_info_freq",
+              "set_recalc_accuracy", "set_always_recalc", "go"]
+
+# commands that set up the process rather than the session: kept across load_tree and replayed first on a new process
+settingVerbs = ["set_threads"]
+
+
+# drop-in replacement for Solver that restarts the solver when it hangs or dies.
+# the commands that built up the current session (loaded tree, accuracy, locks...) are replayed
+# on the new process, and the command that failed is sent again.
+# a second process is kept spawned in the background so failing over doesn't wait for a cold start.
+# when recording (PIOSPEED_RECORD), every process it runs goes into one transcript, in the order they were used,
+# so a run with failovers replays on a ReplaySolver (see ReplaySolver.respawn).
+class SolverSupervisor():
+
+    def __init__(self, path : str, warm_standby : bool = True, max_retries : int = 1, spawn = Solver) -> None:
+        self.solverPath = path
+        self.warm_standby = warm_standby
+        self.max_retries = max_retries
+        self.spawn = spawn
+        self.transcript = None
+        if transcript.recordFolder:
+            self.transcript = transcript.Transcript(transcript.newTranscriptPath(transcript.recordFolder), path)
+
+        self.solver = self.use(self.spawnProcess())
+        self.accuracy = self.solver.accuracy
+        # commands since the last load_tree that changed the solver's state
+        self.session : list[str] = []
+        # the last command of each of settingVerbs
+        self.settings : dict[str, str] = {}
+        # commands written whose output has not been read to END yet, oldest first (several when pipelined)
+        self.pending : list[str] = []
+        self.restarts = 0
+        self.closed = False
+
+        self.standby = None
+        self.standby_lock = threading.Lock()
+        self.standby_thread = None
+        self.prepareStandby()
+
+    #---------------------------------------standby process---------------------------------------#
+
+    def prepareStandby(self) -> None:
+        if not self.warm_standby or self.closed:
+            return
+        self.standby_thread = threading.Thread(target=self.spawnStandby, daemon=True)
+        self.standby_thread.start()
+
+    # a new process; when recording, it's only added to the transcript once it's used (a standby may never be)
+    def spawnProcess(self):
+        if self.transcript is not None:
+            return self.spawn(self.solverPath, record = False)
+        return self.spawn(self.solverPath)
+
+    def use(self, solver):
+        if self.transcript is not None:
+            solver.attach(self.transcript)
+        return solver
+
+    def spawnStandby(self) -> None:
+        try:
+            solver = self.spawnProcess()
+        except Exception as e:
+            if printConsole:
+                print("Could not start standby solver: " + str(e))
+            return
+        with self.standby_lock:
+            if self.closed or self.standby is not None:
+                solver.exit()
+            else:
+                self.standby = solver
+
+    # returns the standby process if it is ready, otherwise starts a new one
+    def takeStandby(self) -> Solver:
+        with self.standby_lock:
+            solver, self.standby = self.standby, None
+        if solver is not None and solver.is_alive():
+            return solver
+        if solver is not None:
+            solver.exit()
+        return self.spawnProcess()
+
+    #---------------------------------------failover---------------------------------------#
+
+    # replaces the current process and brings the new one back to the current session.
+    # after exit() (SolverCommmand.tryPio closes the connection when a command fails) it reopens the connection
+    # with a new session instead, as restarting a plain Solver does
+    def restart(self) -> None:
+        try:
+            self.solver.exit()
+        except Exception:
+            pass
+        if self.closed:
+            self.closed = False
+            self.session = []
+            self.pending = []
+            if self.transcript is not None:
+                self.transcript.resume()
+        self.solver = self.use(self.takeStandby())
+        self.restarts = self.restarts + 1
+        self.prepareStandby()
+        for line in list(self.settings.values()) + self.session:
+            self.solver.command(line)
+
+    def failover(self, error : Exception) -> None:
+        if printConsole:
+            print("Solver failed (" + str(error) + "), restarting and replaying " + str(len(self.session)) + " commands")
+        self.restart()
+
+    # records a command that completed, if it is part of the session state
+    def commit(self, line : str) -> None:
+        verb = line.split(" ")[0]
+        if verb == "load_tree":
+            self.session = [line]
+        elif verb == "free_tree":
+            self.session = []
+        elif verb in settingVerbs:
+            self.settings[verb] = line
+        elif verb == "go":
+            # go returns before the solve ends: a replay waits for it, so later reads see the solved tree
+            self.session.extend([line, "wait_for_solver"])
+        elif verb in stateVerbs:
+            self.session.append(line)
+
+    # runs op on the current process, failing over and retrying if the process hangs or dies
+    # resend: write the pending commands again after a failover, as one batch (for writes and reads that follow writes)
+    def run(self, op, resend : bool = False):
+        if self.closed:
+            raise SolverFailure("Solver connection is closed.")
+        attempt = 0
+        while True:
+            try:
+                return op(self.solver)
+            except SolverFailure as e:
+                if attempt >= self.max_retries:
+                    raise
+                attempt = attempt + 1
+                self.failover(e)
+                if resend and self.pending:
+                    self.solver.write_lines(self.pending)
+
+    #---------------------------------------Solver interface---------------------------------------#
+
+    def command(self, line):
+        self.pending = []
+        output = self.run(lambda s: s.command(line))
+        self.commit(line)
+        return output
+
+    def commands(self, lines):
+        for line in lines:
+            self.command(line)
+
+    def write_line(self, line):
+        self.write_lines([line])
+
+    # written as one batch, as Solver does, so a transcript records the same writes with or without a supervisor
+    def write_lines(self, lines):
+        self.run(lambda s: s.write_lines(lines), resend=True)
+        self.pending.extend(lines)
+
+    def wait_line(self, target):
+        output = self.run(lambda s: s.wait_line(target), resend=True)
+        return output
+
+    def read_until_end(self):
+        output = self.run(lambda s: s.read_until_end(), resend=True)
+        if self.pending:
+            self.commit(self.pending.pop(0))
+        return output
+
+    def read_until(self, target):
+        return self.run(lambda s: s.read_until(target), resend=True)
+
+    def is_alive(self):
+        return not self.closed and self.solver.is_alive()
+
+    def exit(self):
+        self.closed = True
+        with self.standby_lock:
+            standby, self.standby = self.standby, None
+        if standby is not None:
+            standby.exit()
+        self.solver.exit()
+        if self.transcript is not None:
+            self.transcript.close()
+
+
+# stands in for a solver process in the tests: answers every command with "<verb> ok!" and END (subclasses answer more)
+# and can be told to hang on a given verb. records to a transcript it's attached to, as Solver does
+class FakeSolver():
+    spawned = 0
+
+    def __init__(self, path : str, record : bool = True) -> None:
+        FakeSolver.spawned = FakeSolver.spawned + 1
+        self.solverPath = path
+        self.accuracy = 0.2
+        self.received = []
+        self.hang_on = None
+        self.alive = True
+        self.output = []
+        self.transcript = None
+
+    def attach(self, recording):
+        self.transcript = recording
+        recording.spawned()
+        recording.wrote(["set_end_string END"])
+        recording.read("END", [], 0)
+
+    def command(self, line):
+        self.write_line(line)
+        try:
+            return self.read_until_end()
+        except SolverException:
+            self.read_until_end()
+            raise
+
+    def write_line(self, line):
+        self.write_lines([line])
+
+    def write_lines(self, lines):
+        from SolverConnection.solver import SolverDied
+        if not self.alive:
+            raise SolverDied("Solver process is not accepting input.")
+        if self.transcript is not None:
+            self.transcript.wrote(lines)
+        self.received.extend(lines)
+        for line in lines:
+            self.output.extend(self.answer(line) + ["END"])
+
+    # the output of a command, without END
+    def answer(self, line):
+        return [line.split(" ")[0] + " ok!"]
+
+    def wait_line(self, target):
+        self.read_until(target)
+
+    def read_until_end(self):
+        return self.read_until("END")
+
+    def read_until(self, target):
+        from SolverConnection.solver import SolverTimeout
+        if self.hang_on is not None and self.received and self.received[-1].startswith(self.hang_on):
+            if self.transcript is not None:
+                self.transcript.read(target, [], 0, SolverTimeout("hung"))
+            raise SolverTimeout("hung")
+        lines = []
+        while self.output:
+            line = self.output.pop(0)
+            if line.startswith("ERROR"):
+                if self.transcript is not None:
+                    self.transcript.read(target, [], 0, SolverException(line))
+                raise SolverException(line)
+            if line == target:
+                break
+            lines.append(line)
+        if self.transcript is not None:
+            self.transcript.read(target, lines, 0)
+        return lines
+
+    def is_alive(self):
+        return self.alive
+
+    def restart(self):
+        self.alive = True
+        self.output = []
+
+    def exit(self):
+        self.alive = False
+        self.transcript = None
+
+
+class Tests(unittest.TestCase):
+
+    def testReplaysSessionOnHang(self):
+        supervisor = SolverSupervisor("pio.exe", warm_standby=False, spawn=FakeSolver)
+        first = supervisor.solver
+        supervisor.command("load_tree \"a.cfr\"")
+        supervisor.command("set_accuracy 0.5")
+        supervisor.command("show_node r:0")
+        first.hang_on = "go"
+
+        supervisor.write_line("go")
+        supervisor.wait_line("go ok!")
+        supervisor.read_until_end()
+
+        second = supervisor.solver
+        self.assertIsNot(first, second)
+        self.assertFalse(first.is_alive())
+        self.assertEqual(second.received, ["load_tree \"a.cfr\"", "set_accuracy 0.5", "go"])
+        self.assertEqual(supervisor.restarts, 1)
+
+    def testKeepsSettingsAcrossTrees(self):
+        supervisor = SolverSupervisor("pio.exe", warm_standby=False, spawn=FakeSolver)
+        supervisor.command("set_threads 4")
+        supervisor.command("load_tree \"a.cfr\"")
+        supervisor.solver.hang_on = "show_node"
+        supervisor.command("show_node r:0")
+        self.assertEqual(supervisor.solver.received, ["set_threads 4", "load_tree \"a.cfr\"", "show_node r:0"])
+
+    def testReplaysSolveAfterGo(self):
+        supervisor = SolverSupervisor("pio.exe", warm_standby=False, spawn=FakeSolver)
+        supervisor.command("load_tree \"a.cfr\"")
+        supervisor.command("go")
+        supervisor.write_line("wait_for_solver")
+        supervisor.wait_line("wait_for_solver ok!")
+        supervisor.read_until_end()
+        supervisor.solver.alive = False
+        supervisor.solver.hang_on = "calc_results"
+        supervisor.command("calc_results")
+        self.assertEqual(supervisor.restarts, 1)
+        self.assertEqual(supervisor.solver.received, ["load_tree \"a.cfr\"", "go", "wait_for_solver", "calc_results"])
+
+    def testResendsPipelineOnHang(self):
+        supervisor = SolverSupervisor("pio.exe", warm_standby=False, spawn=FakeSolver)
+        first = supervisor.solver
+        supervisor.command("load_tree \"a.cfr\"")
+        supervisor.write_lines(["show_node r:0", "calc_line_freq r:0:c", "show_children r:0"])
+        self.assertEqual(first.received[-3:], ["show_node r:0", "calc_line_freq r:0:c", "show_children r:0"])
+        self.assertEqual(supervisor.read_until_end(), ["show_node ok!"])
+        first.hang_on = "show_children"
+
+        # the two commands not yet read are sent again, in one write, and their outputs stay in order
+        self.assertEqual(supervisor.read_until_end(), ["calc_line_freq ok!"])
+        self.assertEqual(supervisor.read_until_end(), ["show_children ok!"])
+        self.assertEqual(supervisor.solver.received, ["load_tree \"a.cfr\"", "calc_line_freq r:0:c", "show_children r:0"])
+        self.assertEqual(supervisor.pending, [])
+
+    def testUsesWarmStandby(self):
+        supervisor = SolverSupervisor("pio.exe", warm_standby=True, spawn=FakeSolver)
+        supervisor.standby_thread.join()
+        standby = supervisor.standby
+        supervisor.solver.hang_on = "show_node"
+        supervisor.command("show_node r:0")
+        self.assertIs(supervisor.solver, standby)
+        supervisor.standby_thread.join()
+        self.assertIsNotNone(supervisor.standby)
+        supervisor.exit()
+        self.assertFalse(standby.is_alive())
+
+    def testGivesUpAfterRetries(self):
+        supervisor = SolverSupervisor("pio.exe", warm_standby=False, max_retries=1, spawn=FakeSolver)
+        original = supervisor.spawn
+        def spawnHanging(path):
+            solver = original(path)
+            solver.hang_on = "go"
+            return solver
+        supervisor.spawn = spawnHanging
+        supervisor.solver.hang_on = "go"
+        with self.assertRaises(SolverFailure):
+            supervisor.command("go")
+
+    def testResetAfterFailedCommand(self):
+        from solverCommands import SolverCommmand
+        supervisor = SolverSupervisor("pio.exe", warm_standby=False, max_retries=0, spawn=FakeSolver)
+        pio = SolverCommmand(supervisor)
+        pio.tryPio(supervisor.command, ["load_tree \"a.cfr\""])
+        supervisor.solver.hang_on = "show_node"
+        with self.assertRaises(SolverFailure):
+            pio.tryPio(supervisor.command, ["show_node r:0"])
+        self.assertFalse(supervisor.is_alive())
+
+        connection = pio.resetConnection()
+        self.assertIs(connection, supervisor)
+        self.assertTrue(supervisor.is_alive())
+        self.assertEqual(pio.tryPio(supervisor.command, ["show_node r:0"]), ["show_node ok!"])
+        self.assertEqual(supervisor.solver.received, ["show_node r:0"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,277 @@
+from __future__ import annotations
+from SolverConnection import solver
+from datetime import datetime
+import unittest
+import tempfile
+import gzip
+import json
+import time
+import os
+
+# a transcript is everything written to and read from one solver process, with how long each read took,
+# so a run on the solver machine can be replayed anywhere without PioSOLVER (for regression and performance tests).
+# the file is gzipped JSON lines: a header, then one event per line:
+#   {"w": [lines written]}
+#   {"r": target, "lines": [lines read], "s": seconds waited, "error": [exception class, message]}
+#   {"spawn": true} when the process was (re)started
+#
+# PIOSPEED_RECORD=<folder> records every solver process started (the cli also has --record).
+recordFolder = os.environ.get("PIOSPEED_RECORD")
+
+class TranscriptMismatch(Exception):
+    pass
+
+
+def newTranscriptPath(folder : str) -> str:
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, "transcript_" + datetime.now().strftime("%Y%m%d_%H%M%S_%f") + ".jsonl.gz")
+
+
+# the lines of a transcript; one whose run crashed or is still going has no gzip trailer, but everything flushed is kept
+def readLines(path : str) -> list[str]:
+    lines = []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                lines.append(line)
+        except EOFError:
+            pass
+    # the last line of an unfinished transcript can be cut short
+    if lines and not lines[-1].endswith("\n"):
+        lines.pop()
+    return lines
+
+
+class Transcript():
+
+    def __init__(self, path : str, solverPath : str) -> None:
+        self.path = path
+        self.file = gzip.open(path, "wt", encoding="utf-8")
+        self.write({"transcript": 1, "solver": solverPath, "started": datetime.now().isoformat(timespec="seconds")})
+
+    def write(self, event : dict) -> None:
+        self.file.write(json.dumps(event, separators=(",", ":")) + "\n")
+
+    def spawned(self) -> None:
+        self.write({"spawn": True})
+
+    def wrote(self, lines : list[str]) -> None:
+        self.write({"w": list(lines)})
+
+    # flushed after every read, so a transcript of a run that crashed still has everything up to the crash
+    def read(self, target : str, lines : list[str], seconds : float, error : Exception = None) -> None:
+        event = {"r": target, "lines": lines, "s": round(seconds, 4)}
+        if error is not None:
+            event["error"] = [type(error).__name__, str(error)]
+        self.write(event)
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+    # carries on a closed transcript (gzip reads the appended part as the rest of the same file)
+    def resume(self) -> None:
+        if self.file.closed:
+            self.file = gzip.open(self.path, "at", encoding="utf-8")
+
+
+# plays a transcript back in place of a Solver: every write has to match the recorded one, and reads return
+# what was recorded (errors included).
+# speed : None answers at once; 1 waits as long as the solver did, 10 ten times less...
+class ReplaySolver():
+
+    def __init__(self, path : str, speed : float = None, strict : bool = True) -> None:
+        self.path = path
+        self.speed = speed
+        self.strict = strict
+        lines = readLines(path)
+        self.header = json.loads(lines[0])
+        self.events = [json.loads(line) for line in lines[1:]]
+        self.position = 0
+        # recorded lines not matched by a write yet: writes are compared line by line, however they were batched
+        self.unmatched : list[str] = []
+        self.solverPath = self.header.get("solver")
+        self.accuracy = 0.2
+        self.alive = True
+        # seconds the recorded solver spent answering, and that the replay waited
+        self.recorded_seconds = 0
+        self.waited_seconds = 0
+        self.respawned = False
+        self.spawn()
+
+    def next(self, kind : str) -> dict:
+        while self.position < len(self.events) and "spawn" in self.events[self.position]:
+            self.position += 1
+        if self.position >= len(self.events):
+            raise TranscriptMismatch("The transcript ended, but the program went on to " + kind)
+        event = self.events[self.position]
+        if kind not in event:
+            raise TranscriptMismatch("Expected " + kind + " at event " + str(self.position) + " but the transcript has " + json.dumps(event)[:200])
+        self.position += 1
+        return event
+
+    def spawn(self):
+        self.write_line("set_end_string END")
+        self.wait_line("END")
+
+    def restart(self):
+        self.spawn()
+        self.alive = True
+
+    # the spawn of a SolverSupervisor replaying a recorded supervisor: the recorded processes are all in this transcript,
+    # so each (re)spawn carries on from where the last process stopped. the first process is the one __init__ started
+    def respawn(self, path : str = None):
+        if self.respawned:
+            self.restart()
+        self.respawned = True
+        return self
+
+    def exit(self):
+        self.alive = False
+
+    def is_alive(self):
+        return self.alive
+
+    # True once every recorded event has been replayed
+    def finished(self) -> bool:
+        return all("spawn" in e for e in self.events[self.position:])
+
+    def command(self, line):
+        try:
+            self.write_line(line)
+            return self.read_until_end()
+        except solver.SolverException:
+            self.read_until_end()
+            raise
+
+    def commands(self, lines):
+        for line in lines:
+            self.command(line)
+
+    def write_line(self, line):
+        self.write_lines([line])
+
+    def write_lines(self, lines):
+        for line in lines:
+            if not self.unmatched:
+                self.unmatched = list(self.next("w")["w"])
+            recorded = self.unmatched.pop(0)
+            if self.strict and recorded != line:
+                raise TranscriptMismatch("Wrote " + line[:200] + " but the transcript has " + recorded[:200])
+
+    def wait_line(self, target):
+        self.read_until(target)
+
+    def read_until_end(self):
+        return self.read_until("END")
+
+    def read_until(self, target):
+        if self.unmatched and self.strict:
+            raise TranscriptMismatch("Read before writing " + str(self.unmatched)[:200] + " as the transcript has")
+        self.unmatched = []
+        event = self.next("r")
+        self.recorded_seconds += event["s"]
+        if self.speed:
+            wait = event["s"] / self.speed
+            time.sleep(wait)
+            self.waited_seconds += wait
+        if "error" in event:
+            kind, message = event["error"]
+            raise getattr(solver, kind, solver.SolverException)(message)
+        return list(event["lines"])
+
+
+class Tests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "test_transcript.jsonl.gz")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def record(self, exchanges : list) -> None:
+        transcript = Transcript(self.path, "PioSOLVER3-pro.exe")
+        transcript.spawned()
+        transcript.wrote(["set_end_string END"])
+        transcript.read("END", [], 0.01)
+        for line, answer, seconds in exchanges:
+            transcript.wrote([line])
+            if isinstance(answer, Exception):
+                transcript.read("END", [], seconds, answer)
+                transcript.read("END", [], 0)
+            else:
+                transcript.read("END", answer, seconds)
+        transcript.close()
+
+    def testReplaysThroughSolverCommands(self):
+        from solverCommands import SolverCommmand
+        self.record([("calc_results", ["EV OOP: 1.5", "EV IP: 2", "OOP's MES: 3", "IP's MES: 4"], 0.2),
+                     ("show_node r:0:x", solver.SolverException("ERROR: no such node"), 0.01)])
+        replay = ReplaySolver(self.path, speed=10)
+        self.assertEqual(SolverCommmand(replay).getEV(), [" 1.5", " 2", " 3", " 4"])
+        self.assertRaises(solver.SolverException, replay.command, "show_node r:0:x")
+        self.assertTrue(replay.finished())
+        self.assertAlmostEqual(replay.recorded_seconds, 0.22)
+        self.assertAlmostEqual(replay.waited_seconds, 0.022)
+
+    def testBatchesAreComparedByLine(self):
+        transcript = Transcript(self.path, "PioSOLVER3-pro.exe")
+        transcript.spawned()
+        transcript.wrote(["set_end_string END"])
+        transcript.read("END", [], 0)
+        transcript.wrote(["show_node r:0", "show_node r:0:c"])
+        transcript.read("END", ["r:0"], 0)
+        transcript.read("END", ["r:0:c"], 0)
+        transcript.wrote(["show_node r:0:b10"])
+        transcript.wrote(["show_node r:0:f"])
+        transcript.read("END", ["r:0:b10"], 0)
+        transcript.read("END", ["r:0:f"], 0)
+        transcript.close()
+        replay = ReplaySolver(self.path)
+        replay.write_line("show_node r:0")
+        replay.write_line("show_node r:0:c")
+        self.assertEqual([replay.read_until_end(), replay.read_until_end()], [["r:0"], ["r:0:c"]])
+        replay.write_lines(["show_node r:0:b10", "show_node r:0:f"])
+        self.assertEqual([replay.read_until_end(), replay.read_until_end()], [["r:0:b10"], ["r:0:f"]])
+        self.assertTrue(replay.finished())
+
+    def testSupervisorFailoverReplays(self):
+        from SolverConnection import transcript
+        from SolverConnection.supervisor import SolverSupervisor, FakeSolver
+        # the first process hangs on go; the supervisor fails over to a second one and replays the session
+        def run(supervisor):
+            supervisor.command("load_tree \"a.cfr\"")
+            supervisor.write_line("go")
+            supervisor.wait_line("go ok!")
+            supervisor.read_until_end()
+            supervisor.exit()
+        def hangFirst(path, record = True):
+            solver = FakeSolver(path)
+            solver.hang_on = "go" if FakeSolver.spawned == first + 1 else None
+            return solver
+        first = FakeSolver.spawned
+        transcript.recordFolder = self.folder.name
+        try:
+            supervisor = SolverSupervisor("pio.exe", warm_standby=False, spawn=hangFirst)
+            run(supervisor)
+        finally:
+            transcript.recordFolder = None
+        self.assertEqual(supervisor.restarts, 1)
+        recorded = [f for f in os.listdir(self.folder.name) if f.startswith("transcript_")]
+        self.assertEqual(len(recorded), 1)
+
+        replay = ReplaySolver(os.path.join(self.folder.name, recorded[0]))
+        supervisor = SolverSupervisor("pio.exe", warm_standby=False, spawn=replay.respawn)
+        run(supervisor)
+        self.assertEqual(supervisor.restarts, 1)
+        self.assertTrue(replay.finished())
+
+    def testMismatch(self):
+        self.record([("calc_results", [], 0)])
+        replay = ReplaySolver(self.path)
+        self.assertRaises(TranscriptMismatch, replay.command, "show_tree_info")
+
+
+if __name__ == '__main__':
+    unittest.main()
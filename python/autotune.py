@@ -0,0 +1,223 @@
+from __future__ import annotations
+from SolverConnection.solver import Solver
+from SolverConnection.pool import SolverPool
+from solverCommands import SolverCommmand
+from datetime import datetime
+import statistics
+import threading
+import unittest
+import tempfile
+import json
+import time
+import os
+
+# psutil is optional; without it memory is read from /proc (Linux), elsewhere it isn't measured
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# whether one solver with every core or several solvers with a share each get through a batch faster depends on the trees
+# and the machine, so autotune times a sample of a folder's files with 1, 2, 4... solver processes splitting the cores
+# between them, and keeps the fastest configuration for the sample's tree class. batch runs on files of a tuned class then
+# use it: its threads per solver, and with more than one process the files are shared out by local workers (distributed.py).
+# PIOSPEED_AUTOTUNE moves where the configurations are kept.
+tunedPath = os.environ.get("PIOSPEED_AUTOTUNE", os.path.join(os.path.expanduser("~"), ".piospeed", "autotune.json"))
+
+# the most solver processes tried
+maxProcesses = 4
+# the sample is solved to this multiple of the accuracy setting, so calibrating is short but still mostly solving
+calibrationStep = 4
+# seconds between memory samples
+memoryInterval = 0.5
+
+# tree classes by file size in MB: trees of one class are expected to run best with the same configuration
+sizeClasses = [64, 256, 1024, 4096]
+
+
+def treeClass(size : int) -> str:
+    megabytes = size / (1024 * 1024)
+    for bound in sizeClasses:
+        if megabytes < bound:
+            return "under " + str(bound) + " MB"
+    return str(sizeClasses[-1]) + " MB and over"
+
+
+# the class of a batch is the class of its median file; None if none of the files exist
+def batchClass(paths : list[str]) -> str:
+    sizes = [os.path.getsize(p) for p in paths if os.path.isfile(p)]
+    return treeClass(statistics.median_low(sizes)) if sizes else None
+
+
+# the [processes, threads per process] tried on a machine with this many cores: 1, 2, 4... processes sharing the cores
+def configurations(cores : int, most : int = maxProcesses) -> list[list[int]]:
+    tried = []
+    processes = 1
+    while processes <= min(cores, most):
+        tried.append([processes, cores // processes])
+        processes *= 2
+    return tried
+
+
+# count of the files, spread over their sizes (smallest to largest), repeated if there are fewer files than that.
+# every configuration solves the same sample, so the same work is timed each time
+def sampleFiles(files : list[str], sizes : list[int], count : int) -> list[str]:
+    ordered = [f for s, f in sorted(zip(sizes, files))]
+    if len(ordered) >= count:
+        return [ordered[int((i + 0.5) * len(ordered) / count)] for i in range(count)]
+    return [ordered[i % len(ordered)] for i in range(count)]
+
+
+# bytes the process is using, or None if it can't be measured here
+def processMemory(pid : int) -> int:
+    if pid is None:
+        return None
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss
+        except psutil.Error:
+            return None
+    try:
+        with open("/proc/" + str(pid) + "/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+# the highest total memory of a set of processes, sampled on a thread of its own until stop()
+class MemorySampler():
+
+    def __init__(self, pids : list[int], interval : float = memoryInterval) -> None:
+        self.pids = [p for p in pids if p is not None]
+        self.interval = interval
+        self.peak : int = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+
+    def sample(self) -> None:
+        while True:
+            used = [processMemory(p) for p in self.pids]
+            used = [u for u in used if u is not None]
+            if used:
+                self.peak = max(self.peak or 0, sum(used))
+            if self.stopped.wait(self.interval):
+                return
+
+    # returns the peak in bytes, or None if nothing could be measured
+    def stop(self) -> int:
+        self.stopped.set()
+        self.thread.join()
+        return self.peak
+
+
+# runs on a pool process
+def solveFile(solver, path : str) -> None:
+    pio = SolverCommmand(solver)
+    if not pio.load_tree(path):
+        raise Exception("Could not load " + path)
+    pio.solve()
+    pio.free_mem()
+
+
+# times solving paths with processes solvers of threads threads each
+# returns {"processes", "threads", "files", "seconds", "files_per_hour", "peak_memory_mb", "errors"}
+def measure(solverPath : str, paths : list[str], processes : int, threads : int, accuracy : float = None, spawn = Solver) -> dict:
+    pool = SolverPool(solverPath, processes, accuracy, spawn)
+    try:
+        pool.start()
+        for solver in pool.solvers:
+            solver.command("set_threads " + str(threads))
+        sampler = MemorySampler([getattr(getattr(solver, "process", None), "pid", None) for solver in pool.solvers])
+        started = time.perf_counter()
+        results = pool.map(solveFile, paths)
+        seconds = time.perf_counter() - started
+        peak = sampler.stop()
+    finally:
+        pool.exit()
+    errors = [str(r) for r in results if isinstance(r, Exception)]
+    solved = len(paths) - len(errors)
+    return {"processes": processes, "threads": threads, "files": len(paths), "seconds": round(seconds, 3),
+            "files_per_hour": round(solved * 3600 / seconds, 1) if seconds > 0 else 0,
+            "peak_memory_mb": round(peak / (1024 * 1024)) if peak is not None else None, "errors": errors}
+
+
+# the fastest measurement where every file was solved, or None
+def fastest(measurements : list[dict]) -> dict:
+    complete = [m for m in measurements if not m["errors"]]
+    return max(complete, key=lambda m: m["files_per_hour"]) if complete else None
+
+
+# the tuned configurations, by tree class
+class Tuning():
+
+    def __init__(self, path : str = tunedPath) -> None:
+        self.path = path
+
+    def load(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self, tree_class : str, best : dict, measurements : list[dict], cores : int) -> None:
+        tuned = self.load()
+        tuned[tree_class] = {"processes": best["processes"], "threads": best["threads"], "files_per_hour": best["files_per_hour"],
+                             "peak_memory_mb": best["peak_memory_mb"], "cores": cores, "measurements": measurements,
+                             "tuned": datetime.now().isoformat(timespec="seconds")}
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temporary = self.path + ".tmp"
+            with open(temporary, "w") as f:
+                json.dump(tuned, f, indent=1)
+            os.replace(temporary, self.path)
+        except OSError:
+            pass
+
+    # the configuration tuned for a batch's class, or None if there isn't one (or it was tuned with a different number of cores)
+    def lookup(self, paths : list[str], cores : int = None) -> dict:
+        tree_class = batchClass(paths)
+        tuned = self.load().get(tree_class) if tree_class else None
+        if tuned is None or tuned.get("cores") != (cores or os.cpu_count()):
+            return None
+        return dict(tuned, tree_class=tree_class)
+
+
+class Tests(unittest.TestCase):
+
+    def testConfigurations(self):
+        self.assertEqual(configurations(8), [[1, 8], [2, 4], [4, 2]])
+        self.assertEqual(configurations(2), [[1, 2], [2, 1]])
+        self.assertEqual(treeClass(100 * 1024 * 1024), "under 256 MB")
+        self.assertEqual(sampleFiles(["a", "b", "c", "d", "e", "f", "g", "h"], [8, 7, 6, 5, 4, 3, 2, 1], 4), ["g", "e", "c", "a"])
+        self.assertEqual(sampleFiles(["a", "b"], [1, 2], 4), ["a", "b", "a", "b"])
+
+    def testMeasureAndTune(self):
+        from SolverConnection.supervisor import FakeSolver
+        # solves take 0.05s whatever the threads, so more processes always win
+        class TimedSolver(FakeSolver):
+            def write_line(self, line):
+                super().write_line(line)
+                if line.startswith("show_tree_info"):
+                    self.output = ["#Pot#55", "END"]
+                if line.startswith("wait_for_solver"):
+                    time.sleep(0.05)
+        measurements = [measure("pio.exe", ["a.cfr"] * 4, processes, threads, spawn=TimedSolver) for processes, threads in configurations(4)]
+        best = fastest(measurements)
+        self.assertEqual([best["processes"], best["threads"]], [4, 1])
+        self.assertGreater(best["files_per_hour"], measurements[0]["files_per_hour"] * 2)
+
+        with tempfile.TemporaryDirectory() as folder:
+            tuning = Tuning(os.path.join(folder, "autotune.json"))
+            tree_class = batchClass([os.path.abspath(__file__)])
+            tuning.save(tree_class, best, measurements, cores=4)
+            self.assertEqual(tuning.lookup([os.path.abspath(__file__)], cores=4)["processes"], 4)
+            self.assertIsNone(tuning.lookup([os.path.abspath(__file__)], cores=16))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import random
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import framing
+
+# compares the socket framings on typical payloads by sending messages through a Unix socket
+# and decoding them on the other end. run from the python folder:
+#   python benchmarks/framingBenchmark.py --messages 2000
+
+
+def makePayloads() -> dict[str, dict]:
+    rng = random.Random(0)
+    return {
+        "notification": {"type": "notification", "data": "Solving Ah7s10d.cfr to an accuracy of 0.2."},
+        "combo grid": {"type": "grid", "data": [round(rng.random(), 6) for _ in range(1326)]},
+        "result table": {"type": "result_rows", "data": [["file_" + str(i) + ".cfr", "r:0:c:b16", 12.5, 7.25, 0.431, 0.569, 33.1, 66.9] for i in range(500)]},
+    }
+
+
+async def measure(chosen : framing.Framing, message : dict, count : int) -> list[float]:
+    socketPath = "/tmp/piospeed_framing_" + str(os.getpid()) + ".sock"
+    received = asyncio.Event()
+
+    async def handle(reader, writer):
+        for _ in range(count):
+            await chosen.read(reader)
+        received.set()
+        writer.close()
+
+    server = await asyncio.start_unix_server(handle, socketPath)
+    try:
+        reader, writer = await asyncio.open_unix_connection(socketPath)
+        start = time.perf_counter()
+        size = 0
+        for _ in range(count):
+            data = chosen.encode(message)
+            size += len(data)
+            writer.write(data)
+            await writer.drain()
+        await received.wait()
+        seconds = time.perf_counter() - start
+        writer.close()
+    finally:
+        server.close()
+        await server.wait_closed()
+        if os.path.exists(socketPath):
+            os.unlink(socketPath)
+    return [seconds, size]
+
+
+async def run(count : int) -> None:
+    for payloadName, message in makePayloads().items():
+        print(payloadName)
+        for name, chosen in framing.framings.items():
+            seconds, size = await measure(chosen, message, count)
+            print("  {:<16} {:>10.0f} msg/s {:>9.1f} MB/s {:>9} bytes/msg".format(
+                name, count / seconds, size / seconds / 1e6, size // count))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare throughput of the socket framings.")
+    parser.add_argument("--messages", type=int, default=2000)
+    options = parser.parse_args()
+    if "framed-msgpack" not in framing.framings:
+        print("msgpack is not installed; only the JSON framings are compared")
+    asyncio.run(run(options.messages))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+from __future__ import annotations
+import subprocess
+import statistics
+import argparse
+import socket
+import json
+import time
+import sys
+import os
+
+# measures how long the Python backend takes to become usable, the way Electron sees it:
+#   socket   : process spawned -> socket accepts connections
+#   hi       : -> 'python ready' / 'electron ready' / 'hi!' handshake done
+#   solver   : -> 'solver ready' after the solver path is sent
+# run from the python folder:  python benchmarks/startupBenchmark.py --runs 10
+
+pythonFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def readMessage(conn : socket.socket, buffer : bytearray) -> dict:
+    while b"\n" not in buffer:
+        chunk = conn.recv(65536)
+        if not chunk:
+            raise Exception("Backend closed the connection")
+        buffer.extend(chunk)
+    line, _, rest = bytes(buffer).partition(b"\n")
+    buffer[:] = rest
+    return json.loads(line)
+
+
+def waitFor(conn : socket.socket, buffer : bytearray, messageType : str) -> dict:
+    while True:
+        message = readMessage(conn, buffer)
+        if message.get("type") == messageType:
+            return message
+        if message.get("type") == "error":
+            raise Exception(message.get("data"))
+
+
+def sendMessage(conn : socket.socket, messageType : str, data) -> None:
+    conn.sendall((json.dumps({"type": messageType, "data": data}) + "\n").encode("utf-8"))
+
+
+def measureOnce(solverPath : str, timeout : float) -> dict[str, float]:
+    socketPath = "/tmp/piospeed_startup_" + str(os.getpid()) + ".sock"
+    env = dict(os.environ, PIOSPEED_SOCKET=socketPath)
+
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "start.py"], cwd=pythonFolder, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    timings = {}
+    try:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        deadline = start + timeout
+        while True:
+            try:
+                conn.connect(socketPath)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.perf_counter() > deadline:
+                    raise Exception("Backend did not open its socket within " + str(timeout) + "s")
+                time.sleep(0.001)
+        timings["socket"] = time.perf_counter() - start
+
+        conn.settimeout(timeout)
+        buffer = bytearray()
+        waitFor(conn, buffer, "python ready")
+        sendMessage(conn, "electron ready", None)
+        waitFor(conn, buffer, "hi!")
+        timings["hi"] = time.perf_counter() - start
+
+        sendMessage(conn, "solverPath", solverPath)
+        waitFor(conn, buffer, "solver ready")
+        timings["solver"] = time.perf_counter() - start
+        conn.close()
+    finally:
+        process.kill()
+        process.wait()
+        if os.path.exists(socketPath):
+            os.unlink(socketPath)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure time-to-socket and time-to-'solver ready' of the Python backend.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--solver", default="solver.exe", help="solver path sent to the backend")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    options = parser.parse_args()
+
+    runs = [measureOnce(options.solver, options.timeout) for _ in range(options.runs)]
+    report = {}
+    for stage in ["socket", "hi", "solver"]:
+        values = [r[stage] * 1000 for r in runs]
+        report[stage] = {"median_ms": round(statistics.median(values), 1), "max_ms": round(max(values), 1)}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
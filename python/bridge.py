@@ -1,27 +1,57 @@
-import json
 import traceback
+import time
 import os
 import asyncio
-from SolverConnection.testSolver import Solver
 from Message import Message
-from testProgram import Program
-from menu import PluginCommands
-from inputs import InputType, CFRFolder, WeightsFile, BoardFile
+from session import Session
+import framing
+
+# Modules that are only needed once a solver path or command arrives. They are imported in a
+# background thread after the socket is up, so Electron can connect without waiting for them.
+backendModules = ['menu', 'inputs', 'validationCache', 'SolverConnection.testSolver', 'testProgram']
+
+# Transport buffer watermarks for backpressure on the socket
+writeBufferHigh = 4 * 1024 * 1024
+writeBufferLow = 1024 * 1024
+
+def load_backend():
+    """Import the command stack (runs in a worker thread)"""
+    import importlib
+    for module in backendModules:
+        importlib.import_module(module)
 
 class MessageQueue:
     def __init__(self, socket_path: str = '/tmp/electron_python.sock'):
         self.socket_path = socket_path
+        # Startup timings (seconds since the bridge was created), reported in the 'solver ready' message
+        self.started_at = time.perf_counter()
+        self.timings = {}
         self.server = None
         self.current_client = None
         self.current_writer = None
         self.is_connected = False
         self.connection_event = asyncio.Event()
+        # Plain JSON lines until Electron asks for something else in the handshake
+        self.framing = framing.default
+        self.send_lock = asyncio.Lock()
         self.loop = asyncio.get_event_loop()
         self.program = None
+        self.solver_path = None
+        # Survives reconnects: buffered outgoing messages and the running job
+        self.session = Session()
+        self.job_task = None
+        # Background import of the command stack and the solver being spawned, both started as early as possible
+        self.backend_task = None
+        self.solver_task = None
         # For handling input responses
         self.last_input_response = None
         self.input_response_event = asyncio.Event()
-        self.command_map = {cmd.value.name: cmd for cmd in PluginCommands}
+        # Filled in once the backend is loaded
+        self.command_map = {}
+        # Parsed folders / weights / boards, keyed by path and modification time
+        self.validation_cache = None
+        # The results database (resultsDB.py), opened by the first query
+        self.results_db = None
         print("Python connected to socket " + socket_path)
 
     async def start(self):
@@ -40,53 +70,80 @@ class MessageQueue:
             # Set socket permissions to allow Electron to connect
             os.chmod(self.socket_path, 0o777)
             
+            self.mark('socket')
             print(f"Server started on {self.socket_path}")
             
-            # Wait for a connection
-            await self.connection_event.wait()
-            
-            # Send a ready message
-            await self.send(Message("python ready", None))
+            # Load the command stack while Electron connects and handshakes
+            self.backend_task = asyncio.create_task(asyncio.to_thread(load_backend))
             
         except Exception as e:
             print(f"Error starting server: {e}")
             traceback.print_exc()
 
     async def handle_connection(self, reader, writer):
-        """Handle a new connection"""
+        """Handle a new connection; a reconnecting Electron replaces the previous connection"""
+        if self.current_writer is not None and self.current_writer is not writer:
+            print("Replacing previous client connection")
+            self.current_writer.close()
+        # Every connection starts with the original framing until its own handshake
+        self.framing = framing.default
         self.current_client = reader
         self.current_writer = writer
+        # Large payloads (grids, result tables) pause senders once this much is buffered
+        writer.transport.set_write_buffer_limits(high=writeBufferHigh, low=writeBufferLow)
         self.is_connected = True
         self.connection_event.set()
         print("New client connected: " + str(id(writer)))
+        
+        # Send a ready message
+        await self.send(Message("python ready", None))
+    
+    async def connection_lost(self):
+        """Forget the closed connection and wait for Electron to come back; the Program and solver keep running"""
+        print("Client disconnected, waiting for it to reconnect")
+        writer = self.current_writer
+        self.current_client = None
+        self.current_writer = None
+        self.is_connected = False
+        self.connection_event.clear()
+        if writer is not None:
+            writer.close()
+        await self.connection_event.wait()
 
     async def send(self, message: Message):
-        if not self.current_writer:
-            print("No active connection to send message")
+        # Format message as expected by node-ipc
+        json_message = {
+            "type": message.type,
+            "data": message.data
+        }
+        # Numbered and buffered even while disconnected, so a reconnecting client can catch up
+        self.session.record(json_message)
+        await self.write(json_message)
+    
+    async def write(self, json_message: dict):
+        writer = self.current_writer
+        if not writer:
+            framing.logMessage("buffering (no client)", json_message)
             return
 
         try:
-            # Format message as expected by node-ipc
-            json_message = {
-                "type": message.type,
-                "data": message.data
-            }
-            
-            # Debug the message being sent
-            print("Python sending message: " + str(json_message))
-            
-            # Ensure proper message framing with a single newline
-            # This is critical for Node IPC to parse the message correctly
-            data = json.dumps(json_message) + "\n"
+            framing.logMessage("sending", json_message)
+            data = self.framing.encode(json_message)
             
-            # Send as UTF-8 encoded bytes
-            self.current_writer.write(data.encode('utf-8'))
-            await self.current_writer.drain()
+            # One writer at a time so frames from concurrent notifications never interleave.
+            # drain() only waits once the transport buffer passes its high-water mark, so a slow
+            # reader holds back the producers instead of letting the buffer grow without bound.
+            async with self.send_lock:
+                writer.write(data)
+                await writer.drain()
         except Exception as e:
             print("Error sending message: " + str(e))
-            self.current_client = None
-            self.current_writer = None
-            self.is_connected = False
+            # The listener notices the closed connection and waits for a reconnect
+            if writer is self.current_writer:
+                self.current_client = None
+                self.current_writer = None
+                self.is_connected = False
+                self.connection_event.clear()
     
     async def notify(self, msg, msg_type = "notification"):
         """Send a notification message to the Electron frontend"""
@@ -100,49 +157,69 @@ class MessageQueue:
         
         while True:
             try:
-                # Read a line from the socket
-                data = await self.current_client.readline()
-                
-                if not data:
-                    print("No data received, connection may be closed")
-                    await asyncio.sleep(0.5)
-                    continue
-                
-                # Parse the message
+                # Parse the next message with the negotiated framing
                 try:
-                    # The message might be sent with 'emit' from node-ipc which adds a prefix
-                    # Try to find and parse the JSON part of the message
-                    message_str = data.decode()
-                    print("Python recieved from Electron: " + message_str)
-                    message = Message(json.loads(message_str)['type'], json.loads(message_str)['data'])
+                    reader = self.current_client
+                    if reader is None:
+                        await self.connection_event.wait()
+                        continue
+                    try:
+                        data = await self.framing.read(reader)
+                    except ConnectionError:
+                        data = None
+                    except framing.FramingError as e:
+                        # Nothing after a bad frame can be trusted to start a message; Electron reconnects and resumes
+                        print(f"Closing connection: {e}")
+                        data = None
+                    
+                    if data is None:
+                        # Only the current connection closing matters; an old one closes when it is replaced
+                        if reader is self.current_client:
+                            await self.connection_lost()
+                        continue
+                    
+                    framing.logMessage("received", data)
+                    message = Message(data['type'], data['data'])
                 
                     # handshake protocol
+                    # Electron may offer framings in order of preference, e.g. {'framing': ['framed-msgpack', 'framed-json']}.
+                    # The reply still uses the old framing; both sides switch right after it.
+                    # A reconnecting client sends {'session': <id from its last 'hi!'>, 'last_seq': <last seq it received>}.
                     if message.type == 'electron ready':
-                        await self.send(Message('hi!', None))
-                        # No need to create ElectronInterface anymore
+                        hello = message.data if isinstance(message.data, dict) else {}
+                        offered = hello.get('framing')
+                        chosen = framing.negotiate(offered)
+                        reply = {'session': self.session.id, 'seq': self.session.seq}
+                        if offered:
+                            reply['framing'] = chosen.name
+                        await self.send(Message('hi!', reply))
+                        self.framing = chosen
+                        if hello.get('session') == self.session.id:
+                            await self.resume(hello.get('last_seq', 0))
+                        elif self.program or self.session.job:
+                            await self.send_session_state(replayed = 0, missed = False)
 
                     # get solver path
                     elif message.type == 'solverPath':
-                        try: 
-                            connection = Solver(message.data)
-                            await self.send(Message('solver ready', None))
-                            # Create Program with notify function
-                            self.program = Program(
-                                connection=connection,
-                                notify_func=self.notify_sync,
-                            )
-                            # Add send_message method to program
-                            self.program.send_message = self.send
-                        except Exception as e:
-                            await self.send(Message('error', f'Failed to connect to solver: {str(e)}'))
+                        await self.program_ready()
+                        if self.program and message.data == self.solver_path:
+                            # Reconnected client resending the same path; the solver is already running
+                            await self.send(Message('solver ready', {'timings': self.timings}))
+                        elif self.session.is_busy():
+                            await self.send(Message('error', 'Cannot change the solver while a command is running.'))
+                        else:
+                            # Spawn the solver in the background so the listener keeps answering while it starts
+                            self.solver_task = asyncio.create_task(self.connect_solver(message.data))
                             
                     elif message.type == 'resultsPath':
+                        await self.program_ready()
                         if self.program:
                             self.program.set_results_dir(message.data)
                         else:
                             await self.send(Message('error', 'Program not initialized. Please set solver path first.'))
                             
                     elif message.type == 'accuracy':
+                        await self.program_ready()
                         if self.program:
                             try:
                                 accuracy = float(message.data)
@@ -154,21 +231,40 @@ class MessageQueue:
                     
                     # Handle command execution
                     elif message.type == 'command':
+                        command_name = message.data.get('type')
+                        args = message.data.get('args', {})
+                        # 'deterministic' or 'sampling' to profile this run, see profiling.py
+                        profile = message.data.get('profile')
+                        
+                        print(f"Received command: {command_name} with args: {args}")
+                        
+                        # Run it as a job so the listener keeps noticing disconnects and reconnects meanwhile
+                        if self.session.is_busy():
+                            await self.send(Message('error', f'{self.session.job["command"]} is still running.'))
+                        else:
+                            self.session.start_job(command_name, args)
+                            self.job_task = asyncio.create_task(self.run_job(command_name, args, profile))
+                    
+                    # Stop the running command after the file it is working on, if it supports stopping
+                    elif message.type == 'stop':
+                        if self.session.is_busy() and hasattr(self.program, 'stop'):
+                            self.program.stop()
+                            await self.send(Message('notification', 'Stopping after the current file...'))
+                        else:
+                            await self.send(Message('error', 'Nothing to stop.'))
+                    
+                    # Page, filter and compare recorded results without loading CSVs, e.g.
+                    # {'kind': 'rows', 'filters': {'run': 3, 'node': 'r:0:c:*'}, 'page': 0, 'page_size': 100, 'id': 1}
+                    # (see ResultsDB.query); the answer is a 'query_result' message with the same 'id'
+                    elif message.type == 'query':
                         try:
-                            command_name = message.data.get('type')
-                            args = message.data.get('args', {})
-                            
-                            print(f"Received command: {command_name} with args: {args}")
-                            
-                            # Execute the command
-                            if self.program:
-                                await self.handle_command(command_name, args)
-                            else:
-                                await self.send(Message('error', 'Program not initialized. Please set solver path first.'))
+                            if self.results_db is None:
+                                from resultsDB import ResultsDB
+                                self.results_db = ResultsDB()
+                            result = await asyncio.to_thread(self.results_db.query, message.data or {})
+                            await self.send(Message('query_result', result))
                         except Exception as e:
-                            print(f"Error executing command: {str(e)}")
-                            traceback.print_exc()  # Print the full traceback for debugging
-                            await self.send(Message('error', f'Error executing command: {str(e)}'))
+                            await self.send(Message('error', f'Query failed: {str(e)}'))
                     
                     # Handle input requests and responses
                     elif message.type == 'input_response':
@@ -180,37 +276,24 @@ class MessageQueue:
                     # Handle input validation requests
                     elif message.type == 'validate_input':
                         try:
-                            input_type = message.data.get('input_type')  # e.g., 'file', 'folder', 'cfr', 'json', etc.
+                            input_type = message.data.get('input_type')  # e.g., 'cfr_folder', 'weights_file', 'board_file'
                             input_value = message.data.get('value')
                             
                             print(f"Validating input of type {input_type}: {input_value}")
-
-                            
-                            # Map input type to the appropriate Input class
-                            input_class_map = {
-                                'cfr_folder': CFRFolder().parseInput,
-                                'weights_file': WeightsFile().parseInput,
-                                'board_file': BoardFile().parseInput,
-                            }
                             
-                            # Get the appropriate validation method
-                            method = input_class_map.get(input_type)
+                            # Parse off the event loop; folders on network drives can take a while to list
+                            await self.backend_ready()
+                            parsed, error = await asyncio.to_thread(self.validation_cache.validate, input_type, input_value)
                             
-                            # Validate the input
-                            try:
-                                # Try to parse the input (this will validate it)
-                                method(input_value)
-                                    
-                                # Input is valid
+                            if error is None:
                                 await self.send(Message('input_validation', {
                                     'is_valid': True,
                                     'input_type': input_type
                                 }))
-                            except Exception as e:
-                                # Input is invalid
+                            else:
                                 await self.send(Message('input_validation', {
                                     'is_valid': False,
-                                    'error': str(e),
+                                    'error': error,
                                     'input_type': input_type
                                 }))
                         except Exception as e:
@@ -220,17 +303,53 @@ class MessageQueue:
                     else:
                         print(f"Unhandled message type: {message.type}")
                 
-                except json.JSONDecodeError as e:
+                except (ValueError, KeyError, TypeError) as e:
                     print(f"Error decoding message: {e}")
-                    print(f"Raw data: {data}")
                 
             except Exception as e:
                 print(f"Error in message listener: {e}")
                 traceback.print_exc()
                 await asyncio.sleep(1)  # Prevent tight loop in case of errors
 
-    async def handle_command(self, command_str: str, args: dict) -> None:
-        """Handle a command from the frontend"""
+    async def run_job(self, command_name: str, args: dict, profile: str = None):
+        """Run a command from the frontend and record how it ended in the session"""
+        try:
+            # Execute the command
+            await self.program_ready()
+            if self.program:
+                error = await self.handle_command(command_name, args, profile)
+            else:
+                error = 'Program not initialized. Please set solver path first.'
+                await self.send(Message('error', error))
+        except Exception as e:
+            print(f"Error executing command: {str(e)}")
+            traceback.print_exc()  # Print the full traceback for debugging
+            error = f'Error executing command: {str(e)}'
+            await self.send(Message('error', error))
+        self.session.finish_job('failed' if error else 'completed', error)
+        await self.send(Message('job_state', self.session.job))
+    
+    async def resume(self, last_seq: int):
+        """Replay what a reconnecting client missed"""
+        messages, missed = self.session.since(last_seq)
+        await self.send_session_state(replayed = len(messages), missed = missed)
+        for m in messages:
+            await self.write(m)
+    
+    async def send_session_state(self, replayed: int, missed: bool):
+        """Tell a (re)connected client what is already running, so it doesn't set up the solver again"""
+        await self.send(Message('session resumed', {
+            'session': self.session.id,
+            'solver_ready': self.program is not None,
+            'job': self.session.job,
+            'replayed': replayed,
+            # True if the buffer no longer holds everything the client missed
+            'missed': missed,
+        }))
+    
+    async def handle_command(self, command_str: str, args: dict, profile: str = None):
+        """Handle a command from the frontend; returns an error message if it failed"""
+        from inputs import InputType
         try:
             command = self.command_map[command_str]
 
@@ -240,52 +359,108 @@ class MessageQueue:
             # Prepare arguments in correct order
             ordered_args = []
             
+            # Inputs were usually validated already when the user picked them, so this reuses the parsed results
             # First argument is always [folder_path, cfr_files] if cfr_folder is required
             if InputType.cfr_folder in required_inputs:
                 folder_path = args.get('cfr_folder')
                 if not folder_path:
                     raise ValueError("Missing cfr_folder argument")
                 
-                # Get all .cfr files in the folder
-                cfr_files = []
-                for root, _, files in os.walk(folder_path):
-                    for file in files:
-                        if file.endswith('.cfr'):
-                            cfr_files.append(os.path.join(root, file))
-                
-                if not cfr_files:
-                    raise ValueError(f"No .cfr files found in {folder_path}")
-                
-                ordered_args.append([folder_path, cfr_files])
+                ordered_args.append(await self.parse_input(InputType.cfr_folder, folder_path))
             
-            # Second argument is weights file if required
+            # Second argument is [weights_path, weights_map] if required
             if InputType.weights_file in required_inputs:
                 weights_path = args.get('weights_file')
                 if not weights_path:
                     raise ValueError("Missing weights_file argument")
                 
-                weights_info = weights_path
-                ordered_args.append(weights_info)
+                ordered_args.append(await self.parse_input(InputType.weights_file, weights_path))
             
-            # Third argument is board file and type if required
+            # Third argument is [nodeID/map, board_type, original_path] if required
             if InputType.board_file in required_inputs:
                 board_path = args.get('board_file')
                 if not board_path:
                     raise ValueError("Missing board_file argument")
-                # Create the [nodeID/map, board_type] array
-                # For now, using board_path as nodeID and 'default' as board_type
-                board_info = [board_path, 'default', board_path]  # [nodeID, board_type, original_path]
-                ordered_args.append(board_info)
+                
+                ordered_args.append(await self.parse_input(InputType.board_file, board_path))
             
             # Run the command with ordered arguments
             # Set the bridge reference in the program for sending command summaries
             self.program.bridge = self
-            await self.program.commandRun(command.value, ordered_args)
+            if profile:
+                await self.run_profiled(profile, command.value, ordered_args)
+            else:
+                await self.program.commandRun(command.value, ordered_args)
+            return None
         
         except KeyError:
-            await self.send(Message('error', f'Unknown command: {command_str}'))
+            error = f'Unknown command: {command_str}'
+        except Exception as e:
+            error = f'Error executing command: {str(e)}'
+        await self.send(Message('error', error))
+        return error
+    
+    async def run_profiled(self, mode: str, command, args: list):
+        """Run a command under the profiler, save the artifacts next to its results and send the hottest functions"""
+        from profiling import Profiler, artifactFolder
+        profiler = Profiler(mode)
+        profiler.start()
+        try:
+            await self.program.commandRun(command, args)
+        finally:
+            profiler.stop()
+            summary = profiler.summary()
+            try:
+                summary['files'] = await asyncio.to_thread(profiler.write, artifactFolder(args, self.program.results_dir))
+            except OSError as e:
+                print("Could not save the profile: " + str(e))
+            await self.send(Message('profile', summary))
+    
+    async def parse_input(self, input_type, path: str):
+        """Parse a command input in a worker thread, reusing the result of an earlier validation if the path is unchanged"""
+        return await asyncio.to_thread(self.validation_cache.parse, input_type.name, path)
+    
+    def mark(self, event: str):
+        """Record how long after startup an event happened"""
+        self.timings[event] = round(time.perf_counter() - self.started_at, 4)
+        print(f"Startup: {event} after {self.timings[event]}s")
+    
+    async def backend_ready(self):
+        """Wait for the command stack to finish loading"""
+        if self.backend_task is None:
+            self.backend_task = asyncio.create_task(asyncio.to_thread(load_backend))
+        await self.backend_task
+        if self.validation_cache is None:
+            from menu import PluginCommands
+            from validationCache import ValidationCache
+            self.command_map = {cmd.value.name: cmd for cmd in PluginCommands}
+            self.validation_cache = ValidationCache()
+            self.mark('backend')
+    
+    async def program_ready(self):
+        """Wait for a solver that is still being spawned"""
+        if self.solver_task is not None:
+            await self.solver_task
+    
+    async def connect_solver(self, solver_path: str):
+        """Spawn the solver in a worker thread and create the Program around it"""
+        try:
+            await self.backend_ready()
+            from SolverConnection.testSolver import Solver
+            from testProgram import Program
+            connection = await asyncio.to_thread(Solver, solver_path)
+            self.solver_path = solver_path
+            # Create Program with notify function
+            self.program = Program(
+                connection=connection,
+                notify_func=self.notify_sync,
+            )
+            # Add send_message method to program
+            self.program.send_message = self.send
+            self.mark('solver ready')
+            await self.send(Message('solver ready', {'timings': self.timings}))
         except Exception as e:
-            await self.send(Message('error', f'Error executing command: {str(e)}'))
+            await self.send(Message('error', f'Failed to connect to solver: {str(e)}'))
     
     async def run(self):
         try:
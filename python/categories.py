@@ -0,0 +1,295 @@
+from __future__ import annotations
+from global_var import totalCombos, hand_category_index, draw_category_index
+from combos import parseBoard, combos, comboNames, deadMask, indexes, allCombos
+from functools import lru_cache
+import unittest
+import json
+import os
+
+# computes pio's hand and draw category for every combo on a board without asking the solver (show_categories).
+# categories only depend on the board, so the result is cached per board and works before any tree is loaded.
+#
+# how the categories are obtained, PIOSPEED_CATEGORIES=local|verify|solver:
+#   local  - computed here
+#   verify - computed here and checked against show_categories; pio's answer is used if they differ
+#   solver - always asked from pio
+# the rules here are inferred from pio's category names, so verify stays the default until they have been checked
+# against show_categories on enough boards (see fixturesPath)
+categoryMode = os.environ.get("PIOSPEED_CATEGORIES", "verify")
+
+# show_categories answers kept as test fixtures, {board: [hand_per_combo, draw_per_combo]}.
+# with PIOSPEED_CATEGORY_CAPTURE=<path>, every board pio is asked about in verify or solver mode is added to that file
+fixturesPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mappings", "category_fixtures.json")
+capturePath = os.environ.get("PIOSPEED_CATEGORY_CAPTURE")
+# combos checked by hand against pio's category definitions, at least one for every hand and draw category,
+# {board: {combo: [hand category, draw category]}}
+examplesPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mappings", "category_examples.json")
+
+wheel = [12, 0, 1, 2, 3]
+
+
+# the highest card of the best straight that can be made from a set of ranks, or None
+def straightHigh(rankSet : set) -> int:
+    for high in range(12, 3, -1):
+        if all(r in rankSet for r in range(high - 4, high + 1)):
+            return high
+    if all(r in rankSet for r in wheel):
+        return 3
+    return None
+
+
+# everything about the board that doesn't depend on the combo
+class BoardSummary():
+    def __init__(self, board : str) -> None:
+        self.cards = parseBoard(board)
+        self.ranks = [c // 4 for c in self.cards]
+        self.suits = [c % 4 for c in self.cards]
+        # distinct board ranks, highest first
+        self.distinct = sorted(set(self.ranks), reverse=True)
+        self.suitCounts = [self.suits.count(s) for s in range(4)]
+        self.rankCounts = [self.ranks.count(r) for r in range(13)]
+        self.river = len(self.cards) >= 5
+        self.flop = len(self.cards) == 3
+        # best kicker to go with top pair: the highest rank not on the board
+        self.topKicker = max(r for r in range(13) if r not in self.distinct)
+
+    # the straights reachable by adding one card, as the set of ranks that would make a straight including a hole card
+    def straightOuts(self, holeRanks : list[int], rankSet : set) -> list[int]:
+        outs = []
+        for r in range(13):
+            if r in rankSet:
+                continue
+            high = straightHigh(rankSet | {r})
+            if high is None:
+                continue
+            window = wheel if high == 3 else range(high - 4, high + 1)
+            if any(h in window for h in holeRanks):
+                outs.append(r)
+        return outs
+
+
+def handCategory(board : BoardSummary, high : int, low : int) -> str:
+    hole = [high, low]
+    holeRanks = [c // 4 for c in hole]
+    cards = board.cards + hole
+    ranks = [c // 4 for c in cards]
+    rankSet = set(ranks)
+    rankCounts = [ranks.count(r) for r in range(13)]
+
+    flushSuit = None
+    for s in range(4):
+        if sum(1 for c in cards if c % 4 == s) >= 5:
+            flushSuit = s
+    if flushSuit is not None and straightHigh({c // 4 for c in cards if c % 4 == flushSuit}) is not None:
+        return "straight_flush"
+    if max(rankCounts) == 4:
+        return "quads"
+    trips = [r for r in range(13) if rankCounts[r] == 3]
+    pairs = [r for r in range(13) if rankCounts[r] == 2]
+    if trips and (len(trips) > 1 or pairs):
+        return "top_fullhouse" if max(trips) >= board.distinct[0] else "fullhouse"
+    if flushSuit is not None:
+        return "flush"
+    if straightHigh(rankSet) is not None:
+        return "straight"
+
+    # from here on only pairs the hole cards make count
+    if holeRanks[0] == holeRanks[1]:
+        pair = holeRanks[0]
+        if board.rankCounts[pair] == 1:
+            return "set"
+        if pair > board.distinct[0]:
+            return "overpair"
+        if pair < board.distinct[-1]:
+            return "low_pair"
+        return "underpair"
+
+    for r in holeRanks:
+        if board.rankCounts[r] == 2:
+            return "trips"
+    matched = [r for r in holeRanks if board.rankCounts[r] == 1]
+    # pairing a card of a paired board makes two pair with the board's pair
+    if len(matched) == 2 or (matched and max(board.rankCounts) == 2):
+        return "two_pair"
+    if len(matched) == 1:
+        place = board.distinct.index(matched[0])
+        if place == 0:
+            kicker = holeRanks[0] if holeRanks[1] == matched[0] else holeRanks[1]
+            return "top_pair_tp" if kicker == board.topKicker else "top_pair"
+        if place == 1:
+            return "2nd-pair"
+        if place == 2:
+            return "3rd-pair"
+        return "low_pair"
+
+    if 12 in holeRanks:
+        return "ace_high"
+    if 11 in holeRanks:
+        return "king_high"
+    return "nothing"
+
+
+def drawCategory(board : BoardSummary, high : int, low : int, handName : str) -> str:
+    if board.river:
+        return "no_draw"
+    hole = [high, low]
+    holeRanks = [c // 4 for c in hole]
+    holeSuits = [c % 4 for c in hole]
+    madeFlush = handName in ["flush", "straight_flush"]
+    madeStraight = handName in ["straight", "straight_flush"] or madeFlush
+
+    flushDraw = False
+    backdoor = None
+    if not madeFlush:
+        for s in set(holeSuits):
+            mine = holeSuits.count(s)
+            together = mine + board.suitCounts[s]
+            if together == 4:
+                flushDraw = True
+            elif together == 3 and board.flop:
+                backdoor = "bdfd_2card" if mine == 2 else (backdoor or "bdfd_1card")
+
+    straightDraw = None
+    if not madeStraight:
+        outs = board.straightOuts(holeRanks, set(board.ranks + holeRanks))
+        if len(outs) >= 2:
+            straightDraw = "8out_straight_draw"
+        elif len(outs) == 1:
+            straightDraw = "4out_straight_draw"
+
+    if flushDraw and straightDraw:
+        return "combo_draw"
+    if flushDraw:
+        return "flush_draw"
+    if straightDraw:
+        return straightDraw
+    if backdoor:
+        return backdoor
+    return "no_draw"
+
+
+# [hand_per_combo, draw_per_combo] in the same format parseCategories returns from show_categories.
+# combos that share a card with the board are left at 0.
+@lru_cache(maxsize=256)
+def evaluate(board : str) -> tuple:
+    summary = BoardSummary(board)
+    hand_per_combo = [0] * totalCombos
+    draw_per_combo = [0] * totalCombos
+    for i in indexes(allCombos & ~deadMask(board)):
+        high, low = combos[i]
+        handName = handCategory(summary, high, low)
+        hand_per_combo[i] = hand_category_index[handName]
+        draw_per_combo[i] = draw_category_index[drawCategory(summary, high, low, handName)]
+    return (tuple(hand_per_combo), tuple(draw_per_combo))
+
+
+# the live combos whose local categories differ from pio's, as (combo, [local hand, local draw], [pio hand, pio draw])
+def compare(board : str, solverCategories : list) -> list:
+    local = evaluate(board)
+    differences = []
+    for i in indexes(allCombos & ~deadMask(board)):
+        mine = [local[0][i], local[1][i]]
+        pio = [int(solverCategories[0][i]), int(solverCategories[1][i])]
+        if mine != pio:
+            differences.append((comboNames[i], mine, pio))
+    return differences
+
+
+def loadFixtures(path : str = fixturesPath) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+# adds pio's categories for a board to the fixtures file at path
+def capture(board : str, solverCategories : list, path : str) -> None:
+    fixtures = loadFixtures(path)
+    fixtures[board] = [[int(c) for c in v] for v in solverCategories]
+    try:
+        with open(path, "w") as f:
+            json.dump(fixtures, f)
+    except OSError:
+        pass
+
+
+def askSolver(board : str, showCategories) -> list:
+    solverCategories = showCategories()
+    if capturePath:
+        capture(board, solverCategories, capturePath)
+    return solverCategories
+
+
+# the categories for a board according to categoryMode. showCategories() asks the solver.
+def forBoard(board : str, showCategories = None) -> list:
+    if categoryMode == "solver":
+        if showCategories is None:
+            raise Exception("Categories for " + board + " need a loaded tree in solver mode")
+        return askSolver(board, showCategories)
+    if categoryMode == "verify" and showCategories is not None:
+        solverCategories = askSolver(board, showCategories)
+        differences = compare(board, solverCategories)
+        if differences:
+            print("Local categories differ from show_categories on " + board + " for " + str(len(differences)) + " combos, e.g. " + str(differences[:3]))
+            return solverCategories
+    return [list(v) for v in evaluate(board)]
+
+
+class Tests(unittest.TestCase):
+
+    def category(self, board : str, combo : str) -> list[str]:
+        from combos import comboIndex
+        hand, draw = evaluate(board)
+        i = comboIndex[combo]
+        handNames = {v: k for k, v in hand_category_index.items()}
+        drawNames = {v: k for k, v in draw_category_index.items()}
+        return [handNames[hand[i]], drawNames[draw[i]]]
+
+    def testHands(self):
+        board = "As5h3s"
+        self.assertEqual(self.category(board, "AhKd"), ["top_pair_tp", "no_draw"])
+        self.assertEqual(self.category(board, "AhQd"), ["top_pair", "no_draw"])
+        self.assertEqual(self.category(board, "KhKd"), ["underpair", "no_draw"])
+        self.assertEqual(self.category(board, "5d5c"), ["set", "no_draw"])
+        self.assertEqual(self.category(board, "5d3d"), ["two_pair", "no_draw"])
+        self.assertEqual(self.category(board, "4d2d"), ["straight", "no_draw"])
+        self.assertEqual(self.category(board, "KsQs"), ["king_high", "flush_draw"])
+        self.assertEqual(self.category(board, "4s2c"), ["straight", "bdfd_1card"])
+        self.assertEqual(self.category(board, "7s6s"), ["nothing", "combo_draw"])
+        self.assertEqual(self.category(board, "7d6d"), ["nothing", "4out_straight_draw"])
+        self.assertEqual(self.category(board, "7d4d"), ["nothing", "8out_straight_draw"])
+        self.assertEqual(self.category(board, "QhJh"), ["nothing", "bdfd_2card"])
+        self.assertEqual(self.category("KsKd7h", "7d7c"), ["fullhouse", "no_draw"])
+        self.assertEqual(self.category("KsKd7h", "KhQc"), ["trips", "no_draw"])
+        self.assertEqual(self.category("KsKd7h", "7c6c"), ["two_pair", "no_draw"])
+        self.assertEqual(self.category("KsKd7h", "Ac7c"), ["two_pair", "no_draw"])
+
+    def testExamples(self):
+        examples = loadFixtures(examplesPath)
+        found = [c for board in examples.values() for combo in board.values() for c in combo]
+        self.assertEqual(set(hand_category_index) - set(found), set())
+        self.assertEqual(set(draw_category_index) - set(found), set())
+        for board, combos in examples.items():
+            for combo, expected in combos.items():
+                with self.subTest(board=board, combo=combo):
+                    self.assertEqual(self.category(board, combo), expected)
+
+    # every board captured from show_categories (PIOSPEED_CATEGORY_CAPTURE) has to match
+    def testFixtures(self):
+        fixtures = loadFixtures()
+        if not fixtures:
+            self.skipTest("no show_categories answers captured in " + fixturesPath + " (run the solver with PIOSPEED_CATEGORY_CAPTURE set to it)")
+        for board, solverCategories in fixtures.items():
+            with self.subTest(board=board):
+                self.assertEqual(compare(board, solverCategories), [])
+
+    def testVerify(self):
+        local = [list(v) for v in evaluate("As5h3s")]
+        self.assertEqual(compare("As5h3s", local), [])
+        local[0][0] = 99
+        self.assertEqual(len(compare("As5h3s", local)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,317 @@
+from __future__ import annotations
+from menu import PluginCommands
+from inputs import InputType
+from profiling import profileModes
+import argparse
+import threading
+import json
+import time
+import sys
+import os
+
+# runs a PluginCommands command without Electron, e.g.
+#   python cli.py run_mini --solver "C:\PioSOLVER\PioSOLVER3-pro.exe" --folder trees --board board.json --accuracy 0.2
+# progress is printed as it happens; the last line printed is a JSON summary of the run.
+# exit codes: 0 = success, 1 = some files failed, 2 = invalid arguments, 3 = the run could not complete
+
+# commands that only change settings or close the session are not useful on their own
+excludedCommands = [PluginCommands.SET_ACCURACY, PluginCommands.END]
+
+commands : dict[str, PluginCommands] = {c.value.name: c for c in PluginCommands if c not in excludedCommands}
+
+# commands that start solver processes of their own, which a --replay has no transcript for
+ownSolverCommands = [PluginCommands.EXTRACT_SUBTREES, PluginCommands.AUTOTUNE]
+
+# commands where the first Ctrl-C stops after the current file (keeping finished results) instead of aborting
+stoppableCommands = [PluginCommands.RUN_PROGRESSIVE]
+
+# command line option that provides each input type
+inputOptions = {
+    InputType.cfr_folder: "folder",
+    InputType.weights_file: "weights",
+    InputType.board_file: "board",
+}
+
+
+class PreflightFailed(Exception):
+    pass
+
+
+def makeParser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Run a piospeed command headlessly.")
+    parser.add_argument("command", choices=sorted(commands.keys()) + ["worker"], help="a command, or worker to run the files of a --distribute run")
+    parser.add_argument("--solver", help="path to the PioSOLVER executable (not needed with --replay or --distribute)")
+    parser.add_argument("--folder", help="folder of .cfr files (for a worker: where the coordinator's folder is on this machine, if it differs)")
+    parser.add_argument("--weights", help="weights JSON file")
+    parser.add_argument("--board", help="board JSON file")
+    parser.add_argument("--accuracy", type=float, help="accuracy as a fraction (or percentage) of the pot")
+    parser.add_argument("--watch", action="store_true", help="keep running on new .cfr files added to the folder until interrupted")
+    parser.add_argument("--settle", type=float, default=5.0, help="seconds a new file has to stay unchanged before it is processed in watch mode")
+    parser.add_argument("--summary", help="also write the JSON summary to this file")
+    parser.add_argument("--preflight", action="store_true", help="check every file's node and weights first and stop if any file has problems")
+    parser.add_argument("--workers", type=int, default=2, help="solver processes used by --preflight")
+    parser.add_argument("--no-cache", action="store_true", help="solve again even if an identical run was cached")
+    parser.add_argument("--no-autotune", action="store_true", help="use one solver process with its default threads even if autotune has a configuration for these files")
+    parser.add_argument("--profile", choices=profileModes, help="profile the run and save the profile next to the results")
+    parser.add_argument("--trace", action="store_true", help="save a Chrome trace / Perfetto timeline of the run next to the results")
+    parser.add_argument("--no-standby", action="store_true", help="don't keep a second solver process ready for failover")
+    parser.add_argument("--record", help="save a transcript of every solver process to this folder")
+    parser.add_argument("--replay", help="answer from this transcript instead of running the solver")
+    parser.add_argument("--replay-speed", type=float, help="with --replay, wait as long as the recorded solver did, divided by this (default: answer at once)")
+    parser.add_argument("--replay-loose", action="store_true", help="with --replay, don't check that the commands sent match the recorded ones")
+    parser.add_argument("--distribute", metavar="ADDRESS", help="have workers run the files: listen for them on host:port or unix:/path")
+    parser.add_argument("--coordinator", metavar="ADDRESS", help="for worker: the --distribute address to take files from")
+    parser.add_argument("--name", help="for worker: the name shown in the coordinator's progress (default: host:pid)")
+    return parser
+
+
+# turns the command line options into the argument list the command expects
+def parseCommandArgs(command : PluginCommands, options : argparse.Namespace) -> list:
+    args = []
+    for i in command.value.args:
+        option = inputOptions.get(i.type)
+        value = getattr(options, option) if option else None
+        if not value:
+            raise Exception(command.value.name + " needs --" + str(option))
+        args.append(i.parseInput(os.path.abspath(value)))
+    return args
+
+
+# message types not printed: result rows are in the CSVs, and as JSON lines they could be mistaken for the summary
+quietTypes = ["result_row"]
+
+
+def printProgress(message, msg_type = "notification") -> None:
+    if msg_type in quietTypes:
+        return
+    if type(message) is not str:
+        message = json.dumps(message, default=str)
+    print(message, flush=True)
+
+
+def finish(summary : dict, options : argparse.Namespace, code : int) -> int:
+    summary["exit_code"] = code
+    line = json.dumps(summary, default=str)
+    print(line, flush=True)
+    if options is not None and options.summary:
+        with open(options.summary, "w") as f:
+            f.write(line + "\n")
+    return code
+
+
+def main(argv : list[str] = None) -> int:
+    options = makeParser().parse_args(argv)
+    if options.command == "worker":
+        return runWorker(options)
+    command = commands[options.command]
+    summary = {"command": command.value.name, "status": "invalid arguments", "results": [], "errors": []}
+
+    try:
+        args = parseCommandArgs(command, options)
+    except Exception as e:
+        summary["errors"].append(str(e))
+        return finish(summary, options, 2)
+
+    if not options.solver and not options.replay and not options.distribute:
+        summary["errors"].append("--solver, --replay or --distribute is required.")
+        return finish(summary, options, 2)
+
+    # the workers run the solvers; files are handed out one at a time, so only commands that run file by file can be spread
+    if options.distribute:
+        from distributed import distributableCommands
+        if command not in distributableCommands:
+            summary["errors"].append(command.value.name + " cannot be distributed.")
+            return finish(summary, options, 2)
+        if options.watch or options.preflight or options.replay or options.record:
+            summary["errors"].append("--distribute cannot be combined with --watch, --preflight, --replay or --record.")
+            return finish(summary, options, 2)
+
+    # a replay answers one supervised solver, in the order recorded: no cache hits, pools or extra solver processes
+    if options.replay and (options.preflight or options.record):
+        summary["errors"].append("--replay cannot be combined with --preflight or --record.")
+        return finish(summary, options, 2)
+    if options.replay and command in ownSolverCommands:
+        summary["errors"].append(command.value.name + " cannot be replayed: it runs solver processes that aren't recorded in one transcript.")
+        return finish(summary, options, 2)
+
+    if options.watch and command not in watchableCommands():
+        summary["errors"].append(command.value.name + " cannot be used in watch mode.")
+        return finish(summary, options, 2)
+
+    inputTypes = [i.type for i in command.value.args]
+    if options.preflight and (InputType.cfr_folder not in inputTypes or InputType.board_file not in inputTypes):
+        summary["errors"].append(command.value.name + " has no board file to check with --preflight.")
+        return finish(summary, options, 2)
+
+    # imported here so --help and argument errors don't pay for the solver stack
+    from SolverConnection.supervisor import SolverSupervisor
+    from program import Program
+
+    start = time.monotonic()
+    program = None
+    replay = None
+    try:
+        tuned = tunedConfiguration(command, args, options)
+        # a tuned configuration with several processes runs the files on local workers, one solver each
+        local = tuned is not None and tuned["processes"] > 1 and command in watchableCommands() and not (options.watch or options.preflight or options.record)
+        if options.distribute or local:
+            from distributed import Coordinator, DistributedProgram, startLocalWorkers
+            connection = Coordinator(options.distribute or "127.0.0.1:0", printProgress)
+            address = connection.start()
+            if local:
+                printProgress("Running on " + str(tuned["processes"]) + " solver processes with " + str(tuned["threads"]) + " threads each, as tuned for trees " + tuned["tree_class"])
+                startLocalWorkers(connection, tuned["processes"], lambda: startSolver(options.solver, tuned["threads"]), use_cache = not options.no_cache)
+            else:
+                printProgress("Waiting for workers on " + address)
+        elif options.replay:
+            from SolverConnection.transcript import ReplaySolver
+            printProgress("Replaying " + options.replay)
+            replay = ReplaySolver(os.path.abspath(options.replay), options.replay_speed, strict = not options.replay_loose)
+            # supervised as the recorded run was, so its failovers replay too
+            connection = SolverSupervisor(replay.solverPath, warm_standby = False, spawn = replay.respawn)
+        else:
+            if options.record:
+                from SolverConnection import transcript
+                transcript.recordFolder = os.path.abspath(options.record)
+            printProgress("Starting solver " + options.solver)
+            connection = SolverSupervisor(options.solver, warm_standby = not options.no_standby and not options.record)
+            if tuned is not None:
+                printProgress("Using " + str(tuned["threads"]) + " solver threads, as tuned for trees " + tuned["tree_class"])
+                connection.command("set_threads " + str(tuned["threads"]))
+        program = DistributedProgram(connection, printProgress) if options.distribute or local else Program(connection, printProgress)
+        # cache hits skip solver commands, so recorded and replayed runs always solve
+        program.use_cache = not (options.no_cache or options.replay or options.record)
+        program.profile = options.profile
+        program.trace = program.trace or options.trace
+        if options.accuracy is not None:
+            program.update_accuracy([str(options.accuracy)])
+
+        if options.preflight:
+            inputs = dict(zip(inputTypes, args))
+            folder, files = inputs[InputType.cfr_folder]
+            weights_map = inputs[InputType.weights_file][1] if InputType.weights_file in inputs else None
+            program.preflight_check(folder, files, inputs[InputType.board_file][0], weights_map, options.workers)
+            if program.errors:
+                summary["status"] = "preflight failed"
+                raise PreflightFailed()
+
+        if options.watch:
+            stop = threading.Event()
+            try:
+                program.watch(command, args, stop, settle_time = options.settle)
+            except KeyboardInterrupt:
+                stop.set()
+        elif command in stoppableCommands:
+            runStoppable(program, command, args)
+        else:
+            program.commandRun(command, args)
+
+        summary["status"] = "completed" if not program.errors else "completed with errors"
+        code = 0 if not program.errors else 1
+    except PreflightFailed:
+        code = 1
+    except KeyboardInterrupt:
+        summary["status"] = "interrupted"
+        code = 3
+    except Exception as e:
+        summary["status"] = "failed"
+        summary["errors"].append(str(e))
+        code = 3
+    finally:
+        if program is not None:
+            summary["results"] = program.results_paths
+            summary["errors"].extend(program.errors)
+            try:
+                program.end([])
+            except Exception:
+                pass
+
+    summary["seconds"] = round(time.monotonic() - start, 3)
+    if replay is not None:
+        summary["replay"] = {"recorded_solver_seconds": round(replay.recorded_seconds, 3),
+                             "replayed_to_end": replay.finished()}
+    if args and InputType.cfr_folder in inputTypes:
+        summary["files"] = args[0][1]
+    return finish(summary, options, code)
+
+
+# the autotune configuration for the files of a folder command, or None if there isn't one or it doesn't apply:
+# replays have to send the recorded commands, and --distribute workers have their own machines
+def tunedConfiguration(command : PluginCommands, args : list, options : argparse.Namespace) -> dict:
+    inputTypes = [i.type for i in command.value.args]
+    if options.no_autotune or options.replay or options.distribute or command == PluginCommands.AUTOTUNE or InputType.cfr_folder not in inputTypes:
+        return None
+    from autotune import Tuning
+    folder, files = args[0]
+    return Tuning().lookup([os.path.join(folder, f) for f in files])
+
+
+# a solver for one of the local workers of a tuned run
+def startSolver(path : str, threads : int):
+    from SolverConnection.supervisor import SolverSupervisor
+    connection = SolverSupervisor(path, warm_standby = False)
+    connection.command("set_threads " + str(threads))
+    return connection
+
+
+# runs the files a --distribute coordinator hands out on a solver here, until the coordinator finishes
+def runWorker(options : argparse.Namespace) -> int:
+    if not options.coordinator or not options.solver:
+        printProgress("worker needs --coordinator and --solver")
+        return 2
+    from SolverConnection.supervisor import SolverSupervisor
+    from program import Program
+    from distributed import Worker, runTask
+    printProgress("Starting solver " + options.solver)
+    connection = SolverSupervisor(options.solver, warm_standby = not options.no_standby)
+    program = Program(connection, printProgress)
+    program.use_cache = not options.no_cache
+    def run(task, notify):
+        program.notify = notify
+        return runTask(program, task, os.path.abspath(options.folder) if options.folder else None)
+    worker = Worker(options.coordinator, run, options.name)
+    printProgress("Working for " + options.coordinator + " as " + worker.name)
+    try:
+        worker.run()
+        code = 0
+    except KeyboardInterrupt:
+        code = 3
+    except OSError as e:
+        printProgress("Could not reach the coordinator: " + str(e))
+        code = 3
+    finally:
+        connection.exit()
+    printProgress("Ran " + str(worker.tasks_run) + " files.")
+    return code
+
+
+# runs the command on a worker thread; Ctrl-C asks it to stop after the current file, a second Ctrl-C aborts
+def runStoppable(program, command : PluginCommands, args : list) -> None:
+    failure = []
+    def run():
+        try:
+            program.commandRun(command, args)
+        except Exception as e:
+            failure.append(e)
+    worker = threading.Thread(target=run, daemon=True)
+    worker.start()
+    try:
+        while worker.is_alive():
+            worker.join(0.5)
+    except KeyboardInterrupt:
+        printProgress("Stopping after the current file (Ctrl-C again to abort)...")
+        program.stop()
+        while worker.is_alive():
+            worker.join(0.5)
+    if failure:
+        raise failure[0]
+
+
+# the folder commands that can be run file by file
+def watchableCommands() -> list[PluginCommands]:
+    from program import Program
+    return list(Program.nodelockSettings) + list(Program.runSettings)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
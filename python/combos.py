@@ -0,0 +1,272 @@
+from __future__ import annotations
+from global_var import totalCombos, hand_category_index, draw_category_index
+from errorMessages import Errors
+from collections import OrderedDict
+from functools import lru_cache
+import threading
+import unittest
+import re
+
+# PioSolver's ordering of the 1326 two-card combos: lookup tables for it, and masks over it.
+# anything that reads a 1326 long vector from pio (strategies, ranges, categories) should index it through here.
+# a mask is an int used as a bitset: bit i is set if combo i is included, so masks combine with & and | in one operation.
+
+ranks = "23456789TJQKA"
+suits = "cdhs"
+
+# card index = rank index * 4 + suit index (2c = 0, 2d = 1 ... As = 51)
+def cardIndex(card : str) -> int:
+    if len(card) != 2 or card[0] not in ranks or card[1] not in suits:
+        raise Exception(Errors.invalidCard(card))
+    return ranks.index(card[0]) * 4 + suits.index(card[1])
+
+def cardName(index : int) -> str:
+    return ranks[index // 4] + suits[index % 4]
+
+# "As5h3s" or "As 5h 3s" -> [51, 14, 7]
+def parseBoard(board : str) -> list[int]:
+    board = board.replace(" ", "")
+    return [cardIndex(board[i:i + 2]) for i in range(0, len(board), 2)]
+
+#---------------------------------------combo tables---------------------------------------#
+
+# pio lists combos with the higher card first: 2d2c, 2h2c, 2h2d, 2s2c ... AsAh
+# every table below is indexed by combo index and never changes, so they are tuples.
+combos : tuple[tuple[int, int]] = tuple((high, low) for high in range(52) for low in range(high))
+comboNames : tuple[str] = tuple(cardName(high) + cardName(low) for high, low in combos)
+comboIndex : dict[str, int] = {name: i for i, name in enumerate(comboNames)}
+
+highCards : tuple[int] = tuple(high for high, low in combos)
+lowCards : tuple[int] = tuple(low for high, low in combos)
+highRanks : tuple[int] = tuple(high // 4 for high in highCards)
+lowRanks : tuple[int] = tuple(low // 4 for low in lowCards)
+highSuits : tuple[int] = tuple(high % 4 for high in highCards)
+lowSuits : tuple[int] = tuple(low % 4 for low in lowCards)
+suited : tuple[bool] = tuple(highSuits[i] == lowSuits[i] for i in range(totalCombos))
+paired : tuple[bool] = tuple(highRanks[i] == lowRanks[i] for i in range(totalCombos))
+
+# the hand class of each combo: AA, AKs, AKo ...
+handClasses : tuple[str] = tuple(ranks[highRanks[i]] + ranks[lowRanks[i]] + ("" if paired[i] else "s" if suited[i] else "o")
+                                 for i in range(totalCombos))
+
+allCombos = (1 << totalCombos) - 1
+
+def maskFrom(predicate) -> int:
+    mask = 0
+    for i in range(totalCombos):
+        if predicate(i):
+            mask |= 1 << i
+    return mask
+
+# the combos that contain each card, i.e. that the card blocks
+blockerMasks : tuple[int] = tuple(maskFrom(lambda i, card=card: highCards[i] == card or lowCards[i] == card) for card in range(52))
+suitedMask = maskFrom(lambda i: suited[i])
+pairedMask = maskFrom(lambda i: paired[i])
+offsuitMask = allCombos & ~suitedMask
+
+# combos that can't be dealt on a board (they share a card with it)
+@lru_cache(maxsize=256)
+def deadMask(board : str) -> int:
+    mask = 0
+    for card in parseBoard(board):
+        mask |= blockerMasks[card]
+    return mask
+
+# the combo indexes included in a mask, in ascending order
+def indexes(mask : int) -> list[int]:
+    found = []
+    while mask:
+        low = mask & -mask
+        found.append(low.bit_length() - 1)
+        mask ^= low
+    return found
+
+def count(mask : int) -> int:
+    return bin(mask).count("1")
+
+# the entries of a 1326 long vector (strategy, range, categories...) for the combos in a mask
+def select(vector : list, mask : int) -> list:
+    return [vector[i] for i in indexes(mask)]
+
+# the sum of a vector over the combos in a mask, optionally weighted by another vector (e.g. a range)
+def total(vector : list, mask : int, weights : list = None) -> float:
+    if weights is None:
+        return sum(vector[i] for i in indexes(mask))
+    return sum(vector[i] * weights[i] for i in indexes(mask))
+
+
+#---------------------------------------hand classes---------------------------------------#
+
+# AKs, AKo, AK, TT, Ax (any hand with an ace), AhKh (a single combo), each optionally followed by a suit filter:
+# @h (at least one heart) or @hh (both cards hearts). pairs, suited and offsuit are also accepted.
+handPattern = re.compile(r"^(?:([2-9TJQKA])([2-9TJQKAx])([so]?)|([2-9TJQKA][cdhs][2-9TJQKA][cdhs])|(pairs|suited|offsuit))(?:@([cdhs])(\6)?)?$")
+
+@lru_cache(maxsize=None)
+def handMask(term : str) -> int:
+    match = handPattern.match(term)
+    if match is None:
+        raise Exception(Errors.invalidCategory(term))
+    first, second, suitedness, combo, group, suit, bothSuit = match.groups()
+
+    if combo:
+        high, low = cardIndex(combo[:2]), cardIndex(combo[2:])
+        if high == low:
+            raise Exception(Errors.invalidCategory(term))
+        mask = blockerMasks[high] & blockerMasks[low]
+    elif group == "pairs":
+        mask = pairedMask
+    elif group == "suited":
+        mask = suitedMask
+    elif group == "offsuit":
+        mask = offsuitMask
+    else:
+        if first == second and suitedness:
+            raise Exception(Errors.invalidCategory(term))
+        a = ranks.index(first)
+        if second == "x":
+            mask = maskFrom(lambda i: highRanks[i] == a or lowRanks[i] == a)
+        else:
+            b = ranks.index(second)
+            mask = maskFrom(lambda i: (highRanks[i], lowRanks[i]) == (max(a, b), min(a, b)))
+        if suitedness == "s":
+            mask &= suitedMask
+        elif suitedness == "o":
+            mask &= offsuitMask
+
+    if suit:
+        s = suits.index(suit)
+        if bothSuit:
+            mask &= maskFrom(lambda i: highSuits[i] == s and lowSuits[i] == s)
+        else:
+            mask &= maskFrom(lambda i: highSuits[i] == s or lowSuits[i] == s)
+    return mask
+
+
+#---------------------------------------selectors---------------------------------------#
+
+# a weights file key: terms joined with & (all must hold) and groups of those joined with , (any may hold).
+# a term is a hand or draw category name or a hand class, e.g. "top_pair&Ax@h,AKs"
+def parseSelector(selector : str) -> list[list[str]]:
+    groups = [[t.strip() for t in group.split("&")] for group in selector.split(",")]
+    for group in groups:
+        for term in group:
+            if term not in hand_category_index and term not in draw_category_index:
+                # raises if it is not a hand class either
+                handMask(term)
+    return groups
+
+def isValidSelector(selector : str) -> bool:
+    try:
+        parseSelector(selector)
+        return True
+    except Exception:
+        return False
+
+
+# masks for one board: the categories pio assigned to each combo, plus everything derived from them.
+# categories only depend on the board, so these are built once and shared by every file with that board.
+class BoardMasks():
+    def __init__(self, board : str, hand_per_combo : list, draw_per_combo : list) -> None:
+        self.board = board
+        self.dead = deadMask(board)
+        self.hand = BoardMasks.categoryMasks(hand_per_combo, len(hand_category_index))
+        self.draw = BoardMasks.categoryMasks(draw_per_combo, len(draw_category_index))
+        self.selectors : dict[str, int] = {}
+
+    @staticmethod
+    def categoryMasks(categoryPerCombo : list, size : int) -> list[int]:
+        masks = [0] * size
+        for i, category in enumerate(categoryPerCombo[:totalCombos]):
+            category = int(category)
+            if 0 <= category < size:
+                masks[category] |= 1 << i
+        return masks
+
+    def term(self, term : str) -> int:
+        if term in hand_category_index:
+            return self.hand[hand_category_index[term]]
+        if term in draw_category_index:
+            return self.draw[draw_category_index[term]]
+        return handMask(term)
+
+    # the live combos a weights file key applies to
+    def mask(self, selector : str) -> int:
+        if selector not in self.selectors:
+            mask = 0
+            for group in parseSelector(selector):
+                groupMask = allCombos
+                for t in group:
+                    groupMask &= self.term(t)
+                mask |= groupMask
+            self.selectors[selector] = mask & ~self.dead
+        return self.selectors[selector]
+
+
+# the most recently used boards' masks
+boardMasksCache : OrderedDict = OrderedDict()
+boardMasksCacheSize = 64
+boardMasksLock = threading.Lock()
+
+# returns the masks for a board, calling getCategories() -> [hand_per_combo, draw_per_combo] only if they aren't cached
+def getBoardMasks(board : str, getCategories) -> BoardMasks:
+    with boardMasksLock:
+        if board in boardMasksCache:
+            boardMasksCache.move_to_end(board)
+            return boardMasksCache[board]
+    hand_per_combo, draw_per_combo = getCategories()
+    masks = BoardMasks(board, hand_per_combo, draw_per_combo)
+    with boardMasksLock:
+        boardMasksCache[board] = masks
+        if len(boardMasksCache) > boardMasksCacheSize:
+            boardMasksCache.popitem(last=False)
+    return masks
+
+
+class Tests(unittest.TestCase):
+
+    def testOrdering(self):
+        self.assertEqual(len(combos), totalCombos)
+        self.assertEqual(comboNames[:7], ("2d2c", "2h2c", "2h2d", "2s2c", "2s2d", "2s2h", "3c2c"))
+        self.assertEqual(comboNames[-1], "AsAh")
+        self.assertEqual(handClasses[comboIndex["AhKh"]], "AKs")
+        self.assertEqual(handClasses[comboIndex["7c6d"]], "76o")
+        self.assertEqual(handClasses[comboIndex["TsTd"]], "TT")
+
+    def testTables(self):
+        self.assertEqual(count(blockerMasks[cardIndex("As")]), 51)
+        self.assertEqual(count(deadMask("As5h3d")), 3 * 51 - 3)
+        self.assertEqual(count(suitedMask), 312)
+        strategy = [1.0] * totalCombos
+        self.assertEqual(total(strategy, handMask("AK")), 16)
+        self.assertEqual(total(strategy, handMask("AK"), [0.5] * totalCombos), 8)
+        self.assertEqual(len(select(strategy, handMask("AKo"))), 12)
+
+    def testHandClasses(self):
+        self.assertEqual(count(handMask("AKs")), 4)
+        self.assertEqual(count(handMask("AKo")), 12)
+        self.assertEqual(count(handMask("AK")), 16)
+        self.assertEqual(count(handMask("TT")), 6)
+        self.assertEqual(count(handMask("pairs")), 78)
+        self.assertEqual(count(handMask("Ax")), 4 * 51 - 6)
+        self.assertEqual(indexes(handMask("KhAh")), [comboIndex["AhKh"]])
+        self.assertEqual(count(handMask("AKs@h")), 1)
+        self.assertEqual(count(handMask("AK@h")), 7)
+        self.assertEqual(count(handMask("Ax@hh")), 12)
+
+    def testSelectors(self):
+        self.assertTrue(isValidSelector("top_pair&Ax@h,AKs"))
+        self.assertFalse(isValidSelector("AAs"))
+        self.assertFalse(isValidSelector("top_pairs"))
+
+        hand_per_combo = [0] * totalCombos
+        for i in indexes(handMask("AK")):
+            hand_per_combo[i] = hand_category_index["top_pair"]
+        masks = BoardMasks("As5h3d", hand_per_combo, [0] * totalCombos)
+        # AsKx combos are dead on this board
+        self.assertEqual(count(masks.mask("top_pair")), 12)
+        self.assertEqual(count(masks.mask("top_pair&AKs")), 3)
+        self.assertEqual(count(masks.mask("top_pair&AKs,QQ")), 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
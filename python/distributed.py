@@ -0,0 +1,506 @@
+from __future__ import annotations
+from menu import PluginCommands
+from inputs import Board
+from program import Program
+from treeops import nodeFamily
+from solverCommands import SolverCommmand
+from typing import Callable
+from collections import deque
+import framing
+import threading
+import asyncio
+import socket
+import json
+import time
+import unittest
+import os
+
+# spreads the files of a batch command over solver machines: a coordinator splits the command into one task per .cfr file,
+# workers connect to it, pull a task at a time, run it on their own solver and send the result back.
+# the coordinator assembles the CSVs from the results in the order of the files, so they're identical to a single-machine run.
+#
+# messages are framed JSON (framing.py), over TCP ("host:port") or a Unix socket ("unix:/path"):
+#   worker -> coordinator: hello {name}, ready, heartbeat, notify {message, msg_type}, result {id, result, errors}
+#   coordinator -> worker: task {id, command, args, cfr, accuracy}, bye
+# a worker that closes its connection or misses heartbeats for heartbeatTimeout seconds is dropped and its task goes
+# back to the front of the queue for another worker; a task is given up after maxAttempts workers were lost on it.
+# if every worker is lost (or none ever connects) for workerTimeout seconds, the run fails instead of waiting forever.
+
+heartbeatInterval = 2.0
+heartbeatTimeout = 10.0
+maxAttempts = 3
+# a run with files left fails once no worker has been connected for this many seconds
+workerTimeout = 120.0
+
+wire = framing.framings["framed-json"]
+
+# the commands that can be distributed: the ones that run file by file
+distributableCommands = list(Program.nodelockSettings) + list(Program.runSettings)
+
+
+# "unix:/path" or "host:port" -> ["unix", path] or ["tcp", host, port]
+def parseAddress(address : str) -> list:
+    if address.startswith("unix:"):
+        return ["unix", address[len("unix:"):]]
+    host, _, port = address.rpartition(":")
+    if not port.isdigit():
+        raise Exception("Invalid address " + address + " - use host:port or unix:/path")
+    return ["tcp", host or "127.0.0.1", int(port)]
+
+
+async def connect(address : str):
+    kind = parseAddress(address)
+    if kind[0] == "unix":
+        return await asyncio.open_unix_connection(kind[1])
+    return await asyncio.open_connection(kind[1], kind[2])
+
+
+# command arguments as JSON: the Board enums of board files are sent by name
+def encodeArgs(value):
+    if isinstance(value, Board):
+        return {"board": value.name}
+    if isinstance(value, (list, tuple)):
+        return [encodeArgs(v) for v in value]
+    if isinstance(value, dict):
+        return {k: encodeArgs(v) for k, v in value.items()}
+    return value
+
+def decodeArgs(value):
+    if isinstance(value, dict):
+        if list(value) == ["board"]:
+            return Board[value["board"]]
+        return {k: decodeArgs(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [decodeArgs(v) for v in value]
+    return value
+
+
+# a task handed out to workers
+class Task():
+    def __init__(self, id : int, command : PluginCommands, args : list, cfr : str) -> None:
+        self.id = id
+        self.cfr = cfr
+        self.message = {"type": "task", "id": id, "command": command.name, "args": encodeArgs(args), "cfr": cfr}
+        self.attempts = 0
+        # {"result", "errors", "worker"} once finished
+        self.outcome : dict = None
+
+
+class WorkerState():
+    def __init__(self, name : str, writer : asyncio.StreamWriter) -> None:
+        self.name = name
+        self.writer = writer
+        self.last_seen = time.monotonic()
+        self.ready = False
+        self.task : Task = None
+
+    def send(self, message : dict) -> None:
+        self.writer.write(wire.encode(message))
+
+
+# hands out the tasks of submitted commands to connected workers, on an event loop in its own thread.
+# it also stands in for the solver connection of a DistributedProgram (accuracy, exit)
+class Coordinator():
+
+    def __init__(self, address : str = "127.0.0.1:0", notify : Callable = print, timeout : float = None, worker_timeout : float = None) -> None:
+        self.address = address
+        self.notify = notify
+        self.timeout = timeout or heartbeatTimeout
+        self.worker_timeout = worker_timeout or workerTimeout
+        self.accuracy = 0.2
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.server = None
+        self.workers : list[WorkerState] = []
+        self.tasks : dict[int, Task] = {}
+        self.pending : deque[Task] = deque()
+        self.next_id = 0
+        self.finished = threading.Condition()
+        # why the run can't complete, once it can't
+        self.failure : str = None
+        self.alone_since = time.monotonic()
+
+    # starts listening; address is then the one actually bound (e.g. the port picked for port 0)
+    def start(self) -> str:
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.listen(), self.loop).result()
+        return self.address
+
+    async def listen(self) -> None:
+        kind = parseAddress(self.address)
+        if kind[0] == "unix":
+            if os.path.exists(kind[1]):
+                os.remove(kind[1])
+            self.server = await asyncio.start_unix_server(self.serve, kind[1])
+        else:
+            self.server = await asyncio.start_server(self.serve, kind[1], kind[2])
+            host, port = self.server.sockets[0].getsockname()[:2]
+            self.address = host + ":" + str(port)
+        self.monitoring = self.loop.create_task(self.monitor())
+
+    # queues a task for every file of a command
+    # returns the task ID of each file, by file name
+    def submit(self, command : PluginCommands, args : list) -> dict[str, int]:
+        folder, cfrFiles = args[0]
+        tasks = []
+        for cfr in cfrFiles:
+            task = Task(self.next_id, command, [[folder, [cfr]]] + list(args[1:]), cfr)
+            self.next_id += 1
+            # update_accuracy keeps a Decimal, which isn't JSON
+            task.message["accuracy"] = float(self.accuracy)
+            tasks.append(task)
+        def queue():
+            for task in tasks:
+                self.tasks[task.id] = task
+                self.pending.append(task)
+            self.dispatch()
+        self.loop.call_soon_threadsafe(queue)
+        return {task.cfr: task.id for task in tasks}
+
+    # blocks until a task is finished; returns {"result", "errors", "worker"}
+    # raises if the run failed first (see fail)
+    def wait(self, id : int) -> dict:
+        with self.finished:
+            self.finished.wait_for(lambda: self.failure is not None or (id in self.tasks and self.tasks[id].outcome is not None))
+            if id in self.tasks and self.tasks[id].outcome is not None:
+                return self.tasks[id].outcome
+            raise Exception(self.failure)
+
+    # fails the run: waits for unfinished tasks raise with reason. can be called from any thread
+    def fail(self, reason : str) -> None:
+        with self.finished:
+            if self.failure is None:
+                self.failure = reason
+                self.notify(reason, "error")
+            self.finished.notify_all()
+
+    # says bye to the workers and stops listening
+    def stop(self) -> None:
+        if not self.thread.is_alive():
+            return
+        asyncio.run_coroutine_threadsafe(self.close(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.loop.close()
+
+    # as a solver connection
+    def exit(self) -> None:
+        self.stop()
+
+    def is_alive(self) -> bool:
+        return self.thread.is_alive()
+
+    # ---------- on the event loop ----------
+
+    async def close(self) -> None:
+        for worker in self.workers:
+            worker.send({"type": "bye"})
+            worker.writer.close()
+        if self.server is not None:
+            self.server.close()
+        self.monitoring.cancel()
+        # the workers' handlers end once their closed connections are seen
+        await asyncio.sleep(0.05)
+
+    async def serve(self, reader : asyncio.StreamReader, writer : asyncio.StreamWriter) -> None:
+        worker = WorkerState("worker", writer)
+        self.workers.append(worker)
+        try:
+            while True:
+                message = await wire.read(reader)
+                if message is None:
+                    break
+                worker.last_seen = time.monotonic()
+                kind = message.get("type")
+                if kind == "hello":
+                    worker.name = message.get("name") or worker.name
+                    self.notify(worker.name + " connected.")
+                elif kind == "ready":
+                    worker.ready = True
+                elif kind == "notify":
+                    self.notify("[" + worker.name + "] " + str(message.get("message")), message.get("msg_type", "notification"))
+                elif kind == "result":
+                    self.finish(self.tasks.get(message.get("id")), {"result": message.get("result"), "errors": message.get("errors") or [], "worker": worker.name})
+                    if worker.task is not None and worker.task.id == message.get("id"):
+                        worker.task = None
+                if kind in ["ready", "result"]:
+                    self.dispatch()
+        except (ConnectionError, ValueError) as e:
+            self.notify("Lost " + worker.name + ": " + str(e))
+        finally:
+            self.drop(worker)
+
+    # gives the next pending task to each idle worker
+    def dispatch(self) -> None:
+        for worker in self.workers:
+            while worker.ready and worker.task is None and self.pending:
+                task = self.pending.popleft()
+                if task.outcome is not None:
+                    continue
+                task.attempts += 1
+                worker.task = task
+                worker.send(task.message)
+
+    # drops workers whose heartbeats stopped, and fails the run if there have been none for worker_timeout
+    async def monitor(self) -> None:
+        while True:
+            await asyncio.sleep(min(heartbeatInterval, self.timeout / 2))
+            now = time.monotonic()
+            for worker in list(self.workers):
+                if now - worker.last_seen > self.timeout:
+                    self.notify(worker.name + " stopped responding.")
+                    worker.writer.close()
+                    self.drop(worker)
+            if self.workers or all(task.outcome is not None for task in self.tasks.values()):
+                self.alone_since = now
+            elif now - self.alone_since > self.worker_timeout:
+                self.fail("No workers connected for " + str(round(self.worker_timeout)) + " seconds.")
+
+    # forgets a worker; its task goes back to the front of the queue, unless it was already tried maxAttempts times
+    def drop(self, worker : WorkerState) -> None:
+        if worker not in self.workers:
+            return
+        self.workers.remove(worker)
+        task, worker.task = worker.task, None
+        if task is not None and task.outcome is None:
+            if task.attempts >= maxAttempts:
+                self.finish(task, {"result": None, "errors": [task.cfr + " was given up after " + str(task.attempts) + " workers were lost running it."], "worker": worker.name})
+            else:
+                self.notify("Giving " + task.cfr + " to another worker.")
+                self.pending.appendleft(task)
+        self.dispatch()
+
+    # only the first result of a task counts; one from a worker that was dropped as unresponsive and came back is ignored
+    def finish(self, task : Task, outcome : dict) -> None:
+        if task is None or task.outcome is not None:
+            return
+        with self.finished:
+            task.outcome = outcome
+            self.finished.notify_all()
+
+
+# connects to a coordinator and runs its tasks one at a time until it says bye or the connection closes.
+# run(task, notify) runs a task message and returns [result, errors]; it's called on a thread of its own,
+# so heartbeats keep going while the solver works
+class Worker():
+
+    def __init__(self, address : str, run : Callable, name : str = None, heartbeat : float = None, connect_timeout : float = 60) -> None:
+        self.address = address
+        self.run_task = run
+        self.name = name or socket.gethostname() + ":" + str(os.getpid())
+        self.heartbeat = heartbeat or heartbeatInterval
+        self.connect_timeout = connect_timeout
+        self.tasks_run = 0
+
+    def run(self) -> None:
+        asyncio.run(self.serve())
+
+    async def serve(self) -> None:
+        # the coordinator may not be up yet
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                reader, writer = await connect(self.address)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(1)
+        loop = asyncio.get_running_loop()
+        def send(message):
+            if not writer.is_closing():
+                writer.write(wire.encode(message))
+        def notify(message, msg_type = "notification"):
+            # progress only; the coordinator has its own ETAs and results
+            if msg_type == "notification":
+                loop.call_soon_threadsafe(send, {"type": "notify", "message": message, "msg_type": msg_type})
+
+        heartbeats = loop.create_task(self.heartbeats(send))
+        send({"type": "hello", "name": self.name})
+        send({"type": "ready"})
+        try:
+            while True:
+                message = await wire.read(reader)
+                if message is None or message.get("type") == "bye":
+                    break
+                if message.get("type") == "task":
+                    result, errors = await loop.run_in_executor(None, self.run_task, message, notify)
+                    self.tasks_run += 1
+                    send({"type": "result", "id": message["id"], "result": json.loads(json.dumps(result, default=str)), "errors": errors})
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            heartbeats.cancel()
+            writer.close()
+
+    async def heartbeats(self, send) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            send({"type": "heartbeat"})
+
+
+# runs a task message on a worker's Program, as run_file does for watch mode.
+# folder : the worker's copy of the coordinator's folder, if it's mounted somewhere else
+def runTask(program : Program, task : dict, folder : str = None) -> list:
+    command = PluginCommands[task["command"]]
+    args = decodeArgs(task["args"])
+    if folder:
+        args[0] = [folder, args[0][1]]
+    folder, cfr = args[0][0], task["cfr"]
+    program.errors = []
+    program.tree = None
+    program.connection.accuracy = task["accuracy"]
+    program.set_run_context(command, args)
+    try:
+        settings = Program.file_settings(command, args, copy_weights = False)
+    except Exception as e:
+        return [None, [str(e)]]
+    started = program.start_file()
+    result = program.run_file(SolverCommmand(program.connection), command, settings, folder, cfr)
+    program.finish_file(None, 0, folder, cfr, started, settings["save_type"], result is not None)
+    if result and command in Program.runSettings:
+        result = [[vars(family), line] for family, line in result]
+    return [result, list(program.errors)]
+
+
+# workers on threads of this process, each with its own solver, for running a batch on several local solver processes
+# (see autotune.py). spawn() starts a solver connection for one worker; if it fails, or a worker can't reach the
+# coordinator, the coordinator's run fails rather than waiting for a worker that will never come
+def startLocalWorkers(coordinator : Coordinator, count : int, spawn : Callable, use_cache : bool = True) -> list[threading.Thread]:
+    def work(name):
+        try:
+            connection = spawn()
+        except Exception as e:
+            coordinator.fail(name + " could not start its solver: " + str(e))
+            return
+        program = Program(connection, print)
+        program.use_cache = use_cache
+        def run(task, notify):
+            program.notify = notify
+            return runTask(program, task)
+        try:
+            Worker(coordinator.address, run, name).run()
+        except Exception as e:
+            coordinator.fail(name + " stopped: " + str(e))
+        finally:
+            connection.exit()
+    threads = [threading.Thread(target=work, args=["solver " + str(i + 1)], daemon=True) for i in range(count)]
+    for t in threads:
+        t.start()
+    return threads
+
+
+# a Program whose folder commands are run by workers: the command is submitted to the coordinator, then run as usual,
+# except that each file's results are waited for instead of computed, so titles, CSVs and streamed rows come out as on one machine
+class DistributedProgram(Program):
+
+    def __init__(self, coordinator : Coordinator, notify_func : Callable):
+        super().__init__(coordinator, notify_func)
+        self.coordinator = coordinator
+        self.task_ids : dict[str, int] = {}
+
+    def commandRun(self, inputtedCommand : PluginCommands, inputtedArgs : list[str] = None):
+        if inputtedCommand in distributableCommands:
+            # checked and the output folder made here, so a bad weights or board file fails before anything is sent
+            Program.file_settings(inputtedCommand, inputtedArgs, copy_weights = False)
+            self.task_ids = self.coordinator.submit(inputtedCommand, inputtedArgs)
+        elif inputtedCommand not in [PluginCommands.SET_ACCURACY, PluginCommands.END]:
+            raise Exception(inputtedCommand.value.name + " cannot be distributed.")
+        super().commandRun(inputtedCommand, inputtedArgs)
+
+    # the result of a file from whichever worker ran it; the worker's errors become this command's
+    def remote(self, cfr : str):
+        outcome = self.coordinator.wait(self.task_ids[cfr])
+        for e in outcome["errors"]:
+            self.errors.append(e)
+            self.notify(e)
+        return outcome["result"]
+
+    def run_cfr_file(self, pio : SolverCommmand, folder : str, cfr : str, nodeBook, solveFirst = True, needsLoading = True, save_type = None):
+        results = self.run_cfr_matches(pio, folder, cfr, nodeBook, solveFirst, save_type)
+        return results[0] if results else None
+
+    def run_cfr_matches(self, pio : SolverCommmand, folder : str, cfr : str, nodeBook, solveFirst = True, save_type = None):
+        results = self.remote(cfr)
+        return [[nodeFamily(**family), line] for family, line in results] if results else None
+
+    def nodelock_file(self, pio : SolverCommmand, folder : str, cfr : str, nodeBook, weights_map : dict, path : str, save_type = None, solve = False):
+        return self.remote(cfr)
+
+
+class Tests(unittest.TestCase):
+
+    def setUp(self):
+        self.coordinator = Coordinator(notify = lambda message, msg_type = "notification": None, timeout = 0.5)
+        self.coordinator.start()
+        self.threads = []
+
+    def tearDown(self):
+        self.coordinator.stop()
+        for t in self.threads:
+            t.join(5)
+
+    def startWorker(self, run, name, heartbeat = 0.1) -> Worker:
+        worker = Worker(self.coordinator.address, run, name, heartbeat)
+        thread = threading.Thread(target=worker.run, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+        return worker
+
+    def testResultsInOrder(self):
+        def run(task, notify):
+            time.sleep(0.01 * (len(task["cfr"]) % 3))
+            return [[task["cfr"], task["args"][1][1]], []]
+        workers = [self.startWorker(run, "w" + str(i)) for i in range(3)]
+        files = ["f" * i + ".cfr" for i in range(1, 10)]
+        ids = self.coordinator.submit(PluginCommands.GET_RESULTS, [["C:\\trees", files], ["r:0:c", Board.FLOP, "board.json"]])
+        outcomes = [self.coordinator.wait(ids[cfr]) for cfr in files]
+        self.assertEqual([o["result"] for o in outcomes], [[cfr, {"board": "FLOP"}] for cfr in files])
+        self.assertEqual(sum(w.tasks_run for w in workers), len(files))
+
+    def testLostWorkerTaskIsReassigned(self):
+        # the first worker hangs on its task without heartbeats; its task goes to the second once it's dropped
+        release = threading.Event()
+        def hang(task, notify):
+            release.wait(10)
+            return ["late", []]
+        self.startWorker(hang, "stuck", heartbeat = 60)
+        time.sleep(0.2)
+        ids = self.coordinator.submit(PluginCommands.RUN_AUTO, [["C:\\trees", ["a.cfr"]], ["r:0", Board.TURN, "board.json"]])
+        time.sleep(0.2)
+        self.startWorker(lambda task, notify: ["on time", ["an error"]], "healthy")
+        outcome = self.coordinator.wait(ids["a.cfr"])
+        release.set()
+        self.assertEqual(outcome, {"result": "on time", "errors": ["an error"], "worker": "healthy"})
+
+    def testAccuracyIsSent(self):
+        from decimal import Decimal
+        self.coordinator.accuracy = Decimal("0.25")
+        self.startWorker(lambda task, notify: [task["accuracy"], []], "w")
+        ids = self.coordinator.submit(PluginCommands.RUN_AUTO, [["C:\\trees", ["a.cfr"]], ["r:0", Board.TURN, "board.json"]])
+        self.assertEqual(self.coordinator.wait(ids["a.cfr"])["result"], 0.25)
+
+    def testNoWorkersFails(self):
+        self.coordinator.worker_timeout = 0.3
+        ids = self.coordinator.submit(PluginCommands.RUN_AUTO, [["C:\\trees", ["a.cfr"]], ["r:0", Board.TURN, "board.json"]])
+        with self.assertRaisesRegex(Exception, "No workers"):
+            self.coordinator.wait(ids["a.cfr"])
+
+    def testLocalWorkerSpawnFails(self):
+        def spawn():
+            raise Exception("no such solver")
+        startLocalWorkers(self.coordinator, 2, spawn)
+        ids = self.coordinator.submit(PluginCommands.RUN_AUTO, [["C:\\trees", ["a.cfr"]], ["r:0", Board.TURN, "board.json"]])
+        with self.assertRaisesRegex(Exception, "could not start its solver: no such solver"):
+            self.coordinator.wait(ids["a.cfr"])
+
+    def testArgs(self):
+        args = [["C:\\trees", ["a.cfr"]], ["weights.json", {"AA": 0.5}], [{"a.cfr": "r:0:c"}, Board.RIVER, "board.json"]]
+        self.assertEqual(decodeArgs(json.loads(json.dumps(encodeArgs(args)))), args)
+        self.assertEqual(parseAddress("unix:/tmp/piospeed.sock"), ["unix", "/tmp/piospeed.sock"])
+        self.assertEqual(parseAddress(":7000"), ["tcp", "127.0.0.1", 7000])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -31,11 +31,20 @@ class Errors():
     noRootNode = "The node ID needs to start with a valid root node \"r:0\""
     needsSpecificFileInfo = "This board file has turn or river nodes or bets of unspecfied size. You need to add rows that specify these for each .cfr file."
     nonNumericBetError = "Bet size needs to be numeric."
+    selectorOnlyInResults = "Board files with wildcards (*) can only be used to get results (run_mini, run_full, get_results)."
+    
+    @staticmethod
+    def noMatchingNodes (selector : str):
+        return "No node in this tree matches " + selector + "."
     # weights JSON format errors
     
     @staticmethod
     def invalidCategory (category : str):
-        return "JSON file with category weights not valid - "  + category + " is neither a hand nor a draw category"
+        return "JSON file with category weights not valid - "  + category + " is not a hand or draw category, hand class (AKs, 76o, Ax, pairs) or combo (AhKh)"
+
+    @staticmethod
+    def invalidCard (card : str):
+        return card + " is not a valid card."
     
     @staticmethod
     def noNegativeWeights (category : str):
@@ -43,6 +52,11 @@ class Errors():
     
     numericWeights = "All weights need to be numeric"
     
+    # weight grids
+    oneSweptCategory = "Only one key in a weights file can have a list of weights to sweep over."
+    noSweptCategory = "weight_sweep needs a weights file where one key has a list of weights to sweep over, e.g. \"bdfd_2card\": [0, 50, 100]"
+    sweepOnlyInWeightSweep = "Weights files with a list of weights can only be used with weight_sweep."
+    
    
     
 
@@ -0,0 +1,151 @@
+from __future__ import annotations
+import asyncio
+import struct
+import json
+import os
+import unittest
+
+# msgpack is optional; without it only the JSON encodings are offered
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# print every message sent and received (truncated); leave off for large batches. PIOSPEED_DEBUG=1 turns it on
+debugLog = os.environ.get("PIOSPEED_DEBUG") == "1"
+debugLength = 200
+
+# largest frame accepted from the other side, so a corrupt length prefix can't make us allocate gigabytes
+maxFrameSize = 256 * 1024 * 1024
+
+
+# the stream can't be read on from here (a frame too large, a line past the reader's limit): the connection has to be closed
+class FramingError(ValueError):
+    pass
+
+
+def logMessage(direction : str, message : dict) -> None:
+    if debugLog:
+        text = str(message)
+        if len(text) > debugLength:
+            text = text[:debugLength] + "... (" + str(len(text)) + " chars)"
+        print("Python " + direction + ": " + text)
+
+
+# how messages are turned into bytes on the socket.
+class Framing():
+    name = ""
+
+    def encode(self, message : dict) -> bytes:
+        raise NotImplementedError
+
+    # reads one message; returns None when the other side closed the connection
+    async def read(self, reader : asyncio.StreamReader) -> dict:
+        raise NotImplementedError
+
+
+# the original protocol: one JSON object per line
+class JSONLines(Framing):
+    name = "json"
+
+    def encode(self, message : dict) -> bytes:
+        return (json.dumps(message) + "\n").encode("utf-8")
+
+    async def read(self, reader : asyncio.StreamReader) -> dict:
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError as e:
+                raise FramingError(str(e))
+            if not line:
+                return None
+            if line.strip():
+                return json.loads(line)
+
+
+# each message is a 4 byte big-endian length followed by the encoded payload, so payloads are
+# never scanned for delimiters and can be read with a single readexactly
+class LengthPrefixed(Framing):
+    header = struct.Struct(">I")
+
+    def __init__(self, name : str, dumps, loads) -> None:
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+
+    def encode(self, message : dict) -> bytes:
+        payload = self.dumps(message)
+        return LengthPrefixed.header.pack(len(payload)) + payload
+
+    async def read(self, reader : asyncio.StreamReader) -> dict:
+        try:
+            header = await reader.readexactly(LengthPrefixed.header.size)
+            length = LengthPrefixed.header.unpack(header)[0]
+            if length > maxFrameSize:
+                raise FramingError("Frame of " + str(length) + " bytes is larger than the maximum of " + str(maxFrameSize))
+            return self.loads(await reader.readexactly(length))
+        except asyncio.IncompleteReadError:
+            return None
+
+
+def _jsonDumps(message : dict) -> bytes:
+    return json.dumps(message, separators=(",", ":")).encode("utf-8")
+
+
+# framings this process can speak, by name
+framings : dict[str, Framing] = {
+    "json": JSONLines(),
+    "framed-json": LengthPrefixed("framed-json", _jsonDumps, json.loads),
+}
+if msgpack is not None:
+    framings["framed-msgpack"] = LengthPrefixed("framed-msgpack", lambda m: msgpack.packb(m, use_bin_type=True), lambda b: msgpack.unpackb(b, raw=False))
+
+default = framings["json"]
+
+
+# picks the first of the client's preferred framings that is supported here (falls back to plain JSON lines)
+def negotiate(offered) -> Framing:
+    if isinstance(offered, str):
+        offered = [offered]
+    for name in offered or []:
+        if name in framings:
+            return framings[name]
+    return default
+
+
+class Tests(unittest.TestCase):
+
+    def roundTrip(self, framing : Framing, messages : list[dict]) -> list[dict]:
+        async def run():
+            reader = asyncio.StreamReader()
+            for m in messages:
+                reader.feed_data(framing.encode(m))
+            reader.feed_eof()
+            received = []
+            while True:
+                m = await framing.read(reader)
+                if m is None:
+                    return received
+                received.append(m)
+        return asyncio.run(run())
+
+    def testRoundTrip(self):
+        messages = [{"type": "notification", "data": "line\nbreak"}, {"type": "grid", "data": [0.5] * 1326}]
+        for framing in framings.values():
+            self.assertEqual(self.roundTrip(framing, messages), messages)
+
+    def testOversizeFrame(self):
+        async def run():
+            reader = asyncio.StreamReader()
+            reader.feed_data(LengthPrefixed.header.pack(maxFrameSize + 1) + b"{}")
+            await framings["framed-json"].read(reader)
+        self.assertRaises(FramingError, asyncio.run, run())
+
+    def testNegotiate(self):
+        self.assertEqual(negotiate(None).name, "json")
+        self.assertEqual(negotiate(["nonsense", "framed-json"]).name, "framed-json")
+        self.assertEqual(negotiate("framed-json").name, "framed-json")
+
+
+if __name__ == '__main__':
+    unittest.main()
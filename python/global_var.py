@@ -1,5 +1,6 @@
 import os
 
+# the tables describing each combo in pio's ordering are in combos.py
 totalCombos = 1326
 
 exception_categories = {"bdfd_1card": 1,
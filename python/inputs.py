@@ -4,6 +4,8 @@ from global_var import hand_category_index, draw_category_index, exception_categ
 from fileIO import JSONtoMap
 from stringFunc import parseNodeIDtoList, toFloat
 from errorMessages import Errors
+from combos import isValidSelector
+import unittest
 import os
 
 
@@ -84,22 +86,37 @@ class WeightsFile (FileInput):
     
     # input: a file path from the interface
     # output: a map of valid category names and their corresponding weights
+    # besides categories, a key can be a hand class or combo and can combine them, e.g. "top_pair&Ax@h,AKs" (see combos.py)
+    # one key can have a list of weights instead of one, a grid for weight_sweep
     def parseInput(self, input : str) -> dict[str, int] :
         input = super().parseInput(input)
         weightMap : dict = JSONtoMap(input)
         
         for category_name in weightMap:
-            validName : bool = category_name in hand_category_index or category_name in draw_category_index
+            validName : bool = category_name in hand_category_index or category_name in draw_category_index or isValidSelector(category_name)
             if not validName:
                 raise Exception(Errors.invalidCategory(category_name))
-            weight = toFloat(str(weightMap.get(category_name)))
-            if type(weight) is str: 
-                raise Exception(Errors.numericWeights)
-            
-            if weight < 0 and category_name not in exception_categories:
-                raise Exception(Errors.noNegativeWeights(category_name))
+            weights = weightMap.get(category_name)
+            if type(weights) is not list:
+                weights = [weights]
+            for w in weights:
+                weight = toFloat(str(w))
+                if type(weight) is str: 
+                    raise Exception(Errors.numericWeights)
+                
+                if weight < 0 and category_name not in exception_categories:
+                    raise Exception(Errors.noNegativeWeights(category_name))
+        WeightsFile.sweptCategory(weightMap)
         return [input, weightMap]
     
+    # the key of a weights map that has a list of weights, or None
+    @staticmethod
+    def sweptCategory(weightMap : dict) -> str:
+        swept = [k for k in weightMap if type(weightMap[k]) is list]
+        if len(swept) > 1:
+            raise Exception(Errors.oneSweptCategory)
+        return swept[0] if swept else None
+    
 
 class Decisions(Enum):
         ROOT = "r:0"
@@ -111,6 +128,9 @@ class Decisions(Enum):
         TURN = "turn"
         RIVER = "river"
         FOLD = "f"
+        # wildcards: any one action or card, and a bet of any size
+        ANY = "*"
+        ANY_BET = "b*"
         
         def __str__(self):
             return self.value
@@ -157,13 +177,26 @@ class BoardFile(FileInput):
     @staticmethod
     # checks that there are no decisions that require specifices in one line boards
     def hasNoSpecificDecisions (nodeID : str) -> str: 
-        decisions = BoardFile.makeDecisionList(nodeID)
+        decisions, board_type = BoardFile.makeDecisionList(nodeID)
         
         for d in decisions:
             if d in [Decisions.BET, Decisions.TURN, Decisions.RIVER]:
                 # append the following 
                 raise Exception(Errors.needsSpecificFileInfo)
-        return [nodeID, Board.FLOP]
+        if BoardFile.isSelector(nodeID):
+            board_type = BoardFile.selectorBoardType(decisions)
+        return [nodeID, board_type]
+
+    # a node ID with wildcards selects every node of a tree that matches it
+    @staticmethod
+    def isSelector(nodeID : str) -> bool:
+        return Decisions.ANY.value in nodeID
+
+    @staticmethod
+    def hasSelectors(nodeBook) -> bool:
+        if type(nodeBook) is dict:
+            return any(BoardFile.isSelector(n) for n in nodeBook.values())
+        return type(nodeBook) is str and BoardFile.isSelector(nodeBook)
 
     @staticmethod
     def getLastDecision(nodeID : str) :
@@ -179,6 +212,8 @@ class BoardFile(FileInput):
             nodeIDPerFile[b] = ""
         
         decisions, board_type  = BoardFile.makeDecisionList(nodeID)
+        if BoardFile.isSelector(nodeID):
+            board_type = Board(max(board_type.value, BoardFile.selectorBoardType(decisions).value))
   
         for n in nodeIDPerFile:
             for d in decisions:
@@ -188,6 +223,8 @@ class BoardFile(FileInput):
                     nodeIDPerFile[n] = nodeIDPerFile[n] + d.value + ":"
                 if d == Decisions.BET_SIZE:
                     nodeIDPerFile[n] = nodeIDPerFile[n] + d.value 
+                elif d in [Decisions.ANY, Decisions.ANY_BET]:
+                    nodeIDPerFile[n] = nodeIDPerFile[n] + d.value + ":"
                 elif type(d) is str:
                     nodeIDPerFile[n] = nodeIDPerFile[n] + d + ":"
                 elif d in [Decisions.TURN, Decisions.RIVER]: 
@@ -231,10 +268,45 @@ class BoardFile(FileInput):
         
         return [decisionList, board_type]
     
+    # the deepest street the nodes a selector matches, or their children, can be on. a wildcard deals the next card
+    # where the street's betting is over, so every way the wildcards can be read is followed:
+    # each state is [street (0 for the flop), the street's betting so far: "", "checked", "bet", "closed" or "folded"]
+    @staticmethod
+    def selectorBoardType(decisions : list) -> Board:
+        states = [[0, ""]]
+        for d in decisions:
+            if type(d) is str or d == Decisions.ROOT:
+                continue
+            following = []
+            for street, betting in states:
+                if d in [Decisions.TURN, Decisions.RIVER]:
+                    following.append([street + 1, ""])
+                elif betting == "closed":
+                    if d == Decisions.ANY:
+                        following.append([street + 1, ""])
+                elif betting == "folded":
+                    continue
+                elif d == Decisions.CHECK:
+                    following.append([street, "checked" if betting == "" else "closed"])
+                elif d in [Decisions.BET, Decisions.BET_SIZE, Decisions.ANY_BET]:
+                    following.append([street, "bet"])
+                elif d == Decisions.FOLD:
+                    following.append([street, "folded"])
+                elif d == Decisions.ANY:
+                    following.extend([[street, "checked" if betting == "" else "closed"], [street, "bet"], [street, "folded"]])
+            states = following or states
+        # the children of a node where the betting is over are the cards of the next street
+        deepest = max(street + 1 if betting == "closed" else street for street, betting in states)
+        return Board(min(Board.FLOP.value + deepest, Board.RIVER.value))
+
     @staticmethod
     def getDecisionType(node : str):
         if node == "r:0":
             return Decisions.ROOT
+        if node == Decisions.ANY.value:
+            return Decisions.ANY
+        if node == Decisions.ANY_BET.value:
+            return Decisions.ANY_BET
         first = node[:1]
         if first == "c" and (len(node) == 1):
             return Decisions.CHECK
@@ -254,3 +326,21 @@ class BoardFile(FileInput):
         raise Exception(Errors.invalid_node(node))
         
 
+
+class Tests(unittest.TestCase):
+
+    def testSelectorBoardType(self):
+        self.assertEqual(BoardFile.hasNoSpecificDecisions("r:0:c:b16"), ["r:0:c:b16", Board.FLOP])
+        self.assertEqual(BoardFile.hasNoSpecificDecisions("r:0:*")[1], Board.FLOP)
+        self.assertEqual(BoardFile.hasNoSpecificDecisions("r:0:b*:b*")[1], Board.FLOP)
+        # a call that closes the flop can be matched, and its children are turn cards
+        self.assertEqual(BoardFile.hasNoSpecificDecisions("r:0:c:b*:*")[1], Board.TURN)
+        self.assertEqual(BoardFile.hasNoSpecificDecisions("r:0:c:b*:c:*")[1], Board.TURN)
+        self.assertEqual(BoardFile.hasNoSpecificDecisions("r:0:c:c:*:c:c")[1], Board.RIVER)
+        self.assertEqual(BoardFile.hasNoSpecificDecisions("r:0:*:*:*:*:*")[1], Board.RIVER)
+        self.assertEqual(BoardFile.getSpecificNodeIDs("r:0:c:b:*", {"As5h3s": [16]}), [{"As5h3s": "r:0:c:b16:*"}, Board.TURN])
+        self.assertRaises(Exception, BoardFile.hasNoSpecificDecisions, "r:0:c:c:turn")
+
+
+if __name__ == '__main__':
+    unittest.main()
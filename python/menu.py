@@ -63,6 +63,32 @@ class PluginCommands(Enum):
                   [CFRFolder()],
                             "")
     
+    RUN_PROGRESSIVE = Command("run_progressive",
+                  [CFRFolder(),
+                   BoardFile()],
+                  "solves every file coarsely first, publishes results, then refines them in passes at tighter accuracies")
+    
+    EXTRACT_SUBTREES = Command("extract_subtrees",
+                  [CFRFolder(),
+                   BoardFile()],
+                            "Re-roots every file at the board file node and solves the subtrees into a new folder.")
+    
+    PREFLIGHT = Command("preflight",
+                       [CFRFolder(),
+                        WeightsFile(),
+                        BoardFile()],
+                       "Checks every file's node and weights before a long run, without solving anything.")
+    
+    WEIGHT_SWEEP = Command("weight_sweep",
+                       [CFRFolder(),
+                        WeightsFile(),
+                        BoardFile()],
+                       "Nodelocks every file at each weight in a grid for one category and tabulates EVs and frequencies against the weight.")
+    
+    AUTOTUNE = Command("autotune",
+                  [CFRFolder()],
+                       "Times a sample of the files with different numbers of solver processes and threads, and keeps the fastest for later runs on files like these.")
+    
     SET_ACCURACY = Command("set_accuracy", [Input(InputType.accuracy)],
                        "Allows you to change accuracy of solver (default is .002)")
     
@@ -0,0 +1,198 @@
+from __future__ import annotations
+from stringFunc import timestamp
+import collections
+import tracemalloc
+import threading
+import cProfile
+import unittest
+import pstats
+import time
+import sys
+import io
+import os
+
+# profiles one command run, to see whether the time goes to python (parsing output, building weights...) or to the solver.
+#   deterministic - cProfile: every call in the thread that runs the command, exact counts
+#   sampling      - the stack of every thread every few milliseconds: lower overhead, and covers solver pools
+# allocations are tracked with tracemalloc either way.
+# nothing here is imported or started unless profiling is switched on for a command.
+profileModes = ["deterministic", "sampling"]
+
+# time spent in these functions is time spent waiting for the solver to answer
+solverWaits = [("solver.py", "read_line")]
+
+sampleInterval = 0.005
+topFunctions = 15
+
+
+def isSolverWait(filename : str, function : str) -> bool:
+    return any(filename.endswith(f) and function == name for f, name in solverWaits)
+
+# where a command's profile is saved: its cfr folder (next to the results), otherwise default or the working directory
+def artifactFolder(args : list, default : str = None) -> str:
+    if args and type(args[0]) is list and args[0] and type(args[0][0]) is str and os.path.isdir(args[0][0]):
+        return args[0][0]
+    return default or os.getcwd()
+
+def functionName(filename : str, line : int, function : str) -> str:
+    return function + " (" + os.path.basename(filename) + ":" + str(line) + ")"
+
+
+class Profiler():
+
+    def __init__(self, mode : str = "deterministic", memory : bool = True, interval : float = sampleInterval) -> None:
+        if mode not in profileModes:
+            raise Exception("Unknown profile mode " + str(mode) + ", expected one of " + ", ".join(profileModes))
+        self.mode = mode
+        self.memory = memory
+        self.interval = interval
+        self.started = None
+        self.seconds = 0
+        self.profile : cProfile.Profile = None
+        # sampling: (stack of (file, line, function), outermost first) -> number of samples
+        self.samples : collections.Counter = collections.Counter()
+        self.sampler : threading.Thread = None
+        self.stopped = threading.Event()
+        self.snapshot : tracemalloc.Snapshot = None
+        self.peak = 0
+
+    def start(self) -> None:
+        self.started = time.perf_counter()
+        if self.memory:
+            tracemalloc.start()
+        if self.mode == "deterministic":
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            self.stopped.clear()
+            self.sampler = threading.Thread(target=self.sample, daemon=True)
+            self.sampler.start()
+
+    def stop(self) -> None:
+        if self.profile is not None:
+            self.profile.disable()
+        if self.sampler is not None:
+            self.stopped.set()
+            self.sampler.join()
+        if self.memory and tracemalloc.is_tracing():
+            self.snapshot = tracemalloc.take_snapshot()
+            self.peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.seconds = time.perf_counter() - self.started
+
+    def sample(self) -> None:
+        me = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for thread, frame in sys._current_frames().items():
+                if thread == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append((frame.f_code.co_filename, frame.f_code.co_firstlineno, frame.f_code.co_name))
+                    frame = frame.f_back
+                self.samples[tuple(reversed(stack))] += 1
+
+    # the functions that took the most time themselves, as {function, seconds, calls (deterministic only)}
+    def hot(self, top : int = topFunctions) -> list[dict]:
+        if self.profile is not None:
+            stats = pstats.Stats(self.profile).stats
+            rows = [{"function": functionName(*f), "seconds": round(tt, 4), "cumulative": round(ct, 4), "calls": nc}
+                    for f, (cc, nc, tt, ct, callers) in stats.items()]
+        else:
+            own = collections.Counter()
+            for stack, n in self.samples.items():
+                own[stack[-1]] += n
+            rows = [{"function": functionName(*f), "seconds": round(n * self.interval, 4)} for f, n in own.items()]
+        rows.sort(key=lambda r: -r["seconds"])
+        return rows[:top]
+
+    # seconds spent waiting for the solver
+    def solver_wait(self) -> float:
+        if self.profile is not None:
+            stats = pstats.Stats(self.profile).stats
+            return round(sum(ct for f, (cc, nc, tt, ct, callers) in stats.items() if isSolverWait(f[0], f[2])), 4)
+        waiting = sum(n for stack, n in self.samples.items() if any(isSolverWait(f, name) for f, line, name in stack))
+        return round(waiting * self.interval, 4)
+
+    # the lines that allocated the most memory still held at the end, as {line, kb, blocks}
+    def allocations(self, top : int = topFunctions) -> list[dict]:
+        if self.snapshot is None:
+            return []
+        return [{"line": str(s.traceback[0]), "kb": round(s.size / 1024, 1), "blocks": s.count}
+                for s in self.snapshot.statistics("lineno")[:top]]
+
+    def summary(self, top : int = topFunctions) -> dict:
+        return {"mode": self.mode, "seconds": round(self.seconds, 4), "solver_wait": self.solver_wait(),
+                "hot": self.hot(top), "peak_memory_kb": round(self.peak / 1024, 1), "allocations": self.allocations(top)}
+
+    # writes the artifacts of this run to folder and returns their paths:
+    #   deterministic - profile_<time>.prof, readable with pstats or snakeviz
+    #   sampling      - profile_<time>.folded, one "outer;...;inner count" line per stack (flamegraph.pl / speedscope)
+    #   both          - profile_<time>.txt with the summary in plain text
+    def write(self, folder : str) -> list[str]:
+        base = folder + "\\profile_" + timestamp()
+        paths = []
+        if self.profile is not None:
+            self.profile.dump_stats(base + ".prof")
+            paths.append(base + ".prof")
+        else:
+            with open(base + ".folded", "w") as f:
+                for stack, n in self.samples.items():
+                    f.write(";".join(functionName(*frame) for frame in stack) + " " + str(n) + "\n")
+            paths.append(base + ".folded")
+        with open(base + ".txt", "w") as f:
+            f.write(self.report())
+        paths.append(base + ".txt")
+        return paths
+
+    def report(self) -> str:
+        out = io.StringIO()
+        summary = self.summary(top=40)
+        out.write(self.mode + " profile of " + str(summary["seconds"]) + "s, " + str(summary["solver_wait"]) + "s waiting for the solver\n\n")
+        if self.profile is not None:
+            pstats.Stats(self.profile, stream=out).sort_stats("tottime").print_stats(40)
+        else:
+            for row in summary["hot"]:
+                out.write(str(row["seconds"]).rjust(10) + "s  " + row["function"] + "\n")
+        if self.snapshot is not None:
+            out.write("\npeak memory " + str(summary["peak_memory_kb"]) + " KB, largest allocations still held:\n")
+            for row in summary["allocations"]:
+                out.write(str(row["kb"]).rjust(10) + " KB  " + row["line"] + "\n")
+        return out.getvalue()
+
+
+class Tests(unittest.TestCase):
+
+    def busy(self):
+        held = []
+        for i in range(20000):
+            held.append(str(i) * 3)
+        time.sleep(0.05)
+        return held
+
+    def testDeterministic(self):
+        profiler = Profiler("deterministic")
+        profiler.start()
+        self.busy()
+        profiler.stop()
+        summary = profiler.summary()
+        self.assertTrue(any(row["function"].startswith("busy ") for row in summary["hot"]))
+        self.assertGreater(summary["peak_memory_kb"], 0)
+        self.assertEqual(summary["solver_wait"], 0)
+
+    def testSampling(self):
+        profiler = Profiler("sampling", memory=False, interval=0.001)
+        worker = threading.Thread(target=self.busy)
+        profiler.start()
+        worker.start()
+        worker.join()
+        profiler.stop()
+        self.assertTrue(any("busy" in name for stack in profiler.samples for f, line, name in stack))
+        self.assertEqual(profiler.allocations(), [])
+
+    def testUnknownMode(self):
+        self.assertRaises(Exception, Profiler, "line")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,21 +1,53 @@
 from __future__ import annotations
 from menu import PluginCommands, Command
-from treeops import TreeOperator
-from inputs import WeightsFile, BoardFile, Board
-from stringFunc import removeExtension, timestamp, toFloat, get_file_name_from_path
+from treeops import TreeOperator, normalizeWeight, nodeFamily
+from inputs import WeightsFile, BoardFile, Board, Extension, InputType
+from stringFunc import removeExtension, timestamp, toFloat, get_file_name_from_path, parseStringToList, parseNodeIDtoList
+from combos import getBoardMasks, total
+import categories
 from SolverConnection.solver import Solver
+from SolverConnection.pool import SolverPool
+from SolverConnection.supervisor import SolverSupervisor, FakeSolver
 from solverCommands import SolverCommmand
 from typing import Callable, Any, Optional
-from fileIO import addRowstoCSV
+from decimal import Decimal
+from fileIO import addRowstoCSV, IO
+from watcher import FolderWatcher
+from runtimes import RuntimeHistory, Estimator, fileFeatures
+from resultCache import ResultCache
+from resultsDB import ResultsDB, weightsHash
+from treeIndex import TreeIndex, TreeIndexStore, crawl, selectFamilies
+from errorMessages import Errors
+import tracing
+import threading
+import queue
+import time
 import unittest
+import tempfile
+import csv
 import shutil
-import asyncio
+import os
 
 
 consoleLog = True
 
 class Program:
     
+    # per-file settings of the folder commands, used when a command is run file by file (e.g. in watch mode)
+    # nodelock commands: [solve after nodelocking, compressed save]
+    nodelockSettings = {
+        PluginCommands.NODELOCK_SOLVE: [True, False],
+        PluginCommands.NODELOCK_SOLVE_MINI: [True, True],
+        PluginCommands.NODELOCK: [False, True],
+        PluginCommands.NODELOCK_MINI: [False, True]}
+    # commands that get results at a node: [solve first, compressed save]
+    runSettings = {
+        PluginCommands.RUN_AUTO: [True, True],
+        PluginCommands.RUN_FULL_SAVE: [True, False],
+        PluginCommands.GET_RESULTS: [False, False]}
+    # accuracies of the passes of run_progressive, as multiples of the accuracy setting (the last pass reaches it)
+    progressiveSteps = [4, 2, 1]
+    
     def __init__(self, connection: Solver, notify_func: Callable[[str], None]):
         """
         Initialize the Program with a solver connection and notification function
@@ -34,22 +66,57 @@ class Program:
         self.pending_command = None
         self.pending_args = None
         
+        # what the last command produced, for summaries
+        self.results_paths : list[str] = []
+        self.errors : list[str] = []
+        # rows sent so far as 'result_row' messages, by table
+        self.streamed : dict[str, int] = {}
+        
+        # past per-file timings, for ETAs and scheduling; stages holds the seconds spent so far on the current file
+        self.history = RuntimeHistory()
+        self.stages : dict[str, float] = {}
+        self.current_command : str = None
+        self.board_name : str = None
+        # results of identical earlier runs; use_cache = False re-runs everything
+        self.cache = ResultCache()
+        self.use_cache = True
+        # topology indexes of trees by file contents, and the index of the tree loaded now (None if there isn't one)
+        self.trees = TreeIndexStore()
+        self.tree : TreeIndex = None
+        # every run, file and row is also recorded here; run_id is the current run's (None when it isn't recorded),
+        # run_files the [file ID, board] of each of its files
+        self.results_db = ResultsDB()
+        self.run_id : int = None
+        self.run_weights_hash : str = None
+        self.run_files : dict[str, list] = {}
+        # None, or the profiling.profileModes mode the next commands are run under
+        self.profile : str = None
+        # write a timeline of each command (tracing.py) next to its results
+        self.trace = tracing.traceEnabled
+        # set to stop a command that supports stopping (run_progressive) after the file it is working on
+        self.stop_requested = threading.Event()
+        # starts the solver processes a command uses besides the connection, from the solver's path
+        self.spawn = Solver
+        
         #maintain a mapping of the commands to the functions that run them
         self.commandDispatcher : dict[Command, Callable[[list[str]], None]] = { 
             PluginCommands.NODELOCK_SOLVE: self.nodelock_solve,
             PluginCommands.NODELOCK_SOLVE_MINI: self.nodelock_solve_mini,
             PluginCommands.RUN_AUTO: self.solve,
             PluginCommands.RUN_FULL_SAVE: self.solve_full,
+            PluginCommands.RUN_PROGRESSIVE: self.solve_progressive,
             PluginCommands.NODELOCK: self.nodelock,
+            # nodelock already saves with the size for the board type, which is what the mini commands do
+            PluginCommands.NODELOCK_MINI: self.nodelock,
             PluginCommands.GET_RESULTS: self.get_results,
             PluginCommands.SAVE_NO_RIVERS: self.resave_no_rivers,
             PluginCommands.SAVE_NO_TURNS: self.resave_no_turns,
+            PluginCommands.EXTRACT_SUBTREES: self.extract_subtrees,
+            PluginCommands.PREFLIGHT: self.preflight,
+            PluginCommands.WEIGHT_SWEEP: self.weight_sweep,
+            PluginCommands.AUTOTUNE: self.autotune,
             PluginCommands.SET_ACCURACY: self.update_accuracy,
             PluginCommands.END: self.end}
-         
-    async def start(self) -> None:
-        while True:
-            await self.commandRun()    
     
     def nodelock_solve_mini(self, args : list[str]):
         self.nodelock_get_results_save(args, solve=True, auto_size=True)
@@ -72,36 +139,395 @@ class Program:
             pio.run_until("free_tree", "free_tree ok!")
             self.notify("Resaved " + cfr + ".")
         
+    # args[0][0] : the folder path
+    # args[0][1] : list of .cfr files
+    # args[1] : map of category names -> weights
+    # args[2] : [either a string with the nodeID or a map with .cfr file names -> file-specific nodeIDs, board_type]
+    def preflight(self, args : list[str], workers : int = 2):
+        return self.preflight_check(args[0][0], args[0][1], args[2][0], args[1][1], workers)
+    
+    # checks every file before anything is solved: that the board file gives it a node, that the node exists and has
+    # sister actions to rebalance, that its sister and child actions are the ones most files of the batch have (the result
+    # columns are named after the first file's actions), and that every weights key selects combos in the acting player's
+    # range there. files are only loaded (not their forgotten streets) and are spread over a pool of solver processes.
+    # returns the report rows [file, node, status, problems] after writing them to a CSV in the folder
+    def preflight_check(self, folder : str, cfrFiles : list[str], nodeBook, weights_map : dict = None, workers : int = 2):
+        Program.single_nodes(nodeBook)
+        self.notify("Checking " + str(len(cfrFiles)) + " files before running...")
+        pool = SolverPool(self.connection.solverPath, size = min(workers, max(1, len(cfrFiles))), spawn = self.spawn)
+        try:
+            # loading dominates a preflight check, so the biggest files go first
+            sizes = [self.file_features(folder, cfr)["size"] for cfr in cfrFiles]
+            checked = pool.map(lambda solver, cfr: self.preflight_file(solver, folder, cfr, nodeBook, weights_map), cfrFiles, sizes)
+        finally:
+            pool.exit()
+        
+        rows = [c[0] if type(c) is list else [cfr, "", "problem", str(c)] for cfr, c in zip(cfrFiles, checked)]
+        Program.check_actions(rows, [c[1] if type(c) is list else None for c in checked])
+        failed = [row for row in rows if row[2] != "ok"]
+        for row in failed:
+            self.errors.append(row[0] + ": " + row[3])
+        
+        path = folder + "\\preflight_" + timestamp() + ".csv"
+        addRowstoCSV(path, [["File", "Node", "Status", "Problems"]] + rows)
+        self.results_paths.append(path)
+        self.notify("Preflight: " + str(len(rows) - len(failed)) + " of " + str(len(rows)) + " files are ready. Report saved to " + path)
+        return rows
+    
+    # runs on a pool process; returns [[file, node, "ok" or "problem", problems], actions (see node_actions) or None]
+    def preflight_file(self, solver, folder : str, cfr : str, nodeBook, weights_map : dict = None):
+        problems = []
+        nodeID = ""
+        actions = None
+        try:
+            nodeID = self.get_file_nodeID([cfr, nodeBook])
+            pio = SolverCommmand(solver)
+            pio.peek_tree(folder + "\\" + cfr)
+            try:
+                problems.extend(Program.check_node(solver, nodeID, weights_map))
+                actions = Program.node_actions(solver, nodeID)
+            finally:
+                solver.command("free_tree")
+        except Exception as e:
+            problems.append(str(e))
+        return [[cfr, nodeID, "problem" if problems else "ok", "; ".join(problems)], actions]
+    
+    # the actions of nodeID's sisters and children, as named in the result columns. the children of a chance node
+    # are cards, which differ from board to board, so they're left out (None)
+    @staticmethod
+    def node_actions(connection, nodeID : str) -> list:
+        treeOp = TreeOperator(connection)
+        family = treeOp.get_family(nodeID)
+        sisters = [BoardFile.getLastDecision(s) for s in family.sisters]
+        if treeOp.getNodeInfo(nodeID).type not in ["OOP_DEC", "IP_DEC"]:
+            return [sisters, None]
+        return [sisters, [BoardFile.getLastDecision(c) for c in family.children]]
+    
+    # marks the rows of files whose sister or child actions aren't the ones most checked files have
+    @staticmethod
+    def check_actions(rows : list[list], actions : list) -> None:
+        found = [str(a) for a in actions if a is not None]
+        if not found:
+            return
+        expected = max(set(found), key=found.count)
+        expectedActions = next(a for a in actions if str(a) == expected)
+        for row, a in zip(rows, actions):
+            if a is None or str(a) == expected:
+                continue
+            problems = []
+            if a[0] != expectedActions[0]:
+                problems.append("the actions at the node are " + ", ".join(a[0]) + " where most files have " + ", ".join(expectedActions[0]))
+            if a[1] != expectedActions[1] and a[1] is not None and expectedActions[1] is not None:
+                problems.append("the actions after the node are " + (", ".join(a[1]) or "none") + " where most files have " + (", ".join(expectedActions[1]) or "none"))
+            if not problems:
+                continue
+            row[2] = "problem"
+            row[3] = "; ".join([row[3]] + problems if row[3] else problems)
+    
+    # the problems with nodelocking nodeID in the loaded tree with weights_map
+    @staticmethod
+    def check_node(connection, nodeID : str, weights_map : dict = None) -> list[str]:
+        treeOp = TreeOperator(connection)
+        # raises if the node doesn't exist
+        family = treeOp.get_family(nodeID)
+        problems = []
+        if len(family.sisters) < 2:
+            problems.append(nodeID + " is the only action at " + family.parent + ", so there is nothing to rebalance")
+        if not weights_map:
+            return problems
+        
+        parent = treeOp.getNodeInfo(family.parent)
+        if parent.type not in ["OOP_DEC", "IP_DEC"]:
+            problems.append(family.parent + " is not a decision node")
+            return problems
+        player = parent.type.split("_")[0]
+        board = parent.board
+        masks = getBoardMasks(board, lambda: categories.forBoard(board, lambda: treeOp.showCategories(board)))
+        playerRange = parseStringToList(connection.command("show_range " + player + " " + family.parent)[0])
+        for key in weights_map:
+            if total(playerRange, masks.mask(key)) <= 0:
+                problems.append(key + " has no combos in " + player + "'s range at " + family.parent)
+        return problems
+    
+    # args[0][0] : the folder path
+    # args[0][1] : list of .cfr files
+    # args[1] : [either a string with the nodeID or a map with .cfr file names -> file-specific nodeIDs, board_type, path]
+    # a second solver process cuts the subtree out of file N+1 (load, build_tree at the node, dump) while this one solves the subtree of file N.
+    def extract_subtrees(self, args : list[str]):
+        folder, cfrFiles = args[0]
+        nodeBook, board_type = args[1][0], args[1][1]
+        Program.single_nodes(nodeBook)
+        path = Program.get_subtree_folder(args)
+        save_type = Program.get_save_type(board_type)
+        os.makedirs(path, exist_ok=True)
+        
+        extractor = self.spawn(self.connection.solverPath)
+        extractor.accuracy = self.connection.accuracy
+        # holds one extracted subtree at a time, so extraction stays a single file ahead of solving
+        extracted = queue.Queue(maxsize=1)
+        done = object()
+        stop = threading.Event()
+        
+        def extract_all():
+            try:
+                for cfr in cfrFiles:
+                    if stop.is_set():
+                        break
+                    with tracing.span(cfr, "extract"):
+                        subtree = self.extract_file(SolverCommmand(extractor), folder, cfr, nodeBook, path)
+                    extracted.put(subtree)
+            finally:
+                extracted.put(done)
+        
+        thread = threading.Thread(target=extract_all, daemon=True)
+        thread.start()
+        
+        pio = SolverCommmand(self.connection)
+        toCSV = [["File", "Node", "Subtree", "EVs at root", "EV OOP", "EV IP", "OOP MES", "IP MES"]]
+        eta = self.start_batch(folder, cfrFiles, save_type)
+        try:
+            while (item := extracted.get()) is not done:
+                if item is None:
+                    continue
+                cfr, nodeID, subtree = item
+                started = self.start_file()
+                thisLine = self.solve_subtree(pio, cfr, nodeID, subtree, save_type)
+                self.finish_file(eta, cfrFiles.index(cfr), folder, cfr, started, save_type, thisLine is not None)
+                if thisLine:
+                    toCSV.append(thisLine)
+                    self.stream_row("subtrees", toCSV[0], thisLine)
+        finally:
+            # if solving failed, let the extracting thread finish its current file and stop
+            stop.set()
+            while thread.is_alive():
+                try:
+                    extracted.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            extractor.exit()
+        
+        self.publish_results(path, toCSV)
+        return path
+    
+    # loads a file on the extracting solver and dumps the unsolved subtree rooted at the file's node
+    # returns [cfr, nodeID, subtree path], or None if the file was skipped
+    def extract_file(self, pio : SolverCommmand, folder : str, cfr : str, nodeBook, path : str):
+        nodeID = self.tryFunction(self.get_file_nodeID, [cfr, nodeBook])
+        if not nodeID:
+            return None
+        if not self.tryFunction(pio.load_tree, [folder + "\\" + cfr]):
+            return None
+        subtree = path + cfr
+        extractedTree = self.tryFunction(pio.createSubtree, [[nodeID]]) is not None and self.tryFunction(pio.saveTree, [[subtree]]) is not None
+        if pio.connection.is_alive():
+            self.tryFunction(pio.free_mem, [])
+        else:
+            # a failed command closed the extractor (SolverCommmand.tryPio); the next file needs it open again
+            pio.resetConnection()
+        if not extractedTree:
+            return None
+        self.notify("Extracted the subtree of " + cfr + " at " + nodeID + ".")
+        return [cfr, nodeID, subtree]
+    
+    # solves an extracted subtree and saves it over itself
+    # returns the CSV line for it, or None if it could not be solved
+    def solve_subtree(self, pio : SolverCommmand, cfr : str, nodeID : str, subtree : str, save_type = None):
+        if not self.timed("load", pio.load_tree, [subtree]):
+            return None
+        self.notify("Solving the subtree of " + cfr + " to an accuracy of " + str(self.connection.accuracy) + ".")
+        thisLine = [cfr, nodeID, subtree, "   "]
+        self.timed("solve", pio.solve, [])
+        evs = self.timed("results", pio.getEV, [])
+        if evs:
+            thisLine.extend(evs)
+        self.timed("save", pio.saveTree, [subtree, save_type])
+        self.tryFunction(pio.free_mem, [])
+        self.notify("Saved to: " + subtree)
+        return thisLine
+    
+    # args : the same arguments as extract_subtrees
+    # returns the folder extracted subtrees are saved to
+    @staticmethod
+    def get_subtree_folder(args : list) -> str:
+        nodeBook_file_name = get_file_name_from_path(args[1][2])
+        return args[0][0] + "\\" + "SUBTREES_" + removeExtension(nodeBook_file_name) + "\\"
+        
     # new accuracy of solverq
     def update_accuracy(self, args : list[str]):
         self.connection.accuracy = toFloat(args[0])
         
-    async def commandRun(self, inputtedCommand : Command = None, inputtedArgs : list[str] = None):
-        await self.commandDispatcher[inputtedCommand](inputtedArgs)
-        if (inputtedCommand != PluginCommands.END):
-            await self.commandRun()
-        else:
-            await self.end([])
+    # runs a command to completion; results_paths and errors describe what it produced
+    def commandRun(self, inputtedCommand : PluginCommands, inputtedArgs : list[str] = None):
+        self.results_paths = []
+        self.errors = []
+        self.streamed = {}
+        self.tree = None
+        self.stop_requested.clear()
+        self.set_run_context(inputtedCommand, inputtedArgs)
+        self.start_record(inputtedCommand, inputtedArgs)
+        status = "failed"
+        try:
+            if self.trace:
+                self.traced(inputtedCommand, inputtedArgs)
+            elif self.profile:
+                self.profiled(self.commandDispatcher[inputtedCommand], inputtedArgs)
+            else:
+                self.commandDispatcher[inputtedCommand](inputtedArgs)
+            status = "completed" if not self.errors else "completed with errors"
+        finally:
+            self.finish_record(status)
+    
+    # runs a command while recording a trace of it, with notifications as instant events, and saves the trace next to its results
+    def traced(self, inputtedCommand : PluginCommands, inputtedArgs : list):
+        from profiling import artifactFolder
+        notify = self.notify
+        def tracedNotify(message, msg_type = "notification"):
+            tracing.instant(message if type(message) is str else msg_type, msg_type)
+            notify(message, msg_type)
+        tracing.start()
+        self.notify = tracedNotify
+        try:
+            with tracing.span(self.current_command, "command"):
+                if self.profile:
+                    self.profiled(self.commandDispatcher[inputtedCommand], inputtedArgs)
+                else:
+                    self.commandDispatcher[inputtedCommand](inputtedArgs)
+        finally:
+            self.notify = notify
+            trace = tracing.stop()
+            path = artifactFolder(inputtedArgs) + "\\trace_" + timestamp() + ".json"
+            try:
+                trace.write(path)
+                self.notify("Saved trace to " + path + " (open it in chrome://tracing or ui.perfetto.dev)")
+            except OSError as e:
+                self.errors.append("Could not save the trace: " + str(e))
+    
+    # runs a command under the profiler, saves the artifacts next to its results and sends the hottest functions as a 'profile' message
+    def profiled(self, run, args : list):
+        from profiling import Profiler, artifactFolder
+        profiler = Profiler(self.profile)
+        profiler.start()
+        try:
+            run(args)
+        finally:
+            profiler.stop()
+            summary = profiler.summary()
+            try:
+                summary["files"] = profiler.write(artifactFolder(args))
+                self.notify("Saved profile to " + summary["files"][-1])
+            except OSError as e:
+                self.errors.append("Could not save the profile: " + str(e))
+            self.notify(summary, "profile")
+    
+    def stop(self):
+        self.stop_requested.set()
+    
+    # what timings recorded during this command are filed under
+    def set_run_context(self, command : PluginCommands, args : list):
+        self.current_command = command.value.name
+        self.board_name = None
+        for a in args or []:
+            if type(a) is list and len(a) > 1 and isinstance(a[1], Board):
+                self.board_name = a[1].name
+    
+    # opens a run in the results database for a command on a folder of .cfr files
+    def start_record(self, command : PluginCommands, args : list):
+        self.run_id, self.run_files = None, {}
+        inputs = dict(zip([i.type for i in command.value.args], args or []))
+        if InputType.cfr_folder not in inputs:
+            return
+        weights = inputs.get(InputType.weights_file) or [None, None]
+        board = inputs.get(InputType.board_file) or []
+        self.run_weights_hash = weightsHash(weights[1])
+        self.run_id = self.results_db.start_run(self.current_command, inputs[InputType.cfr_folder][0], self.board_name,
+                                                board[2] if len(board) > 2 else None, weights[0], weights[1], self.connection.accuracy)
+    
+    def finish_record(self, status : str):
+        self.results_db.finish_run(self.run_id, status, self.results_paths, len(self.errors))
+        self.run_id = None
+    
+    # tryFunction, adding the time it took to a stage of the current file
+    def timed(self, stage : str, func, args : list):
+        start = time.perf_counter()
+        try:
+            with tracing.span(getattr(func, "__name__", stage), stage):
+                return self.tryFunction(func, args)
+        finally:
+            self.stages[stage] = self.stages.get(stage, 0) + time.perf_counter() - start
+    
+    # the result cache key for running the current command on a file, or None when caching is off
+    def cache_key(self, folder : str, cfr : str, **params) -> str:
+        if not self.use_cache:
+            return None
+        return self.cache.key(os.path.join(folder, cfr), command=self.current_command, accuracy=str(self.connection.accuracy), **params)
+    
+    # indexes the topology of folder\cfr, which was just loaded: the saved index for its contents, otherwise crawled now.
+    # family lookups on it then don't need the solver; if crawling fails they fall back to asking it
+    def index_tree(self, folder : str, cfr : str) -> TreeIndex:
+        digest = self.cache.file_digest(os.path.join(folder, cfr))
+        self.tree = self.trees.get(digest)
+        if self.tree is None:
+            start = time.perf_counter()
+            try:
+                with tracing.span("crawl", "load"):
+                    self.tree = crawl(self.connection)
+                self.trees.put(digest, self.tree)
+            except Exception as e:
+                self.notify("Could not index the nodes of " + cfr + " (" + str(e) + "), asking the solver instead.")
+            finally:
+                self.stages["load"] = self.stages.get("load", 0) + time.perf_counter() - start
+        return self.tree
+    
+    def file_features(self, folder : str, cfr : str, save_type = None) -> dict:
+        return fileFeatures(os.path.join(folder, cfr), self.current_command, self.board_name, save_type, self.connection.accuracy)
+    
+    # predicts every file of a batch and sends the first ETA
+    def start_batch(self, folder : str, cfrFiles : list[str], save_type = None) -> Estimator:
+        eta = Estimator([self.history.predict(self.file_features(folder, cfr, save_type)) for cfr in cfrFiles])
+        self.notify(eta.message(), "eta")
+        return eta
+    
+    def start_file(self) -> float:
+        self.stages = {}
+        self.tree = None
+        return time.perf_counter()
+    
+    # records the stages of a finished file and sends the updated ETA
+    def finish_file(self, eta : Estimator, index : int, folder : str, cfr : str, started : float, save_type = None, succeeded = True):
+        tracing.complete(cfr, "file", started, {"succeeded": succeeded, "stages": dict(self.stages)})
+        if succeeded and self.stages:
+            self.history.record(self.file_features(folder, cfr, save_type), self.stages)
+        if self.run_id is not None:
+            # the board comes from the tree's index, which a file whose results were cached still has from its first run
+            digest = self.cache.file_digest(os.path.join(folder, cfr))
+            tree = self.tree or self.trees.get(digest)
+            board = tree.board("r:0") if tree is not None else None
+            file = self.results_db.add_file(self.run_id, folder, cfr, digest, board, succeeded, time.perf_counter() - started, self.stages)
+            self.run_files[cfr] = [file, board]
+        if eta is not None:
+            eta.done(index, time.perf_counter() - started)
+            self.notify(eta.message(), "eta")
         
-    async def tryFunction(self, func, args : list):
+    def tryFunction(self, func, args : list):
         try:
             #command not meant to have any inputs
             if args is None or len(args) == 0:
-                return await func()
+                return func()
             #command meant to take a single input
             elif type(args) != list or len(args) == 1:
-                return await func(args[0])
+                return func(args[0])
             #command meant to take a list of
             else:
-                return await func(args)
+                return func(args)
         except Exception as e:
-            await self.notify(str(e))
+            self.errors.append(str(e))
+            self.notify(str(e))
             return None
         
     # arg[0] = nodeID
     # returns the action frequencies for the sister and children nodes of the target node
     def getAllFrequencies(self, args: list) :
-        treeOp = TreeOperator(self.connection)
+        treeOp = TreeOperator(self.connection, self.tree)
         family = treeOp.get_family(args[0])
         sisterFrequencies = []
         childFrequencies = []
@@ -132,6 +558,53 @@ class Program:
     def solve_full(self, args: list[str]):
         self.run_cfr(args[0][0], args[0][1], args[1][0])
 
+    # args[0][0] : the folder path
+    # args[0][1] : list of .cfr files
+    # args[1][0] : either a string with the nodeID or a map with .cfr file names -> file-specific nodeIDs
+    # every file is solved to a coarse accuracy and the results published, then each later pass continues from the
+    # saved trees at a tighter accuracy. stop() ends the run after the current file; finished passes keep their results.
+    def solve_progressive(self, args: list[str], steps : list[float] = None):
+        folder, cfrFiles = args[0]
+        nodeBook, board_type = args[1][0], args[1][1]
+        Program.single_nodes(nodeBook)
+        steps = steps or Program.progressiveSteps
+        target = self.connection.accuracy
+        pio = SolverCommmand(self.connection)
+        
+        try:
+            for number, step in enumerate(steps):
+                last = number == len(steps) - 1
+                # as a fraction of the pot (accuracies over 1 are percentages), so multiplying can't turn it into a percentage
+                self.connection.accuracy = min(Decimal(1), Decimal(normalizeWeight(Decimal(str(target)))) * Decimal(str(step)))
+                # trees have to keep every street until the last pass so they can be solved further
+                save_type = Program.get_save_type(board_type) if last else None
+                self.notify("Pass " + str(number + 1) + " of " + str(len(steps)) + ": solving to an accuracy of " + str(self.connection.accuracy) + ".")
+                
+                toCSV = []
+                interrupted = False
+                eta = self.start_batch(folder, cfrFiles, save_type)
+                for index, cfr in enumerate(cfrFiles):
+                    if self.stop_requested.is_set():
+                        interrupted = True
+                        break
+                    started = self.start_file()
+                    result = self.run_cfr_file(pio, folder, cfr, nodeBook, True, True, save_type)
+                    self.finish_file(eta, index, folder, cfr, started, save_type, result is not None)
+                    if result:
+                        family, thisLine = result
+                        if not toCSV:
+                            toCSV.append(self.make_title(family))
+                        toCSV.append(thisLine)
+                        self.stream_row("pass " + str(number + 1), toCSV[0], thisLine)
+                
+                if toCSV:
+                    self.publish_results(folder, toCSV, name = "results_pass" + str(number + 1) + "_" + timestamp() + ".csv")
+                if self.stop_requested.is_set():
+                    self.notify("Stopped during pass " + str(number + 1) + "." if interrupted else "Stopped after pass " + str(number + 1) + ".")
+                    return
+        finally:
+            self.connection.accuracy = target
+    
     # args[0][0] : the folder path
     # args[0][1] : list of .cfr files
     # args[1][0] : either a string with the nodeID or a map with .cfr file names -> file-specific nodeIDs
@@ -153,71 +626,32 @@ class Program:
         
         # arrays that will be written to CSV file
         toCSV = []
+        # files are only timed here when this is the whole command, not part of a nodelock
+        eta = self.start_batch(folder, cfrFiles, save_type) if publish_results else None
         
-        for cfr in cfrFiles:
-            # The line `nodeID = self.tryFunction(self.get_file_nodeID, [cfr, nodeBook])` is calling
-            # the `tryFunction` method with arguments `self.get_file_nodeID` as the function to try
-            # and `[cfr, nodeBook]` as the arguments to pass to that function.
-            loaded = False
-            nodeID = self.tryFunction(self.get_file_nodeID, [cfr, nodeBook])
-            if nodeID:
-                if needsLoading:
-                    if self.tryFunction(pio.load_tree, [folder + "\\" + cfr]):
-                        loaded = True
-                else:
-                    loaded = True
-                    
-                if loaded:
-                    if solveFirst:
-                        self.notify(cfr +  "     " + nodeID)
-                    thisLine = [cfr, nodeID]
-            
-                    t = TreeOperator(connection = self.connection)
-                    family = self.tryFunction(t.get_family,[nodeID])
-                    if needsTitle:
-                        toCSV.append(self.make_title(family))
-                        needsTitle = False
-                
-                    #------------------run solver-------------------
-                    if solveFirst:
-                        self.notify("Solving " + cfr + " to an accuracy of " + str(self.connection.accuracy) + ".")
-                        self.tryFunction(pio.solve, [])
-                    
-                    #------------------attach EVs for this .cfr file to this CSV line---------------------
-                    thisLine.append("   ")
-                    
-                    evs = self.tryFunction(pio.getEV, [])
-                    if evs:
-                        thisLine.extend(evs)
-                        
-                    #------------------attach action frequencies for this .cfr file to this CSV line--------------------
-                    thisLine.append("   ")
-                    
-                    for s in family.sisters:
-                        freq = self.tryFunction(pio.getActionFrequency, [[s]])
-                        if freq == 0 or freq:
-                            thisLine.append(str(freq))
-                    
-                    #------------------attach post-node action frequencies for this .cfr file to this CSV line---------------------
-                    thisLine.append("   ")
-                    
-                    for c in family.children:
-                        freq = self.tryFunction(pio.getActionFrequency, [[c]])
-                        if freq == 0 or freq:
-                            thisLine.append(str(freq))
-
-                    
-                    #-------------------if solver was run, save file-----------------------------------
-                    if solveFirst:
-                        savePath = folder + r"\\" + cfr
-                        self.tryFunction(pio.saveTree,[savePath, save_type])
-                        msg = "Saved to: " + savePath
-                        if (save_type):
-                            msg = msg = "Saved to: " + savePath + " using " + save_type
-                        self.notify(msg)
-                    
-                    #append results for this cfr to csv
-                    toCSV.append(thisLine)
+        # a node ID with wildcards gives a row for every node it matches; a title row goes before each row whose columns differ from the last
+        selectors = BoardFile.hasSelectors(nodeBook)
+        title = None
+        
+        for index, cfr in enumerate(cfrFiles):
+            started = self.start_file() if publish_results else None
+            if selectors:
+                results = self.run_cfr_matches(pio, folder, cfr, nodeBook, solveFirst, save_type)
+            else:
+                result = self.run_cfr_file(pio, folder, cfr, nodeBook, solveFirst, needsLoading, save_type)
+                results = [result] if result else None
+            if publish_results:
+                self.finish_file(eta, index, folder, cfr, started, save_type, results is not None)
+            for family, thisLine in results or []:
+                if needsTitle or (selectors and self.make_title(family) != title):
+                    title = self.make_title(family)
+                    toCSV.append(title)
+                    needsTitle = False
+                #append results for this cfr to csv
+                toCSV.append(thisLine)
+                # rows of a nodelock are sent by the nodelock itself
+                if publish_results:
+                    self.stream_row(self.current_command, self.make_title(family), thisLine)
         
         
         if publish_results:
@@ -225,6 +659,145 @@ class Program:
         
         return toCSV
     
+    # a solver command that fails closes the connection (SolverCommmand.tryPio); this opens it again for the next file
+    def reopen(self, pio : SolverCommmand):
+        if not self.connection.is_alive():
+            self.connection = pio.resetConnection()
+    
+    # runs (and optionally solves) a single .cfr file
+    # returns [family of the target node, CSV line for this file], or None if the file was skipped
+    def run_cfr_file(self, pio : SolverCommmand, folder : str, cfr : str, nodeBook, solveFirst = True, needsLoading = True, save_type = None):
+        nodeID = self.tryFunction(self.get_file_nodeID, [cfr, nodeBook])
+        if not nodeID:
+            return None
+        
+        # an identical earlier run gives the same line (only checked when the file is loaded from disk here)
+        cacheKey = self.cache_key(folder, cfr, node=nodeID, solve=solveFirst, save_type=save_type) if needsLoading else None
+        cached = self.cache.get(cacheKey)
+        if cached:
+            self.notify("Using cached results for " + cfr + ".")
+            # files with the same contents share an entry, so the row gets this file's name
+            return [nodeFamily(**cached["family"]), [cfr] + cached["row"][1:]]
+        errors = len(self.errors)
+        
+        if needsLoading:
+            if not self.timed("load", pio.load_tree, [folder + "\\" + cfr]):
+                self.connection = pio.resetConnection()
+                return None
+            self.index_tree(folder, cfr)
+            
+        if solveFirst:
+            self.notify(cfr +  "     " + nodeID)
+        thisLine = [cfr, nodeID]
+
+        t = TreeOperator(connection = self.connection, index = self.tree)
+        family = self.tryFunction(t.get_family,[nodeID])
+        if family is None:
+            self.reopen(pio)
+            return None
+    
+        #------------------run solver-------------------
+        if solveFirst:
+            self.notify("Solving " + cfr + " to an accuracy of " + str(self.connection.accuracy) + ".")
+            self.timed("solve", pio.solve, [])
+        
+        #------------------attach EVs for this .cfr file to this CSV line---------------------
+        thisLine.append("   ")
+        
+        evs = self.timed("results", pio.getEV, [])
+        if evs:
+            thisLine.extend(evs)
+            
+        #------------------attach action frequencies for this .cfr file to this CSV line--------------------
+        thisLine.append("   ")
+        
+        for s in family.sisters:
+            freq = self.timed("results", pio.getActionFrequency, [[s]])
+            if freq == 0 or freq:
+                thisLine.append(str(freq))
+        
+        #------------------attach post-node action frequencies for this .cfr file to this CSV line---------------------
+        thisLine.append("   ")
+        
+        for c in family.children:
+            freq = self.timed("results", pio.getActionFrequency, [[c]])
+            if freq == 0 or freq:
+                thisLine.append(str(freq))
+
+        
+        #-------------------if solver was run, save file-----------------------------------
+        if solveFirst:
+            savePath = folder + r"\\" + cfr
+            self.timed("save", pio.saveTree, [savePath, save_type])
+            msg = "Saved to: " + savePath
+            if (save_type):
+                msg = msg = "Saved to: " + savePath + " using " + save_type
+            self.notify(msg)
+        
+        self.reopen(pio)
+        if cacheKey and len(self.errors) == errors:
+            # running the saved tree again gives the same line too
+            savedKey = self.cache_key(folder, cfr, node=nodeID, solve=solveFirst, save_type=save_type) if solveFirst else None
+            self.cache.put([cacheKey, savedKey], row=thisLine, tree=os.path.join(folder, cfr) if solveFirst else None, family=vars(family))
+        
+        return [family, thisLine]
+    
+    # runs (and optionally solves) a single .cfr file for a node ID with wildcards: every node of the tree that matches it
+    # is found walking the tree, then the action frequencies of all of them are read in one pipelined pass.
+    # returns a [family, CSV line] for each matching node, or None if the file was skipped
+    def run_cfr_matches(self, pio : SolverCommmand, folder : str, cfr : str, nodeBook, solveFirst = True, save_type = None):
+        selector = self.tryFunction(self.get_file_nodeID, [cfr, nodeBook])
+        if not selector:
+            return None
+        
+        cacheKey = self.cache_key(folder, cfr, node=selector, solve=solveFirst, save_type=save_type)
+        cached = self.cache.get(cacheKey)
+        if cached:
+            self.notify("Using cached results for " + cfr + ".")
+            return [[nodeFamily(**family), [cfr] + row[1:]] for family, row in zip(cached["families"], cached["row"])]
+        errors = len(self.errors)
+        
+        if not self.timed("load", pio.load_tree, [folder + "\\" + cfr]):
+            self.connection = pio.resetConnection()
+            return None
+        self.index_tree(folder, cfr)
+        
+        families = self.tryFunction(lambda: selectFamilies(self.connection, self.tree, selector), [])
+        if not families:
+            self.tryFunction(pio.free_mem, [])
+            self.reopen(pio)
+            return None
+        self.notify(cfr + "     " + selector + " matches " + str(len(families)) + " nodes")
+        
+        if solveFirst:
+            self.notify("Solving " + cfr + " to an accuracy of " + str(self.connection.accuracy) + ".")
+            self.timed("solve", pio.solve, [])
+        
+        # EVs are at the root, so the same for every node
+        evs = self.timed("results", pio.getEV, []) or []
+        nodes = [n for family in families for n in family.sisters + family.children]
+        frequencies = self.timed("results", pio.getActionFrequencies, [list(dict.fromkeys(nodes))]) or {}
+        
+        results = []
+        for family in families:
+            thisLine = [cfr, family.nodeID, "   "] + list(evs) + ["   "]
+            thisLine.extend(str(frequencies[s]) if frequencies.get(s) is not None else "" for s in family.sisters)
+            thisLine.append("   ")
+            thisLine.extend(str(frequencies[c]) if frequencies.get(c) is not None else "" for c in family.children)
+            results.append([family, thisLine])
+        
+        if solveFirst:
+            savePath = folder + r"\\" + cfr
+            self.timed("save", pio.saveTree, [savePath, save_type])
+            self.notify("Saved to: " + savePath + (" using " + save_type if save_type else ""))
+        
+        self.reopen(pio)
+        if cacheKey and len(self.errors) == errors:
+            savedKey = self.cache_key(folder, cfr, node=selector, solve=solveFirst, save_type=save_type) if solveFirst else None
+            self.cache.put([cacheKey, savedKey], row=[line for family, line in results], tree=os.path.join(folder, cfr) if solveFirst else None,
+                           families=[vars(family) for family, line in results])
+        return results
+    
     # args[0][0] : the folder path
     # args[0][1] : list of .cfr files
     # args[1] : map of category names -> weights
@@ -234,13 +807,15 @@ class Program:
         weights_file_path = args[1][0]
         weights_file_name = get_file_name_from_path(weights_file_path)
         weights_map = args[1][1]
+        if WeightsFile.sweptCategory(weights_map):
+            raise Exception(Errors.sweepOnlyInWeightSweep)
         
         nodeBook = args[2][0]
         board_type = args[2][1]
-        nodeBook_file_name = get_file_name_from_path(args[2][2])
+        Program.single_nodes(nodeBook)
         
         pio = SolverCommmand(self.connection)
-        path = folder + "\\" + "NODELOCK_" + removeExtension(weights_file_name) + "__" + removeExtension(nodeBook_file_name) + "\\"
+        path = Program.get_nodelock_folder(args)
         
         save_type = None
         if auto_size:
@@ -250,46 +825,24 @@ class Program:
         solved = []
         
         needsTitle = True
+        eta = self.start_batch(folder, cfrFiles, save_type)
         
-        for cfr in cfrFiles:
-            nodeID = self.tryFunction(self.get_file_nodeID, [cfr, nodeBook])
-            if nodeID:
-
-                self.notify("Now working on...." + cfr + " - " + nodeID)
-                # set strategy
-                if self.tryFunction(pio.load_tree, [folder + "\\" + cfr]):
-                    self.notify(cfr + " loaded!")
-                    treeOp = TreeOperator(self.connection)
-                    
-                    family = self.tryFunction(treeOp.get_family,[nodeID])
-                    if needsTitle:
-                        title = self.make_title(family)
-                        solved.append(title)
-                        unsolved.append(title)
-                        needsTitle = False
-                        
-                    self.tryFunction(treeOp.set_strategy, [nodeID, weights_map].copy())
-                    self.notify("Strategy set for " + cfr) 
-                
-                    # dump tree
-                    self.tryFunction(pio.saveTree, [path + cfr, save_type])
-                    msg = "Saved to " + path + cfr
-                    if (save_type):
-                        msg = "Saved to " + path + cfr + " using " + save_type + " save."
-                    self.notify(msg)
-                    
-                    # get results
-                    before_solving = self.run_cfr(path, [cfr], nodeBook, solveFirst = False, needsTitle= False, needsLoading=False, save_type = save_type, publish_results=False)
-                    unsolved.extend(before_solving)
-                    if (solve):
-                        results = self.run_cfr(path, [cfr], nodeBook, solveFirst = True, needsTitle= False, needsLoading=False, save_type = save_type, publish_results=False)
-                        solved.extend(results)
-                    
-                    
-                    self.tryFunction(pio.free_mem, [])
-                else:
-                    #self.connection.command("show_tree_info")
-                    self.connection = pio.resetConnection()
+        for index, cfr in enumerate(cfrFiles):
+            started = self.start_file()
+            result = self.nodelock_file(pio, folder, cfr, nodeBook, weights_map, path, save_type, solve)
+            self.finish_file(eta, index, folder, cfr, started, save_type, result is not None)
+            if result:
+                title, before_solving, results = result
+                if needsTitle:
+                    solved.append(title)
+                    unsolved.append(title)
+                    needsTitle = False
+                unsolved.extend(before_solving)
+                solved.extend(results)
+                for row in before_solving:
+                    self.stream_row("before solving", title, row)
+                for row in results:
+                    self.stream_row("solved", title, row)
                     
         toCSV = [[" ", "BEFORE SOLVING"], [""]]
         toCSV.extend(unsolved)
@@ -302,14 +855,312 @@ class Program:
         self.publish_results(path, toCSV, solve)
         
         return path
+    
+    # nodelocks a single .cfr file, saves it to path and gets its results before (and optionally after) solving
+    # returns [title, rows before solving, rows after solving], or None if the file was skipped
+    def nodelock_file(self, pio : SolverCommmand, folder : str, cfr : str, nodeBook, weights_map : dict, path : str, save_type = None, solve = False):
+        nodeID = self.tryFunction(self.get_file_nodeID, [cfr, nodeBook])
+        if not nodeID:
+            return None
         
+        cacheKey = self.cache_key(folder, cfr, node=nodeID, weights=weights_map, solve=solve, save_type=save_type, saved_to=path)
+        cached = self.cache.get(cacheKey)
+        if cached:
+            self.notify("Using cached results for " + cfr + " - " + nodeID + ".")
+            return [cached["title"], cached["before"], cached["after"]]
+        errors = len(self.errors)
+
+        self.notify("Now working on...." + cfr + " - " + nodeID)
+        # set strategy
+        if not self.timed("load", pio.load_tree, [folder + "\\" + cfr]):
+            #self.connection.command("show_tree_info")
+            self.connection = pio.resetConnection()
+            return None
+        
+        self.notify(cfr + " loaded!")
+        self.index_tree(folder, cfr)
+        treeOp = TreeOperator(self.connection, self.tree)
+        
+        family = self.tryFunction(treeOp.get_family,[nodeID])
+        if family is None:
+            self.tryFunction(pio.free_mem, [])
+            return None
+        title = self.make_title(family)
+            
+        self.timed("nodelock", treeOp.set_strategy, [nodeID, weights_map].copy())
+        self.notify("Strategy set for " + cfr) 
+    
+        # dump tree
+        self.timed("save", pio.saveTree, [path + cfr, save_type])
+        msg = "Saved to " + path + cfr
+        if (save_type):
+            msg = "Saved to " + path + cfr + " using " + save_type + " save."
+        self.notify(msg)
+        
+        # get results
+        before_solving = self.run_cfr(path, [cfr], nodeBook, solveFirst = False, needsTitle= False, needsLoading=False, save_type = save_type, publish_results=False)
+        results = []
+        if (solve):
+            results = self.run_cfr(path, [cfr], nodeBook, solveFirst = True, needsTitle= False, needsLoading=False, save_type = save_type, publish_results=False)
+        
+        self.tryFunction(pio.free_mem, [])
+        if len(self.errors) == errors:
+            self.cache.put([cacheKey], tree=path + cfr, title=title, before=before_solving, after=results)
+        return [title, before_solving, results]
     
-    def publish_results(self, folder:str, toCSV: list[list[str]], solved = True):
+    # args[0][0] : the folder path
+    # args[0][1] : list of .cfr files
+    # args[1] : [weights path, map of category names -> weights], where one key has a list of weights (the grid)
+    # args[2] : [either a string with the nodeID or a map with .cfr file names -> file-specific nodeIDs, board_type]
+    # each file is loaded once. at every weight the node is locked to its original strategy changed by that weight,
+    # then solved on from the previous weight's solution instead of from the file.
+    def weight_sweep(self, args : list[str]):
+        folder, cfrFiles = args[0]
+        weights_map = args[1][1]
+        nodeBook = args[2][0]
+        Program.single_nodes(nodeBook)
+        category = WeightsFile.sweptCategory(weights_map)
+        if category is None:
+            raise Exception(Errors.noSweptCategory)
+        
+        pio = SolverCommmand(self.connection)
+        toCSV = [["File", "Node", "Category", "Weight", "Metric", "Value"]]
+        eta = self.start_batch(folder, cfrFiles)
+        for index, cfr in enumerate(cfrFiles):
+            if self.stop_requested.is_set():
+                break
+            started = self.start_file()
+            rows = self.sweep_file(pio, folder, cfr, nodeBook, weights_map, category)
+            self.finish_file(eta, index, folder, cfr, started, succeeded = rows is not None)
+            if rows:
+                toCSV.extend(rows)
+                for row in rows:
+                    self.stream_row("sweep", toCSV[0], row)
+        
+        self.publish_results(folder, toCSV, name = "sweep_" + category + "_" + timestamp() + ".csv")
+    
+    # sweeps the weight of category over its grid on one file
+    # returns one row per weight and metric (EVs, frequencies at and after the node), or None if the file was skipped
+    def sweep_file(self, pio : SolverCommmand, folder : str, cfr : str, nodeBook, weights_map : dict, category : str):
+        nodeID = self.tryFunction(self.get_file_nodeID, [cfr, nodeBook])
+        if not nodeID:
+            return None
+        if not self.timed("load", pio.load_tree, [folder + "\\" + cfr]):
+            self.connection = pio.resetConnection()
+            return None
+        
+        self.index_tree(folder, cfr)
+        treeOp = TreeOperator(self.connection, self.tree)
+        family = self.tryFunction(treeOp.get_family, [nodeID])
+        original = self.tryFunction(treeOp.getCurrentStrategyAsList, [family.parent]) if family else None
+        if original is None:
+            self.tryFunction(pio.free_mem, [])
+            return None
+        
+        metrics = ["EV OOP", "EV IP", "OOP MES", "IP MES"]
+        metrics.extend("frequency of " + BoardFile.getLastDecision(s) for s in family.sisters)
+        metrics.extend("frequency after " + BoardFile.getLastDecision(c) for c in family.children)
+        
+        rows = []
+        for weight in weights_map[category]:
+            if self.stop_requested.is_set():
+                break
+            weights = dict(weights_map)
+            weights[category] = weight
+            self.timed("nodelock", treeOp.set_strategy, [nodeID, weights, original])
+            self.notify("Solving " + cfr + " with " + category + " at " + str(weight) + ".")
+            self.timed("solve", pio.solve, [])
+            
+            values = list(self.timed("results", pio.getEV, []) or [])[:4]
+            values.extend([""] * (4 - len(values)))
+            for node in family.sisters + family.children:
+                freq = self.timed("results", pio.getActionFrequency, [[node]])
+                values.append(str(freq) if freq == 0 or freq else "")
+            rows.extend([cfr, nodeID, category, weight, m, v] for m, v in zip(metrics, values))
+        
+        self.tryFunction(pio.free_mem, [])
+        return rows
+    
+    # args[0][0] : the folder path
+    # args[0][1] : list of .cfr files
+    # times a sample of the files with 1, 2, 4... solver processes sharing the cores (autotune.py) and keeps the fastest
+    # configuration for the sample's tree class; later batch runs on files of that class use it
+    def autotune(self, args : list[str]):
+        from autotune import Tuning, configurations, sampleFiles, batchClass, measure, fastest, calibrationStep
+        folder, cfrFiles = args[0]
+        cores = os.cpu_count() or 1
+        tried = configurations(cores)
+        sizes = [self.file_features(folder, cfr)["size"] for cfr in cfrFiles]
+        # as many files as the most processes tried, so every configuration keeps all its processes busy
+        sample = sampleFiles(cfrFiles, sizes, tried[-1][0])
+        tree_class = batchClass([os.path.join(folder, cfr) for cfr in sample])
+        accuracy = min(Decimal(1), Decimal(normalizeWeight(Decimal(str(self.connection.accuracy)))) * Decimal(calibrationStep))
+        self.notify("Calibrating on " + str(len(sample)) + " files (" + str(tree_class) + ") solved to an accuracy of " + str(accuracy) + ", with " + str(cores) + " cores.")
+        
+        toCSV = [["Processes", "Threads each", "Files", "Seconds", "Files per hour", "Peak memory (MB)", "Errors"]]
+        measurements = []
+        for processes, threads in tried:
+            if self.stop_requested.is_set():
+                break
+            self.notify("Timing " + str(processes) + " solver processes with " + str(threads) + " threads each...")
+            with tracing.span(str(processes) + " x " + str(threads), "autotune"):
+                m = measure(self.connection.solverPath, [folder + "\\" + cfr for cfr in sample], processes, threads, accuracy)
+            measurements.append(m)
+            row = [processes, threads, m["files"], m["seconds"], m["files_per_hour"], m["peak_memory_mb"] if m["peak_memory_mb"] is not None else "", "; ".join(m["errors"])]
+            toCSV.append(row)
+            self.stream_row("autotune", toCSV[0], row)
+            self.notify(str(m["files_per_hour"]) + " files per hour" + (", " + str(len(m["errors"])) + " files failed" if m["errors"] else "") + ".")
+        
+        best = fastest(measurements)
+        if best is None:
+            self.errors.append("No configuration solved every sample file, so none was kept.")
+        else:
+            Tuning().save(tree_class, best, measurements, cores)
+            self.notify("Fastest for trees " + tree_class + ": " + str(best["processes"]) + " solver processes with " + str(best["threads"]) +
+                        " threads each (" + str(best["files_per_hour"]) + " files per hour). Batch runs on files like these will use it.")
+        self.publish_results(folder, toCSV, name = "autotune_" + timestamp() + ".csv")
+    
+    # args : the same arguments as the nodelock commands
+    # returns the folder nodelocked trees and their results are saved to
+    @staticmethod
+    def get_nodelock_folder(args : list) -> str:
+        weights_file_name = get_file_name_from_path(args[1][0])
+        nodeBook_file_name = get_file_name_from_path(args[2][2])
+        return args[0][0] + "\\" + "NODELOCK_" + removeExtension(weights_file_name) + "__" + removeExtension(nodeBook_file_name) + "\\"
+    
+    # runs a folder command on every .cfr file in the folder as soon as it is completely written, including files added later.
+    # results are appended to the CSV after each file, so analysis overlaps with the trees still being generated.
+    # command : one of the PluginCommands that takes a .cfr folder
+    # args : the same arguments as the command; args[0][1] is ignored since the folder is watched instead
+    # stop_event : set to stop watching
+    def watch(self, command : PluginCommands, args : list, stop_event : threading.Event = None, settle_time : float = 5.0):
+        folder = args[0][0]
+        pio = SolverCommmand(self.connection)
+        settings = Program.file_settings(command, args)
+        
+        self.set_run_context(command, args)
+        self.start_record(command, args)
+        self.notify("Watching " + folder + " for new .cfr files...")
+        watcher = FolderWatcher(folder, Extension.cfr.value, settle_time = settle_time)
+        try:
+            self.watch_files(pio, command, settings, watcher, stop_event)
+        finally:
+            self.finish_record("stopped")
+        self.notify("Stopped watching " + folder + ".")
+    
+    # runs each file the watcher finds and appends its results to the CSVs of the watch
+    def watch_files(self, pio : SolverCommmand, command : PluginCommands, settings : dict, watcher : FolderWatcher, stop_event : threading.Event):
+        folder = watcher.folder
+        stamp = timestamp()
+        needsTitle = True
+        lastTitle = None
+        selectors = BoardFile.hasSelectors(settings["nodeBook"])
+        for cfr in watcher.watch(stop_event):
+            started = self.start_file()
+            result = self.run_file(pio, command, settings, folder, cfr)
+            if command in Program.nodelockSettings:
+                if result:
+                    path = settings["path"]
+                    title, before_solving, results = result
+                    self.append_results(path + "unsolved_results_" + stamp + ".csv", title, before_solving, needsTitle)
+                    if settings["solve"]:
+                        self.append_results(path + "results_" + stamp + ".csv", title, results, needsTitle)
+                    needsTitle = False
+            else:
+                for family, thisLine in result or []:
+                    title = self.make_title(family)
+                    self.append_results(folder + "\\results_" + stamp + ".csv", title, [thisLine], needsTitle or (selectors and title != lastTitle))
+                    lastTitle = title
+                    needsTitle = False
+            self.finish_file(None, 0, folder, cfr, started, settings["save_type"], result is not None)
+    
+    # the settings of a folder command that runs file by file (watch mode, distributed workers), checked up front:
+    #   nodelock commands: solve, weights_map, nodeBook, path (the nodelock folder, made here), save_type
+    #   run commands: solve (solve first), nodeBook, save_type
+    # copy_weights : copy the weights file into the nodelock folder (a distributed worker may not see it)
+    @staticmethod
+    def file_settings(command : PluginCommands, args : list, copy_weights = True) -> dict:
+        if command in Program.nodelockSettings:
+            solve, auto_size = Program.nodelockSettings[command]
+            weights_map = args[1][1]
+            if WeightsFile.sweptCategory(weights_map):
+                raise Exception(Errors.sweepOnlyInWeightSweep)
+            nodeBook, board_type = args[2][0], args[2][1]
+            Program.single_nodes(nodeBook)
+            path = Program.get_nodelock_folder(args)
+            os.makedirs(path, exist_ok=True)
+            if copy_weights:
+                shutil.copyfile(args[1][0], path + get_file_name_from_path(args[1][0]))
+            return {"solve": solve, "weights_map": weights_map, "nodeBook": nodeBook, "path": path,
+                    "save_type": Program.get_save_type(board_type) if auto_size else None}
+        elif command in Program.runSettings:
+            solveFirst, auto_size = Program.runSettings[command]
+            nodeBook, board_type = args[1][0], args[1][1]
+            return {"solve": solveFirst, "nodeBook": nodeBook, "save_type": Program.get_save_type(board_type) if auto_size else None}
+        raise Exception(command.value.name + " cannot be run file by file.")
+    
+    # runs a folder command on one file with its file_settings
+    # returns [title, rows before solving, rows after solving] for nodelock commands, a [family, CSV line] per node for
+    # the others, or None if the file was skipped
+    def run_file(self, pio : SolverCommmand, command : PluginCommands, settings : dict, folder : str, cfr : str):
+        if command in Program.nodelockSettings:
+            return self.nodelock_file(pio, folder, cfr, settings["nodeBook"], settings["weights_map"], settings["path"], settings["save_type"], settings["solve"])
+        if BoardFile.hasSelectors(settings["nodeBook"]):
+            return self.run_cfr_matches(pio, folder, cfr, settings["nodeBook"], settings["solve"], settings["save_type"])
+        result = self.run_cfr_file(pio, folder, cfr, settings["nodeBook"], settings["solve"], True, settings["save_type"])
+        return [result] if result else None
+    
+    # sends a finished CSV row as a 'result_row' message, so the frontend can show a live table without reading the CSV.
+    # the first row of each table also carries its columns
+    def stream_row(self, table : str, title : list[str], row : list):
+        columns, values = Program.result_record(title, row)
+        seq = self.streamed.get(table, 0)
+        self.streamed[table] = seq + 1
+        message = {"table": table, "seq": seq, "values": values}
+        if seq == 0:
+            message["columns"] = columns
+        self.notify(message, "result_row")
+        if self.run_id is not None:
+            cfr = str(row[0]) if row else None
+            file, board = self.run_files.get(cfr, [None, None])
+            node = values[columns.index("Node")] if "Node" in columns else None
+            self.results_db.add_row(self.run_id, file, table, seq, cfr, board, node, self.run_weights_hash, columns, values)
+    
+    # a CSV title and row as [columns, values]: the blank spacer columns ("   ") are left out, frequency columns are
+    # named after their section ("frequencies at node: b10") and numbers are sent as numbers
+    @staticmethod
+    def result_record(title : list[str], row : list) -> list[list]:
+        columns, values = [], []
+        section = ""
+        for name, value in zip(title, row):
+            if type(value) is str and value != "" and value.strip() == "":
+                section = name
+                continue
+            columns.append(section + ": " + name if section.startswith("frequencies") else name)
+            number = toFloat(str(value))
+            values.append(value if type(number) is str or not number.is_finite() else float(number))
+        return [columns, values]
+    
+    def append_results(self, path : str, title : list[str], rows : list[list[str]], needsTitle : bool):
+        toCSV = [title] if needsTitle else []
+        toCSV.extend(rows)
+        addRowstoCSV(path, toCSV, [IO.APPEND])
+        if path not in self.results_paths:
+            self.results_paths.append(path)
+        for row in rows:
+            self.stream_row(get_file_name_from_path(path), title, row)
+        self.notify("Added " + str(len(rows)) + " rows to " + path)
+        
+    def publish_results(self, folder:str, toCSV: list[list[str]], solved = True, name : str = None):
         path = folder + "\\results_" + timestamp() + ".csv"
         if not solved:
             path = folder + "\\unsolved_results" + ".csv"
+        if name:
+            path = folder + "\\" + name
 
-        addRowstoCSV(path, toCSV)
+        with tracing.span("write csv", "io", rows=len(toCSV)):
+            addRowstoCSV(path, toCSV)
+        self.results_paths.append(path)
         
         msg = "Saved results to " + path
         if not solved:
@@ -353,6 +1204,12 @@ class Program:
         self.nodelock_get_results_save(args, auto_size=True)
 
     
+    # commands that lock, extract or check one node per file can't take node IDs with wildcards
+    @staticmethod
+    def single_nodes(nodeBook):
+        if BoardFile.hasSelectors(nodeBook):
+            raise Exception(Errors.selectorOnlyInResults)
+    
     @staticmethod
     def get_save_type(board_type : Board):
         save_type = None
@@ -372,5 +1229,246 @@ class Program:
         self.notify("Closing connection to solver...done!")
 
         
+class Tests(unittest.TestCase):
+
+    # a solver holding the same tree for every file unless trees has another for it: r:0 (OOP) -> c, b10 (IP);
+    # r:0:c -> c (chance, 2 cards), b20; r:0:b10 -> f, c. failing holds the (verb, file) pairs it answers with an ERROR
+    class Pio(FakeSolver):
+        nodes = {
+            "r:0": ("OOP_DEC", ["r:0:c", "r:0:b10"]),
+            "r:0:c": ("IP_DEC", ["r:0:c:c", "r:0:c:b20"]),
+            "r:0:b10": ("IP_DEC", ["r:0:b10:f", "r:0:b10:c"]),
+            "r:0:c:c": ("SPLIT_NODE", ["r:0:c:c:2c", "r:0:c:c:2d"]),
+            "r:0:c:b20": ("OOP_DEC", ["r:0:c:b20:f", "r:0:c:b20:c"]),
+            "r:0:b10:f": ("END_NODE", []),
+            "r:0:b10:c": ("END_NODE", []),
+            "r:0:c:c:2c": ("OOP_DEC", []),
+            "r:0:c:c:2d": ("OOP_DEC", []),
+            "r:0:c:b20:f": ("END_NODE", []),
+            "r:0:c:b20:c": ("END_NODE", []),
+        }
+
+        def __init__(self, path : str, failing : set = None, trees : dict = None) -> None:
+            super().__init__(path)
+            self.failing = failing if failing is not None else set()
+            self.trees = trees if trees is not None else {}
+            self.loaded = None
+
+        def tree(self):
+            return self.trees.get(self.loaded, self.nodes)
+
+        def describe(self, nodeID):
+            return [nodeID, self.tree()[nodeID][0], "As 5h 3s", "0 0 55", str(len(self.tree()[nodeID][1])) + " children", "flags:"]
+
+        def answer(self, line):
+            verb, _, arg = line.partition(" ")
+            if (verb, self.loaded) in self.failing:
+                return ["ERROR: " + verb + " failed"]
+            if verb == "load_tree":
+                self.loaded = arg.strip("\"").split("\\")[-1]
+            elif verb == "free_tree":
+                self.loaded = None
+            elif verb == "is_tree_present":
+                return ["true" if self.loaded else "false"]
+            elif verb == "show_tree_info":
+                return ["#Pot#55", "#EffectiveStacks#100"]
+            elif verb in ["show_node", "show_children", "calc_line_freq", "show_strategy"] and arg not in self.tree():
+                return ["ERROR: no such node " + arg]
+            elif verb == "show_node":
+                return self.describe(arg)
+            elif verb == "show_children":
+                output = []
+                for i, child in enumerate(self.tree()[arg][1]):
+                    output.extend(["child " + str(i) + ":"] + self.describe(child) + [""])
+                return output
+            elif verb == "show_range":
+                return [" ".join(["1"] * 1326)]
+            elif verb == "show_strategy":
+                # every action equally likely for every combo
+                children = len(self.tree()[arg][1])
+                return [" ".join([str(1 / children)] * 1326)] * children
+            elif verb == "show_categories":
+                return [" ".join(str(c) for c in v) for v in categories.evaluate(arg)]
+            elif verb == "calc_results":
+                return ["EV OOP: 30", "EV IP: 25", "OOP's MES: 31", "IP's MES: 26"]
+            elif verb == "calc_line_freq":
+                # every action is taken half the time
+                return [str(0.5 ** (len(parseNodeIDtoList(arg)) - 1))]
+            return super().answer(line)
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.cfrs = os.path.join(self.folder.name, "cfrs")
+        os.makedirs(self.cfrs)
+        for cfr in ["a.cfr", "b.cfr", "c.cfr", "d.cfr"]:
+            with open(os.path.join(self.cfrs, cfr), "w") as f:
+                f.write(cfr)
+        self.failing = set()
+        self.trees = {}
+        self.connection = SolverSupervisor("pio.exe", warm_standby=False, spawn=self.spawn)
+        self.messages = []
+        self.program = Program(self.connection, lambda message, msg_type = "notification": self.messages.append([msg_type, message]))
+        self.program.cache = ResultCache(os.path.join(self.folder.name, "cache"))
+        self.program.trees = TreeIndexStore(os.path.join(self.folder.name, "trees"))
+        self.program.results_db = ResultsDB(os.path.join(self.folder.name, "results.db"))
+        self.program.history = RuntimeHistory(os.path.join(self.folder.name, "runtimes.json"))
+        self.program.spawn = self.spawn
+
+    def tearDown(self):
+        self.program.results_db.close()
+        self.folder.cleanup()
+
+    def spawn(self, path, record = True):
+        return Tests.Pio(path, self.failing, self.trees)
+
+    def run_args(self, node = "r:0:c", files = ["a.cfr", "b.cfr"]):
+        return [[self.cfrs, files], [node, Board.FLOP, "board.json"]]
+
+    def rows(self, table):
+        return [m[1]["values"] for m in self.messages if m[0] == "result_row" and m[1]["table"] == table]
+
+    def testReopensAfterFailedCommand(self):
+        self.failing.add(("calc_results", "a.cfr"))
+        self.program.commandRun(PluginCommands.GET_RESULTS, self.run_args())
+        # the rest of a.cfr runs on the closed connection, b.cfr on a new one
+        self.assertEqual(self.program.errors[0], "ERROR: calc_results failed")
+        self.assertEqual(set(self.program.errors[1:]), {"Solver connection is closed."})
+        self.assertTrue(self.connection.is_alive())
+        rows = self.rows("get_results")
+        self.assertEqual([r[0] for r in rows], ["a.cfr", "b.cfr"])
+        self.assertEqual(rows[1][:6], ["b.cfr", "r:0:c", 30, 25, 31, 26])
+
+    def testExtractSubtrees(self):
+        self.failing.add(("build_tree", "b.cfr"))
+        self.program.commandRun(PluginCommands.EXTRACT_SUBTREES, self.run_args(files = ["a.cfr", "b.cfr", "c.cfr"]))
+        # the extractor is opened again after b.cfr, so c.cfr is still extracted
+        self.assertEqual(self.program.errors, ["ERROR: build_tree failed"])
+        rows = self.rows("subtrees")
+        subtrees = self.cfrs + "\\SUBTREES_board\\"
+        self.assertEqual(rows, [["a.cfr", "r:0:c", subtrees + "a.cfr", 30, 25, 31, 26], ["c.cfr", "r:0:c", subtrees + "c.cfr", 30, 25, 31, 26]])
+        received = self.connection.solver.received
+        self.assertEqual([l for l in received if l.startswith("load_tree")], ["load_tree \"" + subtrees + "a.cfr\"", "load_tree \"" + subtrees + "c.cfr\""])
+        self.assertEqual([l for l in received if l.startswith("dump_tree")], ["dump_tree \"" + subtrees + "a.cfr\" no_turns", "dump_tree \"" + subtrees + "c.cfr\" no_turns"])
+
+    def testPreflight(self):
+        # d.cfr bets 30 after the check where the other files bet 20
+        tree = dict(Tests.Pio.nodes)
+        tree["r:0:c"] = ("IP_DEC", ["r:0:c:c", "r:0:c:b30"])
+        tree["r:0:c:b30"] = tree.pop("r:0:c:b20")
+        self.trees["d.cfr"] = tree
+        nodeBook = {"a.cfr": "r:0:c", "b.cfr": "r:0:b20", "c.cfr": "r:0:c", "d.cfr": "r:0:c"}
+        files = ["a.cfr", "b.cfr", "c.cfr", "d.cfr"]
+        self.program.commandRun(PluginCommands.PREFLIGHT, [[self.cfrs, files], ["weights.json", {"top_pair": 50}], [nodeBook, Board.FLOP, "board.json"]])
+        report = self.program.results_paths[0]
+        with open(report, newline="") as f:
+            rows = list(csv.reader(f))[1:]
+        self.assertEqual([r[:3] for r in rows], [["a.cfr", "r:0:c", "ok"], ["b.cfr", "r:0:b20", "problem"], ["c.cfr", "r:0:c", "ok"], ["d.cfr", "r:0:c", "problem"]])
+        self.assertEqual(rows[1][3], "ERROR: no such node r:0:b20")
+        self.assertEqual(rows[3][3], "the actions after the node are c, b30 where most files have c, b20")
+        self.assertEqual(len(self.program.errors), 2)
+        
+        # quads can't be made on an unpaired flop
+        rows = self.program.preflight_check(self.cfrs, ["a.cfr"], "r:0:c", {"quads": 50})
+        self.assertEqual(rows, [["a.cfr", "r:0:c", "problem", "quads has no combos in OOP's range at r:0"]])
+
+    def testProgressive(self):
+        self.program.commandRun(PluginCommands.RUN_PROGRESSIVE, self.run_args())
+        self.assertEqual(self.program.errors, [])
+        for number in [1, 2, 3]:
+            self.assertEqual([r[0] for r in self.rows("pass " + str(number))], ["a.cfr", "b.cfr"])
+        received = self.connection.solver.received
+        # 4, 2 and 1 times the accuracy setting of 0.2, of a pot of 55
+        self.assertEqual([l for l in received if l.startswith("set_accuracy")], ["set_accuracy 44.0"] * 2 + ["set_accuracy 22.0"] * 2 + ["set_accuracy 11.0"] * 2)
+        # only the last pass saves without the turns
+        self.assertEqual([l.endswith(" no_turns") for l in received if l.startswith("dump_tree")], [False] * 4 + [True] * 2)
+        self.assertEqual(len(self.program.results_paths), 3)
+        self.assertEqual(self.connection.accuracy, 0.2)
+
+    def testProgressiveStops(self):
+        notify = self.program.notify
+        def stopAtPass2(message, msg_type = "notification"):
+            if message == "Pass 2 of 3: solving to an accuracy of 0.4.":
+                self.program.stop()
+            notify(message, msg_type)
+        self.program.notify = stopAtPass2
+        self.program.commandRun(PluginCommands.RUN_PROGRESSIVE, self.run_args())
+        self.assertEqual(len(self.rows("pass 1")), 2)
+        self.assertEqual(self.rows("pass 2"), [])
+        self.assertIn(["notification", "Stopped during pass 2."], self.messages)
+        self.assertEqual(len(self.program.results_paths), 1)
+
+    def testCachedResults(self):
+        self.failing.add(("calc_results", "b.cfr"))
+        self.program.commandRun(PluginCommands.GET_RESULTS, self.run_args())
+        first = self.rows("get_results")
+        self.failing.clear()
+        self.messages = []
+        self.program.commandRun(PluginCommands.GET_RESULTS, self.run_args())
+        # b.cfr failed the first time, so it wasn't cached
+        self.assertEqual([m[1] for m in self.messages if m[1] in ["Using cached results for a.cfr.", "Using cached results for b.cfr."]], ["Using cached results for a.cfr."])
+        self.assertEqual(self.rows("get_results")[0], first[0])
+        self.assertEqual(self.rows("get_results")[1][:3], ["b.cfr", "r:0:c", 30])
+        
+        # the same contents under another name share the entry, with the name changed in the row
+        with open(os.path.join(self.cfrs, "d.cfr"), "w") as f:
+            f.write("a.cfr")
+        self.messages = []
+        self.program.commandRun(PluginCommands.GET_RESULTS, self.run_args(files = ["d.cfr"]))
+        self.assertEqual(self.rows("get_results"), [["d.cfr"] + first[0][1:]])
+        
+        # a different command on the same file isn't cached
+        self.messages = []
+        self.program.commandRun(PluginCommands.RUN_FULL_SAVE, self.run_args(files = ["a.cfr"]))
+        self.assertNotIn(["notification", "Using cached results for a.cfr."], self.messages)
+
+    def testCachedMatches(self):
+        self.program.commandRun(PluginCommands.GET_RESULTS, self.run_args(node = "r:0:*:f"))
+        first = self.rows("get_results")
+        self.assertEqual([r[:2] for r in first], [["a.cfr", "r:0:b10:f"], ["b.cfr", "r:0:b10:f"]])
+        loads = len([l for l in self.connection.solver.received if l.startswith("load_tree")])
+        self.messages = []
+        self.program.commandRun(PluginCommands.GET_RESULTS, self.run_args(node = "r:0:*:f"))
+        self.assertEqual(self.rows("get_results"), first)
+        self.assertEqual(len([l for l in self.connection.solver.received if l.startswith("load_tree")]), loads)
+
+    def testWeightSweep(self):
+        from combos import comboIndex
+        args = [[self.cfrs, ["a.cfr", "b.cfr"]], ["weights.json", {"top_pair": [0, 100]}], ["r:0:c", Board.FLOP, "board.json"]]
+        self.program.commandRun(PluginCommands.WEIGHT_SWEEP, args)
+        self.assertEqual(self.program.errors, [])
+        rows = self.rows("sweep")
+        # 4 EVs and the frequencies of 2 sisters and 2 children, at each weight
+        self.assertEqual(len(rows), 2 * 2 * 8)
+        self.assertEqual(rows[0], ["a.cfr", "r:0:c", "top_pair", 0, "EV OOP", 30])
+        self.assertEqual(rows[15], ["a.cfr", "r:0:c", "top_pair", 100, "frequency after b20", 50])
+        received = self.connection.solver.received
+        # each file is loaded once and solved on at every weight
+        self.assertEqual(len([l for l in received if l.startswith("load_tree")]), 2)
+        self.assertEqual(len([l for l in received if l == "go"]), 4)
+        # every weight changes the strategy the file started with: top pair checks at the weight, the rest stays even
+        strategies = [l.split(" ")[2:] for l in received if l.startswith("set_strategy")][:2]
+        topPair, underpair = comboIndex["AhQd"], comboIndex["KhKd"]
+        self.assertEqual([float(s[topPair]) for s in strategies], [0, 1])
+        self.assertEqual([float(s[1326 + topPair]) for s in strategies], [1, 0])
+        self.assertEqual([float(s[underpair]) for s in strategies], [0.5, 0.5])
+
+    def testResultRecord(self):
+        title = ["File", "Node", "EVs at root", "EV OOP", "EV IP", "OOP MES", "IP MES", "frequencies at node", "c", "b10", "frequencies after node", "c", "b20"]
+        row = ["a.cfr", "r:0:c", "   ", " 30", " 25", " 31", " 26", "   ", "50.00", "nan", "   ", "50.00", ""]
+        self.assertEqual(Program.result_record(title, row), [
+            ["File", "Node", "EV OOP", "EV IP", "OOP MES", "IP MES", "frequencies at node: c", "frequencies at node: b10", "frequencies after node: c", "frequencies after node: b20"],
+            ["a.cfr", "r:0:c", 30.0, 25.0, 31.0, 26.0, 50.0, "nan", 50.0, ""]])
+
+    def testStreamRows(self):
+        self.program.commandRun(PluginCommands.GET_RESULTS, self.run_args())
+        messages = [m[1] for m in self.messages if m[0] == "result_row"]
+        self.assertEqual([[m["table"], m["seq"], "columns" in m] for m in messages], [["get_results", 0, True], ["get_results", 1, False]])
+        self.assertEqual(messages[0]["columns"][:3], ["File", "Node", "EV OOP"])
+        # the rows are recorded with the board from the tree's index
+        recorded = self.program.results_db.rows({"table": "get_results"})["rows"]
+        self.assertEqual([[r["cfr"], r["node"], r["board"], r["seq"]] for r in recorded], [["a.cfr", "r:0:c", "As5h3s", 0], ["b.cfr", "r:0:c", "As5h3s", 1]])
+        self.assertEqual(recorded[1]["values"], messages[1]["values"])
+
+
 if __name__ == '__main__': 
     unittest.main() 
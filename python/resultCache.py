@@ -0,0 +1,162 @@
+from __future__ import annotations
+import threading
+import unittest
+import tempfile
+import hashlib
+import json
+import time
+import os
+
+# results of earlier runs, keyed by a hash of the .cfr file's contents and everything else the result depends on
+# (command, node, weights, accuracy, save type), so re-running an identical request doesn't solve again.
+# PIOSPEED_NO_CACHE=1 turns it off; PIOSPEED_CACHE moves it.
+cachePath = os.environ.get("PIOSPEED_CACHE", os.path.join(os.path.expanduser("~"), ".piospeed", "results"))
+cacheEnabled = os.environ.get("PIOSPEED_NO_CACHE") != "1"
+
+chunkSize = 1024 * 1024
+
+
+class ResultCache():
+
+    def __init__(self, folder : str = cachePath, max_entries : int = 5000, enabled : bool = cacheEnabled) -> None:
+        self.folder = folder
+        self.indexPath = os.path.join(folder, "index.json")
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        # key -> {"row", "tree", "strategy", ..., "last_used"}
+        self.entries : dict[str, dict] = None
+        # path -> [mtime_ns, size, digest], so unchanged files aren't hashed again
+        self.digests : dict[str, list] = None
+
+    def load(self) -> None:
+        if self.entries is not None:
+            return
+        try:
+            with open(self.indexPath) as f:
+                saved = json.load(f)
+            self.entries, self.digests = saved["entries"], saved["digests"]
+        except (OSError, ValueError, KeyError):
+            self.entries, self.digests = {}, {}
+
+    def save(self) -> None:
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            temporary = self.indexPath + ".tmp"
+            with open(temporary, "w") as f:
+                json.dump({"entries": self.entries, "digests": self.digests}, f)
+            os.replace(temporary, self.indexPath)
+        except OSError:
+            pass
+
+    # the sha256 of a file's contents, or None if it doesn't exist
+    def file_digest(self, path : str) -> str:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        with self.lock:
+            self.load()
+            known = self.digests.get(path)
+        if known and known[0] == stat.st_mtime_ns and known[1] == stat.st_size:
+            return known[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(chunkSize):
+                digest.update(chunk)
+        with self.lock:
+            self.digests[path] = [stat.st_mtime_ns, stat.st_size, digest.hexdigest()]
+        return digest.hexdigest()
+
+    # the key for running something on the file at path; params are everything else the result depends on
+    def key(self, path : str, **params) -> str:
+        if not self.enabled:
+            return None
+        digest = self.file_digest(path)
+        if digest is None:
+            return None
+        request = json.dumps(params, sort_keys=True, default=str)
+        return hashlib.sha256((digest + request).encode("utf-8")).hexdigest()
+
+    # the cached entry for key, or None. entries whose saved tree has since been deleted don't count
+    def get(self, key : str) -> dict:
+        if not self.enabled or key is None:
+            return None
+        with self.lock:
+            self.load()
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry.get("tree") and not os.path.exists(entry["tree"]):
+                del self.entries[key]
+                return None
+            entry["last_used"] = time.time()
+            return entry
+
+    # stores a result under every key given (e.g. for both the input file and the tree it was saved as)
+    # row : the CSV row(s), tree : where the tree was saved, strategy : where a strategy was exported to
+    def put(self, keys : list[str], row = None, tree : str = None, strategy : str = None, **extra) -> None:
+        keys = [k for k in keys if k]
+        if not self.enabled or not keys:
+            return
+        entry = {"row": row, "tree": tree, "strategy": strategy, "last_used": time.time()}
+        entry.update(extra)
+        with self.lock:
+            self.load()
+            for k in keys:
+                self.entries[k] = entry
+            self.evict()
+            self.save()
+
+    # drops the least recently used entries beyond max_entries, and digests of files no entry can use any more
+    def evict(self) -> None:
+        if len(self.entries) > self.max_entries:
+            newest = sorted(self.entries, key=lambda k: self.entries[k]["last_used"], reverse=True)
+            self.entries = {k: self.entries[k] for k in newest[:self.max_entries]}
+        if len(self.digests) > 4 * self.max_entries:
+            self.digests = dict(list(self.digests.items())[-self.max_entries:])
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries, self.digests = {}, {}
+            self.save()
+
+
+class Tests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.folder = self.directory.name
+        self.tree = os.path.join(self.folder, "tree.cfr")
+        with open(self.tree, "w") as f:
+            f.write("tree")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def testHitsOnlyIdenticalRequests(self):
+        cache = ResultCache(self.folder, max_entries=2)
+        key = cache.key(self.tree, command="run_full", node="r:0:c", accuracy="0.2")
+        cache.put([key], row=["tree.cfr", "r:0:c", "1.5"], tree=self.tree)
+        self.assertEqual(cache.get(key)["row"][2], "1.5")
+        self.assertIsNone(cache.get(cache.key(self.tree, command="run_full", node="r:0:c", accuracy="0.1")))
+        # reloaded from disk
+        self.assertIsNotNone(ResultCache(self.folder).get(key))
+
+        with open(self.tree, "w") as f:
+            f.write("a different tree")
+        self.assertNotEqual(cache.key(self.tree, command="run_full", node="r:0:c", accuracy="0.2"), key)
+
+    def testEvictsAndBypasses(self):
+        cache = ResultCache(self.folder, max_entries=2)
+        for i in range(3):
+            cache.put(["key" + str(i)], row=[i])
+            time.sleep(0.01)
+        cache.get("key1")
+        cache.put(["key3"], row=[3])
+        self.assertEqual(sorted(cache.entries), ["key1", "key3"])
+        self.assertIsNone(ResultCache(self.folder, enabled=False).get("key1"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,234 @@
+from __future__ import annotations
+from datetime import datetime
+import threading
+import sqlite3
+import unittest
+import tempfile
+import hashlib
+import json
+import os
+
+# every run, file and result row in one SQLite database for all runs on this machine, so results can be paged, filtered
+# and compared without reading CSVs. WAL mode lets several processes (the app, the cli, workers) write at the same time.
+# PIOSPEED_RESULTS_DB moves it; PIOSPEED_RESULTS_DB=off turns it off.
+dbSetting = os.environ.get("PIOSPEED_RESULTS_DB")
+dbPath = dbSetting if dbSetting and dbSetting != "off" else os.path.join(os.path.expanduser("~"), ".piospeed", "results.db")
+dbEnabled = dbSetting != "off"
+
+# the most rows a query returns at once
+maxPageSize = 1000
+
+schema = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY, command TEXT, started TEXT, finished TEXT, status TEXT, folder TEXT, board_type TEXT,
+    board_file TEXT, weights_file TEXT, weights_hash TEXT, weights TEXT, accuracy REAL, results TEXT, errors INTEGER);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY, run_id INTEGER REFERENCES runs(id), folder TEXT, cfr TEXT, digest TEXT, board TEXT,
+    succeeded INTEGER, seconds REAL, stages TEXT);
+CREATE TABLE IF NOT EXISTS result_rows (
+    id INTEGER PRIMARY KEY, run_id INTEGER REFERENCES runs(id), file_id INTEGER REFERENCES files(id), result_table TEXT,
+    seq INTEGER, cfr TEXT, board TEXT, node TEXT, weights_hash TEXT, columns TEXT, row TEXT);
+CREATE INDEX IF NOT EXISTS runs_weights ON runs(weights_hash);
+CREATE INDEX IF NOT EXISTS files_run ON files(run_id);
+CREATE INDEX IF NOT EXISTS files_cfr ON files(cfr);
+CREATE INDEX IF NOT EXISTS files_board ON files(board);
+CREATE INDEX IF NOT EXISTS rows_run ON result_rows(run_id, result_table, seq);
+CREATE INDEX IF NOT EXISTS rows_file ON result_rows(file_id);
+CREATE INDEX IF NOT EXISTS rows_cfr ON result_rows(cfr);
+CREATE INDEX IF NOT EXISTS rows_board ON result_rows(board);
+CREATE INDEX IF NOT EXISTS rows_node ON result_rows(node);
+CREATE INDEX IF NOT EXISTS rows_weights ON result_rows(weights_hash);
+"""
+
+# query filters -> the column they match; node may use * and ? like a file name (r:0:c:*)
+rowFilters = {"run": "run_id", "table": "result_table", "cfr": "cfr", "board": "board", "node": "node", "weights_hash": "weights_hash"}
+
+
+# identifies a weights map by its contents, whichever file it came from
+def weightsHash(weights_map : dict) -> str:
+    if weights_map is None:
+        return None
+    return hashlib.sha256(json.dumps(weights_map, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+class ResultsDB():
+
+    def __init__(self, path : str = dbPath, enabled : bool = dbEnabled) -> None:
+        self.path = path
+        self.enabled = enabled
+        # sqlite connections can't be shared between threads, so each thread opens its own
+        self.local = threading.local()
+        # opening one sets up the database; a connection set up while another switches the file to WAL can fail its first write
+        self.setup_lock = threading.Lock()
+
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with self.setup_lock:
+                # autocommit: every statement is its own transaction, so other writers wait at most one insert (timeout: how long)
+                connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute("PRAGMA synchronous=NORMAL")
+                connection.executescript(schema)
+            self.local.connection = connection
+        return connection
+
+    # runs an insert or update; a locked or unwritable database never fails a run, it just isn't recorded
+    def write(self, sql : str, params : list) -> int:
+        if not self.enabled:
+            return None
+        try:
+            return self.connection().execute(sql, params).lastrowid
+        except (sqlite3.Error, OSError):
+            return None
+
+    def read(self, sql : str, params : list) -> list[sqlite3.Row]:
+        connection = self.connection()
+        connection.row_factory = sqlite3.Row
+        return connection.execute(sql, params).fetchall()
+
+    def close(self) -> None:
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+    # ---------- recording ----------
+
+    # returns the run's ID, or None if it isn't recorded
+    def start_run(self, command : str, folder : str = None, board_type : str = None, board_file : str = None,
+                  weights_file : str = None, weights_map : dict = None, accuracy : float = None) -> int:
+        return self.write("INSERT INTO runs (command, started, status, folder, board_type, board_file, weights_file, weights_hash, weights, accuracy) "
+                          "VALUES (?, ?, 'running', ?, ?, ?, ?, ?, ?, ?)",
+                          [command, datetime.now().isoformat(timespec="seconds"), folder, board_type, board_file, weights_file,
+                           weightsHash(weights_map), json.dumps(weights_map, default=str) if weights_map is not None else None,
+                           float(accuracy) if accuracy is not None else None])
+
+    def finish_run(self, run : int, status : str, results : list[str], errors : int) -> None:
+        if run is not None:
+            self.write("UPDATE runs SET finished = ?, status = ?, results = ?, errors = ? WHERE id = ?",
+                       [datetime.now().isoformat(timespec="seconds"), status, json.dumps(results), errors, run])
+
+    def add_file(self, run : int, folder : str, cfr : str, digest : str, board : str, succeeded : bool, seconds : float, stages : dict) -> int:
+        if run is None:
+            return None
+        return self.write("INSERT INTO files (run_id, folder, cfr, digest, board, succeeded, seconds, stages) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                          [run, folder, cfr, digest, board, int(succeeded), round(seconds, 3), json.dumps({k: round(v, 3) for k, v in stages.items()})])
+
+    # columns, values : the row as Program.result_record gives it
+    def add_row(self, run : int, file : int, table : str, seq : int, cfr : str, board : str, node : str, weights_hash : str, columns : list, values : list) -> None:
+        if run is not None:
+            self.write("INSERT INTO result_rows (run_id, file_id, result_table, seq, cfr, board, node, weights_hash, columns, row) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       [run, file, table, seq, cfr, board, node, weights_hash, json.dumps(columns), json.dumps(values, default=str)])
+
+    # ---------- queries ----------
+
+    # the latest runs, with how many files and rows they have
+    def runs(self, command : str = None, page : int = 0, page_size : int = 50) -> dict:
+        where, params = ("WHERE command = ?", [command]) if command else ("", [])
+        total = self.read("SELECT COUNT(*) FROM runs " + where, params)[0][0]
+        page_size = min(max(1, page_size), maxPageSize)
+        runs = self.read("SELECT runs.*, (SELECT COUNT(*) FROM files WHERE run_id = runs.id) AS files, "
+                         "(SELECT COUNT(*) FROM result_rows WHERE run_id = runs.id) AS rows FROM runs " + where +
+                         " ORDER BY id DESC LIMIT ? OFFSET ?", params + [page_size, page * page_size])
+        return {"total": total, "page": page, "runs": [dict(r, results=json.loads(r["results"] or "[]"), weights=json.loads(r["weights"] or "null")) for r in runs]}
+
+    # filters : any of rowFilters; rows come in the order they were produced
+    def rows(self, filters : dict = None, page : int = 0, page_size : int = 100) -> dict:
+        where, params = [], []
+        for name, value in (filters or {}).items():
+            if name not in rowFilters:
+                raise Exception("Unknown filter " + name + " - use " + ", ".join(rowFilters))
+            if value is None:
+                continue
+            where.append(rowFilters[name] + (" GLOB ?" if name == "node" else " = ?"))
+            params.append(value)
+        clause = " WHERE " + " AND ".join(where) if where else ""
+        total = self.read("SELECT COUNT(*) FROM result_rows" + clause, params)[0][0]
+        page_size = min(max(1, page_size), maxPageSize)
+        rows = self.read("SELECT * FROM result_rows" + clause + " ORDER BY run_id DESC, result_table, seq LIMIT ? OFFSET ?",
+                         params + [page_size, page * page_size])
+        return {"total": total, "page": page, "rows": [ResultsDB.rowRecord(r) for r in rows]}
+
+    # the rows of two runs side by side, matched by table, file and node; a row only one run has gets None for the other
+    def compare(self, run_a : int, run_b : int, table : str = None) -> dict:
+        matched : dict[tuple, dict] = {}
+        for side, run in [["a", run_a], ["b", run_b]]:
+            params = [run] + ([table] if table else [])
+            for r in self.read("SELECT * FROM result_rows WHERE run_id = ?" + (" AND result_table = ?" if table else "") + " ORDER BY seq", params):
+                record = ResultsDB.rowRecord(r)
+                key = (r["result_table"], r["cfr"], r["node"])
+                pair = matched.setdefault(key, {"table": key[0], "cfr": key[1], "node": key[2], "columns": record["columns"], "a": None, "b": None})
+                pair[side] = record["values"]
+        return {"a": run_a, "b": run_b, "rows": list(matched.values())}
+
+    @staticmethod
+    def rowRecord(r : sqlite3.Row) -> dict:
+        return {"run": r["run_id"], "table": r["result_table"], "seq": r["seq"], "cfr": r["cfr"], "board": r["board"], "node": r["node"],
+                "weights_hash": r["weights_hash"], "columns": json.loads(r["columns"]), "values": json.loads(r["row"])}
+
+    # answers a 'query' message: {"kind": "runs" | "rows" | "compare", ...the arguments of that method}
+    def query(self, request : dict) -> dict:
+        kind = request.get("kind", "rows")
+        if kind == "runs":
+            result = self.runs(request.get("command"), int(request.get("page", 0)), int(request.get("page_size", 50)))
+        elif kind == "rows":
+            result = self.rows(request.get("filters"), int(request.get("page", 0)), int(request.get("page_size", 100)))
+        elif kind == "compare":
+            result = self.compare(int(request["a"]), int(request["b"]), request.get("table"))
+        else:
+            raise Exception("Unknown query " + str(kind) + " - use runs, rows or compare")
+        result["kind"] = kind
+        if "id" in request:
+            result["id"] = request["id"]
+        return result
+
+
+class Tests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "results.db")
+        self.db = ResultsDB(self.path)
+
+    def tearDown(self):
+        self.db.close()
+        self.folder.cleanup()
+
+    def record(self, db : ResultsDB, weights : dict, value : float) -> int:
+        run = db.start_run("nodelock", "C:\\trees", "FLOP", "board.json", "weights.json", weights, 0.2)
+        for seq, cfr in enumerate(["Ah7sKd.cfr", "Qh7s10d.cfr"]):
+            file = db.add_file(run, "C:\\trees", cfr, "digest", cfr[:-4], True, 1.5, {"solve": 1.2})
+            db.add_row(run, file, "solved", seq, cfr, cfr[:-4], "r:0:c", weightsHash(weights), ["File", "Node", "EV OOP"], [cfr, "r:0:c", value])
+        db.finish_run(run, "completed", ["C:\\trees\\results.csv"], 0)
+        return run
+
+    def testRecordAndQuery(self):
+        first = self.record(self.db, {"AA": 0.5}, 1.0)
+        second = self.record(self.db, {"AA": 0.75}, 2.0)
+        runs = self.db.query({"kind": "runs", "id": 7})
+        self.assertEqual([r["id"] for r in runs["runs"]], [second, first])
+        self.assertEqual(runs["runs"][0]["rows"], 2)
+        self.assertEqual(runs["id"], 7)
+        page = self.db.rows({"run": first, "node": "r:0:*"}, page=1, page_size=1)
+        self.assertEqual(page["total"], 2)
+        self.assertEqual(page["rows"][0]["values"], ["Qh7s10d.cfr", "r:0:c", 1.0])
+        self.assertEqual(self.db.rows({"weights_hash": weightsHash({"AA": 0.75})})["total"], 2)
+        compared = self.db.compare(first, second)
+        self.assertEqual([[r["cfr"], r["a"][2], r["b"][2]] for r in compared["rows"]], [["Ah7sKd.cfr", 1.0, 2.0], ["Qh7s10d.cfr", 1.0, 2.0]])
+        self.assertRaises(Exception, self.db.rows, {"nonsense": 1})
+
+    def testConcurrentWriters(self):
+        # every thread writes through its own connection, as separate worker processes would
+        threads = [threading.Thread(target=self.record, args=[self.db, {"AA": i}, i]) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(self.db.runs()["total"], 8)
+        self.assertEqual(self.db.rows()["total"], 16)
+
+
+if __name__ == '__main__':
+    unittest.main()
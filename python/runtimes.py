@@ -0,0 +1,148 @@
+from __future__ import annotations
+from datetime import datetime, timedelta
+import statistics
+import threading
+import unittest
+import tempfile
+import json
+import os
+
+# how long files took, by stage, so later runs can be predicted: an ETA while a batch runs,
+# and the order to hand files to a solver pool in (longest first).
+historyPath = os.environ.get("PIOSPEED_HISTORY", os.path.join(os.path.expanduser("~"), ".piospeed", "runtimes.json"))
+
+
+# what a file's run time is predicted from
+def fileFeatures(path : str, command : str, board : str = None, save_type : str = None, accuracy : float = None) -> dict:
+    size = os.path.getsize(path) if os.path.isfile(path) else 0
+    return {"command": command, "board": board, "save_type": save_type,
+            "accuracy": float(accuracy) if accuracy is not None else None, "size": size}
+
+
+class RuntimeHistory():
+
+    def __init__(self, path : str = historyPath, max_records : int = 5000) -> None:
+        self.path = path
+        self.max_records = max_records
+        self.records : list[dict] = None
+        self.lock = threading.Lock()
+
+    def load(self) -> list[dict]:
+        if self.records is None:
+            try:
+                with open(self.path) as f:
+                    self.records = json.load(f)
+            except (OSError, ValueError):
+                self.records = []
+        return self.records
+
+    # stages : seconds spent in each stage (load, solve, results, save...)
+    def record(self, features : dict, stages : dict[str, float]) -> None:
+        with self.lock:
+            records = self.load()
+            records.append({"features": features, "stages": {k: round(v, 3) for k, v in stages.items()},
+                            "seconds": round(sum(stages.values()), 3)})
+            del records[:-self.max_records]
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                temporary = self.path + ".tmp"
+                with open(temporary, "w") as f:
+                    json.dump(records, f)
+                os.replace(temporary, self.path)
+            except OSError:
+                pass
+
+    # the records most like features: same command, board and save type if there are any, then same command, then all
+    def similar(self, features : dict) -> list[dict]:
+        records = [r for r in self.load() if r["seconds"] > 0]
+        for keys in [["command", "board", "save_type"], ["command"]]:
+            matching = [r for r in records if all(r["features"].get(k) == features.get(k) for k in keys)]
+            if matching:
+                return matching
+        return records
+
+    # predicted seconds for a file, or None without any history.
+    # time is assumed to grow with file size and with how much tighter the accuracy is
+    def predict(self, features : dict) -> float:
+        with self.lock:
+            records = self.similar(features)
+        if not records:
+            return None
+        size = features.get("size") or 0
+        # per byte when sizes are known, otherwise per file
+        perSize = bool(size) and all(r["features"].get("size") for r in records)
+        rates = []
+        for r in records:
+            seconds = r["seconds"]
+            accuracy, recorded = features.get("accuracy"), r["features"].get("accuracy")
+            if accuracy and recorded:
+                seconds = seconds * recorded / accuracy
+            rates.append(seconds / r["features"]["size"] if perSize else seconds)
+        rate = statistics.median(rates)
+        return rate * size if perSize else rate
+
+
+# the ETA of one batch: predictions are corrected by how the finished files compared to theirs
+class Estimator():
+
+    def __init__(self, predictions : list) -> None:
+        self.predictions = predictions
+        self.actual : dict[int, float] = {}
+
+    def done(self, index : int, seconds : float) -> None:
+        self.actual[index] = seconds
+
+    def remaining(self) -> float:
+        predicted = [self.predictions[i] for i in self.actual if self.predictions[i]]
+        factor = sum(self.actual[i] for i in self.actual if self.predictions[i]) / sum(predicted) if predicted else 1
+        average = sum(self.actual.values()) / len(self.actual) if self.actual else None
+        left = 0
+        for i, prediction in enumerate(self.predictions):
+            if i in self.actual:
+                continue
+            if prediction:
+                left += prediction * factor
+            elif average is not None:
+                left += average
+            else:
+                return None
+        return left
+
+    def message(self) -> dict:
+        left = self.remaining()
+        return {"done": len(self.actual), "total": len(self.predictions),
+                "seconds_left": round(left) if left is not None else None,
+                "finish_at": (datetime.now() + timedelta(seconds=left)).isoformat(timespec="seconds") if left is not None else None}
+
+
+# indexes of costs from largest to smallest, unknown costs last (longest processing time first)
+def longestFirst(costs : list) -> list[int]:
+    return sorted(range(len(costs)), key=lambda i: -(costs[i] or 0))
+
+
+class Tests(unittest.TestCase):
+
+    def testPredictsFromSimilarFiles(self):
+        with tempfile.TemporaryDirectory() as folder:
+            history = RuntimeHistory(os.path.join(folder, "runtimes.json"))
+            history.record({"command": "run_full", "board": "FLOP", "save_type": None, "accuracy": 0.2, "size": 100}, {"load": 10, "solve": 90})
+            history.record({"command": "run_full", "board": "FLOP", "save_type": None, "accuracy": 0.2, "size": 200}, {"load": 20, "solve": 180})
+            history.record({"command": "get_results", "board": "FLOP", "save_type": None, "accuracy": 0.2, "size": 100}, {"load": 10})
+            self.assertAlmostEqual(history.predict({"command": "run_full", "board": "FLOP", "save_type": None, "accuracy": 0.2, "size": 300}), 300)
+            self.assertAlmostEqual(history.predict({"command": "run_full", "board": "FLOP", "save_type": None, "accuracy": 0.1, "size": 100}), 200)
+            self.assertAlmostEqual(history.predict({"command": "get_results", "board": "TURN", "size": 50}), 5)
+            self.assertEqual(len(RuntimeHistory(history.path).load()), 3)
+
+    def testEstimator(self):
+        eta = Estimator([100, 50, None, 10])
+        self.assertIsNone(eta.remaining())
+        eta.done(0, 200)
+        eta.done(2, 20)
+        # the first file took twice its prediction
+        self.assertEqual(eta.remaining(), 120)
+        self.assertEqual(eta.message()["done"], 2)
+        self.assertEqual(longestFirst([5, None, 20, 1]), [2, 0, 3, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
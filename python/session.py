@@ -0,0 +1,83 @@
+from __future__ import annotations
+from collections import deque
+import unittest
+import uuid
+import time
+
+
+# state that outlives a single Electron connection: which messages were sent and what job is running.
+# a client that reconnects with the session id and the last sequence number it saw gets the messages it missed.
+class Session():
+
+    # messages that are part of the connection handshake and never replayed
+    handshakeMessages = ['python ready', 'hi!', 'session resumed']
+
+    def __init__(self, max_buffered : int = 2000) -> None:
+        self.id = uuid.uuid4().hex
+        self.seq = 0
+        # the most recent outgoing messages as (sequence number, message)
+        self.buffer : deque = deque(maxlen=max_buffered)
+        # the command currently (or last) run; None until the first command
+        self.job : dict = None
+
+    # numbers an outgoing message and keeps it for replay
+    def record(self, message : dict) -> dict:
+        if message.get("type") in Session.handshakeMessages:
+            return message
+        self.seq = self.seq + 1
+        message["seq"] = self.seq
+        self.buffer.append((self.seq, message))
+        return message
+
+    # the buffered messages sent after last_seq, oldest first
+    # missed is True when some of them were already dropped from the buffer
+    def since(self, last_seq : int) -> list:
+        messages = [m for seq, m in self.buffer if seq > last_seq]
+        oldest = self.buffer[0][0] if self.buffer else self.seq + 1
+        missed = last_seq + 1 < oldest and last_seq < self.seq
+        return [messages, missed]
+
+    def start_job(self, command : str, args : dict) -> None:
+        self.job = {"command": command, "args": args, "status": "running", "started": time.time()}
+
+    def finish_job(self, status : str, error : str = None) -> None:
+        if self.job is not None:
+            self.job["status"] = status
+            self.job["finished"] = time.time()
+            if error:
+                self.job["error"] = error
+
+    def is_busy(self) -> bool:
+        return self.job is not None and self.job["status"] == "running"
+
+
+class Tests(unittest.TestCase):
+
+    def testReplaysMissedMessages(self):
+        session = Session(max_buffered=3)
+        for i in range(5):
+            session.record({"type": "notification", "data": i})
+        session.record({"type": "hi!", "data": None})
+
+        messages, missed = session.since(3)
+        self.assertEqual([m["data"] for m in messages], [3, 4])
+        self.assertFalse(missed)
+
+        messages, missed = session.since(0)
+        self.assertEqual([m["data"] for m in messages], [2, 3, 4])
+        self.assertTrue(missed)
+
+        self.assertEqual(session.since(5), [[], False])
+
+    def testJobState(self):
+        session = Session()
+        self.assertFalse(session.is_busy())
+        session.start_job("run_mini", {})
+        self.assertTrue(session.is_busy())
+        session.finish_job("failed", "boom")
+        self.assertEqual(session.job["status"], "failed")
+        self.assertFalse(session.is_busy())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,11 +2,14 @@
 from __future__ import annotations
 from stringFunc import parseEV, toFloat, parseTreeInfoToMap, parseNodeIDtoList, makeNodeIDfromList
 from inputs import BoardFile, Decisions
-from SolverConnection.solver import Solver
+from SolverConnection.solver import Solver, SolverException
 from decimal import Decimal
 from treeops import TreeOperator, normalizeWeight, nodeInfo
 consoleLog = False
 
+# commands written ahead of reading their output in pipeline()
+pipelineDepth = 64
+
 # functions that transmit commands to the solver to get correct output
 class SolverCommmand():
     def __init__(self, connection) -> None:
@@ -75,6 +78,14 @@ class SolverCommmand():
         else:
             return False
 
+    # loads only the tree itself (no load_all_nodes or rebuild_forgotten_streets), which is enough to look at its nodes.
+    # unlike load_tree, failures raise without closing the connection
+    def peek_tree(self, cfrFilePath):
+        output = self.connection.command("load_tree \"" + cfrFilePath + "\"")
+        if not any("load_tree ok" in line for line in output):
+            raise Exception("Could not load " + cfrFilePath + ": " + " ".join(output))
+        return True
+
     def getTreeInfo(self):
         self.tryPio(self.connection.command, [""])
     
@@ -90,9 +101,9 @@ class SolverCommmand():
         
         return parseEV(op)
 
+    # starts a fresh solver process on the same connection (a SolverSupervisor also replays the session)
     def resetConnection(self):
-        self.connection.exit()
-        self.connection = Solver(solverPath)
+        self.connection.restart()
         return self.connection
     
     # arg[0] = nodeID
@@ -114,6 +125,35 @@ class SolverCommmand():
         return round(local_frequency, 4) * Decimal(100)
     
     
+    # writes lines pipelineDepth at a time before reading their output, instead of one round trip each.
+    # returns the output of each line, or None for a line the solver rejected
+    def pipeline(self, lines : list[str]) -> list[list[str]]:
+        outputs = []
+        for start in range(0, len(lines), pipelineDepth):
+            batch = lines[start:start + pipelineDepth]
+            self.connection.write_lines(batch)
+            for line in batch:
+                try:
+                    outputs.append(self.connection.read_until_end())
+                except SolverException:
+                    self.connection.read_until_end()
+                    outputs.append(None)
+        return outputs
+
+    # getActionFrequency for every node, with the line frequencies of the nodes and their parents read in one pipeline.
+    # returns node -> frequency, or None where it can't be computed
+    def getActionFrequencies(self, nodes : list[str]) -> dict[str, Decimal] :
+        parents = {n: makeNodeIDfromList(parseNodeIDtoList(n)[:-1]) for n in nodes}
+        lines = list(dict.fromkeys(list(nodes) + list(parents.values())))
+        line_freq = {}
+        for line, output in zip(lines, self.pipeline(["calc_line_freq " + l for l in lines])):
+            line_freq[line] = toFloat(output[0]) if output else None
+        frequencies = {}
+        for n in nodes:
+            freq, k = line_freq[n], line_freq[parents[n]]
+            frequencies[n] = round(freq / k, 4) * Decimal(100) if type(freq) is Decimal and type(k) is Decimal and k else None
+        return frequencies
+    
     # arg[0] = percentage
     def setAccuracy(self, args : list) :
         percent = normalizeWeight(args[0])
@@ -148,7 +188,7 @@ class SolverCommmand():
         self.tryPio(self.connection.command, ["set_pot " + info.pot])
         self.tryPio(self.connection.command, ["set_board " + info.board])
         
-        self.run_until("build_tree", "build_tree ok!")
+        return self.run_until("build_tree", "build_tree ok!")
         
         
     # arg[0] = path
@@ -157,7 +197,7 @@ class SolverCommmand():
         command = "dump_tree \"" + args[0] + "\""
         if len(args) > 1 and args[1]:
             command = command + " " + args[1]
-        self.run_until(command, "dump_tree ok!")
+        return self.run_until(command, "dump_tree ok!")
     
 def parseNodeLinetoBetSizes (line : str) -> str:
     size = 0
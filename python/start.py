@@ -1,12 +1,16 @@
 from __future__ import annotations
 import asyncio
+import os
 from bridge import MessageQueue
 
+# Electron connects to this path; the startup benchmark overrides it to run alongside the app
+socketPath = os.environ.get("PIOSPEED_SOCKET", "/tmp/electron_python.sock")
+
 async def main():
     try:
         print("\n\n\n\n===============Python Process Starting===============\n\n")
         # initialize message queue
-        bridge = MessageQueue()
+        bridge = MessageQueue(socketPath)
         
         # Start the bridge and wait for it to be ready
         await bridge.run()
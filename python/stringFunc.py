@@ -53,6 +53,21 @@ def parseNodeIDtoList(nodeID : str) -> list[str]:
         nodes[0] = "r:0"
     return nodes
 
+# show_children output, one block of lines per child, blocks separated by ''
+# ['child 0:', 'r:0:c:b16', 'OOP_DEC', 'As 5h 3s', '0 16 55', '3 children', 'flags: PIO_CFR', '', 'child 1:', ...]
+def parseChildrenToList(output : list[str]) -> list[list[str]]:
+    children = []
+    child = []
+    for o in output:
+        if o == '':
+            children.append(child)
+            child = []
+        else:
+            child.append(o)
+    if child:
+        children.append(child)
+    return children
+
 def parseStrategyToList (strategy : list[str]) -> list[list[float]] :
     for i in range(0,len(strategy)):
         strategy[i] = parseStringToList(strategy[i])
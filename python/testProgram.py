@@ -9,8 +9,6 @@ import unittest
 import random
 import asyncio
 import os
-from fileIO import JSONtoMap
-from bridge import Message
 
 class Program:
     
@@ -26,6 +24,7 @@ class Program:
         self.notify = notify_func
         self.results_dir = None  # Will be set via message from frontend
         self.accuracy = 0.02  # Default accuracy
+        self.stop_requested = False
         
     def set_results_dir(self, path: str):
         """Set the results directory path"""
@@ -58,6 +57,79 @@ class Program:
             name = "resaved without turns"
         await self.send_command_summary(name, files, None, None, None)
         
+    def stop(self):
+        self.stop_requested = True
+        
+    # args[0][0] : the folder path
+    # args[0][1] : list of .cfr files
+    async def solve_progressive(self, args : list[str]):
+        folder, cfrFiles = args[0]
+        self.stop_requested = False
+        for number, step in enumerate([4, 2, 1]):
+            self.notify("Pass " + str(number + 1) + " of 3: solving to an accuracy of " + str(self.accuracy * step) + ".")
+            for cfr in cfrFiles:
+                if self.stop_requested:
+                    self.notify("Stopped during pass " + str(number + 1) + ".")
+                    return
+                await asyncio.sleep(random.uniform(1, 3))
+                self.notify("Saved to: " + folder + "\\" + cfr)
+            self.notify("Saved results to " + folder + "\\results_pass" + str(number + 1) + "_" + timestamp() + ".csv")
+        await self.send_command_summary("progressive run", cfrFiles, None, args[1][0], folder)
+        
+    # args[0][0] : the folder path
+    # args[0][1] : list of .cfr files
+    # args[1][0] : either a string with the nodeID or a map with .cfr file names -> file-specific nodeIDs
+    async def extract_subtrees(self, args : list[str]):
+        folder, cfrFiles = args[0]
+        path = folder + "\\SUBTREES_" + removeExtension(get_file_name_from_path(args[1][2])) + "\\"
+        for cfr in cfrFiles:
+            await asyncio.sleep(random.uniform(1, 3))
+            self.notify("Extracted the subtree of " + cfr + ".")
+            await asyncio.sleep(random.uniform(1, 3))
+            self.notify("Saved to: " + path + cfr)
+        await self.send_command_summary("extracted subtrees", cfrFiles, None, args[1][0], path)
+        
+    # args[0][0] : the folder path
+    # args[0][1] : list of .cfr files
+    # args[1][1] : weights map where one key has a list of weights
+    async def weight_sweep(self, args : list[str]):
+        folder, cfrFiles = args[0]
+        weights_map = args[1][1]
+        category = next((k for k in weights_map if type(weights_map[k]) is list), None)
+        if category is None:
+            raise Exception("weight_sweep needs a weights file where one key has a list of weights.")
+        for cfr in cfrFiles:
+            for weight in weights_map[category]:
+                await asyncio.sleep(random.uniform(0.5, 1.5))
+                self.notify("Solving " + cfr + " with " + category + " at " + str(weight) + ".")
+        path = folder + "\\sweep_" + category + "_" + timestamp() + ".csv"
+        self.notify("Saved results to " + path)
+        await self.send_command_summary("weight sweep", cfrFiles, args[1][0], args[2][0], path)
+        
+    # args[0][0] : the folder path
+    # args[0][1] : list of .cfr files
+    async def preflight(self, args : list[str]):
+        folder, cfrFiles = args[0]
+        self.notify("Checking " + str(len(cfrFiles)) + " files before running...")
+        await asyncio.sleep(random.uniform(1, 3))
+        path = folder + "\\preflight_" + timestamp() + ".csv"
+        self.notify("Preflight: " + str(len(cfrFiles)) + " of " + str(len(cfrFiles)) + " files are ready. Report saved to " + path)
+        await self.send_command_summary("preflight", cfrFiles, args[1][0], args[2][0], path)
+        
+    # args[0][0] : the folder path
+    # args[0][1] : list of .cfr files
+    async def autotune(self, args : list[str]):
+        folder, cfrFiles = args[0]
+        cores = os.cpu_count() or 1
+        processes = 1
+        while processes <= min(cores, 4):
+            self.notify("Timing " + str(processes) + " solver processes with " + str(cores // processes) + " threads each...")
+            await asyncio.sleep(random.uniform(1, 3))
+            processes *= 2
+        path = folder + "\\autotune_" + timestamp() + ".csv"
+        self.notify("Saved results to " + path)
+        await self.send_command_summary("autotune", cfrFiles, None, None, path)
+        
     # new accuracy of solver
     async def update_accuracy(self, args : list[str]):
         await asyncio.sleep(random.uniform(1, 3))
@@ -104,6 +176,26 @@ class Program:
             await self.resave_no_turns(inputtedArgs)
             self.notify("Command completed.")
             return
+        elif command_name == 'run_progressive':
+            await self.solve_progressive(inputtedArgs)
+            self.notify("Command completed.")
+            return
+        elif command_name == 'extract_subtrees':
+            await self.extract_subtrees(inputtedArgs)
+            self.notify("Command completed.")
+            return
+        elif command_name == 'weight_sweep':
+            await self.weight_sweep(inputtedArgs)
+            self.notify("Command completed.")
+            return
+        elif command_name == 'preflight':
+            await self.preflight(inputtedArgs)
+            self.notify("Command completed.")
+            return
+        elif command_name == 'autotune':
+            await self.autotune(inputtedArgs)
+            self.notify("Command completed.")
+            return
         elif command_name == 'set_accuracy':
             await self.update_accuracy(inputtedArgs)
             self.notify("Command completed.")
@@ -161,6 +253,15 @@ class Program:
                     
             #append results for this cfr to csv
             toCSV.append(["", "", "", "", "", "", "", "", ""])
+          
+          # a made up row for the live results table, in the same shape as Program.stream_row
+          row = {"table": "get_results" if not solveFirst else "run", "seq": len(processed_files),
+                 "values": [cfr, nodeBook if type(nodeBook) is str else "r:0", round(random.uniform(0, 50), 3), round(random.uniform(0, 50), 3),
+                            round(random.uniform(80, 100), 3), round(random.uniform(80, 100), 3), round(random.uniform(0, 100), 2)]}
+          if not processed_files:
+              row["columns"] = ["File", "Node", "EV OOP", "EV IP", "OOP MES", "IP MES", "frequencies at node: c"]
+          self.notify(row, "result_row")
+          processed_files.append(cfr)
         
         
         if publish_results:
@@ -178,9 +279,9 @@ class Program:
     # args[2] : [either a string with the nodeID or a map with .cfr file names -> file-specific nodeIDs, board_type]
     async def nodelock_get_results_save(self, args : list[str], solve = False, auto_size = False):
         folder, cfrFiles = args[0]
-        weights_file_path = args[1]
+        weights_file_path = args[1][0]
         weights_file_name = get_file_name_from_path(weights_file_path)
-        weights_map = JSONtoMap(weights_file_path)
+        weights_map = args[1][1]
         
         nodeBook = args[2][0]
         board_type = args[2][1]
@@ -0,0 +1,147 @@
+from __future__ import annotations
+import threading
+import unittest
+import json
+import time
+import os
+
+# records timed spans of a run (commands, files, stages, every solver command) and writes them in the
+# Chrome trace event format, which chrome://tracing and https://ui.perfetto.dev open as a timeline.
+# each solver process gets its own track, so idle gaps and stragglers in pools and pipelines are visible.
+# tracing is off unless a Tracer is started; spans then cost one check.
+# PIOSPEED_TRACE=1 traces every command (the cli also has --trace).
+traceEnabled = os.environ.get("PIOSPEED_TRACE") == "1"
+
+
+class Tracer():
+
+    def __init__(self) -> None:
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self.events : list[dict] = []
+        # (pid, tid) tracks that already have a name
+        self.named : set = set()
+        self.lock = threading.Lock()
+
+    def micros(self, moment : float) -> float:
+        return round((moment - self.origin) * 1000000, 1)
+
+    def track(self, pid : int) -> tuple[int, int]:
+        pid = pid or self.pid
+        tid = threading.get_ident()
+        if (pid, tid) not in self.named:
+            self.named.add((pid, tid))
+            self.events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": threading.current_thread().name}})
+            if pid != self.pid:
+                self.events.append({"name": "process_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": "solver " + str(pid)}})
+        return pid, tid
+
+    # a span from start to end (perf_counter seconds)
+    def complete(self, name : str, category : str, start : float, end : float, pid : int = None, args : dict = None) -> None:
+        with self.lock:
+            pid, tid = self.track(pid)
+            event = {"name": name, "cat": category, "ph": "X", "ts": self.micros(start), "dur": self.micros(end) - self.micros(start), "pid": pid, "tid": tid}
+            if args:
+                event["args"] = args
+            self.events.append(event)
+
+    # something that happened at one moment, e.g. a notification
+    def instant(self, name : str, category : str, args : dict = None) -> None:
+        with self.lock:
+            pid, tid = self.track(None)
+            event = {"name": name, "cat": category, "ph": "i", "s": "t", "ts": self.micros(time.perf_counter()), "pid": pid, "tid": tid}
+            if args:
+                event["args"] = args
+            self.events.append(event)
+
+    def write(self, path : str) -> None:
+        with self.lock:
+            events = list(self.events)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
+
+
+# the running tracer, or None
+tracer : Tracer = None
+
+def start() -> Tracer:
+    global tracer
+    tracer = Tracer()
+    return tracer
+
+def stop() -> Tracer:
+    global tracer
+    finished, tracer = tracer, None
+    return finished
+
+def complete(name : str, category : str, start : float, args : dict = None) -> None:
+    if tracer is not None and start is not None:
+        tracer.complete(name, category, start, time.perf_counter(), args=args)
+
+def instant(name : str, category : str = "notification", args : dict = None) -> None:
+    if tracer is not None:
+        tracer.instant(name, category, args)
+
+
+# with span("load_tree", "load"): ... records the block as a span if a tracer is running.
+# pid : the solver process the work happens in, to put the span on that process' track
+class Span():
+    __slots__ = ["name", "category", "pid", "args", "started"]
+
+    def __init__(self, name : str, category : str, pid : int = None, args : dict = None) -> None:
+        self.name = name
+        self.category = category
+        self.pid = pid
+        self.args = args
+        self.started = None
+
+    def __enter__(self) -> Span:
+        if tracer is not None:
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, kind, error, trace) -> None:
+        if tracer is not None and self.started is not None:
+            args = self.args
+            if kind is not None:
+                args = dict(args or {}, error=str(error))
+            tracer.complete(self.name, self.category, self.started, time.perf_counter(), self.pid, args)
+
+def span(name : str, category : str = "stage", pid : int = None, **args) -> Span:
+    return Span(name, category, pid, args or None)
+
+
+class Tests(unittest.TestCase):
+
+    def testSpans(self):
+        self.assertIsNone(tracer)
+        with span("ignored"):
+            pass
+        start()
+        with span("load_tree", "load", file="a.cfr"):
+            with span("load_tree", "solver", pid=1234):
+                pass
+        worker = threading.Thread(target=lambda: instant("Saved to: x"), name="extract")
+        worker.start()
+        worker.join()
+        try:
+            with span("solve", "solve"):
+                raise ValueError("boom")
+        except ValueError:
+            pass
+        events = stop().events
+        self.assertIsNone(tracer)
+
+        spans = [e for e in events if e["ph"] == "X"]
+        self.assertEqual([e["name"] for e in spans], ["load_tree", "load_tree", "solve"])
+        self.assertEqual(spans[0]["pid"], 1234)
+        self.assertEqual(spans[1]["args"], {"file": "a.cfr"})
+        self.assertGreaterEqual(spans[1]["dur"], spans[0]["dur"])
+        self.assertEqual(spans[2]["args"]["error"], "boom")
+        names = [e["args"]["name"] for e in events if e["ph"] == "M"]
+        self.assertIn("solver 1234", names)
+        self.assertIn("extract", names)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,373 @@
+from __future__ import annotations
+from stringFunc import parseChildrenToList, parseNodeIDtoList
+from treeops import nodeFamily
+from solverCommands import SolverCommmand
+from SolverConnection.solver import SolverException
+from errorMessages import Errors
+from resultCache import cachePath, cacheEnabled
+from array import array
+import unittest
+import tempfile
+import gzip
+import json
+import sys
+import os
+
+# the topology of a loaded tree (node IDs, parents, children, node types and boards), crawled once with
+# pipelined show_children commands so family lookups and line walks don't need a round trip to the solver.
+# nodes are stored breadth first in flat arrays, so the children of a node are consecutive offsets.
+# indexes are saved by the sha256 of the .cfr file, next to the result cache (PIOSPEED_NO_CACHE=1 turns that off too).
+indexPath = os.path.join(os.path.dirname(cachePath), "trees")
+
+chanceNode = "SPLIT_NODE"
+version = 1
+
+
+class TreeIndex():
+
+    def __init__(self) -> None:
+        # node IDs, interned, by offset
+        self.ids : list[str] = []
+        self.offsets : dict[str, int] = {}
+        # offset of the parent (-1 for the root), of the first child (-1 while the children aren't indexed) and the number of children the solver reported
+        self.parents = array("i")
+        self.firstChild = array("i")
+        self.childCount = array("i")
+        # indexes into typeNames and boardNames
+        self.types = array("B")
+        self.boards = array("H")
+        self.typeNames : list[str] = []
+        self.boardNames : list[str] = []
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, nodeID : str) -> bool:
+        return nodeID in self.offsets
+
+    @staticmethod
+    def intern(names : list[str], name : str) -> int:
+        try:
+            return names.index(name)
+        except ValueError:
+            names.append(name)
+            return len(names) - 1
+
+    # adds a node; the children of a node have to be added one after the other
+    def add(self, nodeID : str, parent : int, type : str, board : str, children : int) -> int:
+        offset = len(self.ids)
+        nodeID = sys.intern(nodeID)
+        self.ids.append(nodeID)
+        self.offsets[nodeID] = offset
+        self.parents.append(parent)
+        self.firstChild.append(-1)
+        self.childCount.append(children)
+        self.types.append(TreeIndex.intern(self.typeNames, type))
+        self.boards.append(TreeIndex.intern(self.boardNames, board))
+        if parent >= 0 and self.firstChild[parent] < 0:
+            self.firstChild[parent] = offset
+        return offset
+
+    def expanded(self, offset : int) -> bool:
+        return self.firstChild[offset] >= 0 or self.childCount[offset] == 0
+
+    # the IDs of the children of nodeID, or None if they aren't indexed
+    def children(self, nodeID : str) -> list[str]:
+        offset = self.offsets.get(nodeID)
+        if offset is None or not self.expanded(offset):
+            return None
+        first = self.firstChild[offset]
+        return self.ids[first:first + self.childCount[offset]]
+
+    def parent(self, nodeID : str) -> str:
+        parent = self.parents[self.offsets[nodeID]]
+        return self.ids[parent] if parent >= 0 else ""
+
+    def nodeType(self, nodeID : str) -> str:
+        offset = self.offsets.get(nodeID)
+        return self.typeNames[self.types[offset]] if offset is not None else None
+
+    # the board at nodeID as As5h3s, or None if it isn't indexed
+    def board(self, nodeID : str) -> str:
+        offset = self.offsets.get(nodeID)
+        return self.boardNames[self.boards[offset]] if offset is not None else None
+
+    # the nodes from the root down to nodeID
+    def line(self, nodeID : str) -> list[str]:
+        offset = self.offsets[nodeID]
+        line = []
+        while offset >= 0:
+            line.append(self.ids[offset])
+            offset = self.parents[offset]
+        line.reverse()
+        return line
+
+    # every indexed node below nodeID (itself included), breadth first
+    def walk(self, nodeID : str = None) -> list[str]:
+        offsets = [self.offsets[nodeID] if nodeID else 0]
+        nodes = []
+        while offsets:
+            offset = offsets.pop(0)
+            nodes.append(self.ids[offset])
+            first = self.firstChild[offset]
+            if first >= 0:
+                offsets.extend(range(first, first + self.childCount[offset]))
+        return nodes
+
+    # the same family TreeOperator.get_family builds, or None if the index doesn't cover nodeID's parent and children.
+    # raises like get_family if the parent is indexed but has no such child
+    def family(self, nodeID : str) -> nodeFamily:
+        offset = self.offsets.get(nodeID)
+        if offset is None:
+            parent = nodeID[:nodeID.rfind(":")]
+            sisters = self.children(parent)
+            if sisters is None or ":" not in nodeID:
+                return None
+            raise Exception("Invalid decision node - the child nodes of " + parent + " are:  " + " ".join(sisters))
+        parent = self.parents[offset]
+        if parent < 0 or not self.expanded(offset):
+            return None
+        first = self.firstChild[parent]
+        return nodeFamily(nodeID=nodeID, parent=self.ids[parent], index=offset - first,
+                          sisters=self.ids[first:first + self.childCount[parent]], children=self.children(nodeID))
+
+    def toJSON(self) -> dict:
+        return {"version": version, "ids": self.ids, "parents": self.parents.tolist(), "firstChild": self.firstChild.tolist(),
+                "childCount": self.childCount.tolist(), "types": self.types.tolist(), "boards": self.boards.tolist(),
+                "typeNames": self.typeNames, "boardNames": self.boardNames}
+
+    @staticmethod
+    def fromJSON(saved : dict) -> TreeIndex:
+        if saved.get("version") != version:
+            return None
+        index = TreeIndex()
+        index.ids = [sys.intern(i) for i in saved["ids"]]
+        index.offsets = {nodeID: offset for offset, nodeID in enumerate(index.ids)}
+        index.parents = array("i", saved["parents"])
+        index.firstChild = array("i", saved["firstChild"])
+        index.childCount = array("i", saved["childCount"])
+        index.types = array("B", saved["types"])
+        index.boards = array("H", saved["boards"])
+        index.typeNames = saved["typeNames"]
+        index.boardNames = saved["boardNames"]
+        return index
+
+
+def childCount(line : str) -> int:
+    # '3 children'
+    return int(line.split(" ")[0])
+
+# the output of show_children for each node, pipelined; None for a node the solver rejected
+def showChildren(connection, nodeIDs : list[str]) -> list[list[str]]:
+    return SolverCommmand(connection).pipeline(["show_children " + nodeID for nodeID in nodeIDs])
+
+# nodeID -> the IDs of its children, from index where it has them and one pipelined round of show_children for the rest
+def childrenOf(connection, index : TreeIndex, nodeIDs : list[str]) -> dict[str, list[str]]:
+    children = {}
+    missing = []
+    for nodeID in nodeIDs:
+        known = index.children(nodeID) if index is not None else None
+        if known is None:
+            missing.append(nodeID)
+        else:
+            children[nodeID] = known
+    for nodeID, output in zip(missing, showChildren(connection, missing)):
+        children[nodeID] = [c[1] for c in parseChildrenToList(output)] if output else []
+    return children
+
+# whether a step of a node ID (c, b16, 7h...) matches a step of a selector: * matches any step, b* any bet size
+def matchesStep(pattern : str, step : str) -> bool:
+    if pattern == "*":
+        return True
+    if pattern == "b*":
+        return step[:1] == "b" and step[1:].isnumeric()
+    return pattern == step
+
+# the families of every node of the loaded tree that matches selector (e.g. r:0:c:b*:c:*), in tree order.
+# the tree is walked one selector step at a time, each step a single pipelined round for the nodes index doesn't cover
+def selectFamilies(connection, index : TreeIndex, selector : str) -> list[nodeFamily]:
+    steps = parseNodeIDtoList(selector)
+    if len(steps) == 1:
+        raise Exception(Errors.invalid_node(selector))
+    level = [steps[0]]
+    parents = {}
+    # the children listed so far, by node; the sisters of each match are its parent's children
+    listed = {}
+    for pattern in steps[1:]:
+        children = childrenOf(connection, index, level)
+        listed.update(children)
+        next = []
+        for nodeID in level:
+            for child in children[nodeID]:
+                if matchesStep(pattern, child.split(":")[-1]):
+                    parents[child] = nodeID
+                    next.append(child)
+        level = next
+        if not level:
+            raise Exception(Errors.noMatchingNodes(selector))
+    children = childrenOf(connection, index, level)
+    families = []
+    for nodeID in level:
+        sisters = listed[parents[nodeID]]
+        families.append(nodeFamily(nodeID=nodeID, parent=parents[nodeID], index=sisters.index(nodeID), sisters=sisters, children=children[nodeID]))
+    return families
+
+# crawls the tree loaded on connection from root, one pipelined round of show_children per level.
+# chance : also go past chance nodes (every turn and river card - far bigger); by default their children are left to the solver
+def crawl(connection, root : str = "r:0", chance : bool = False) -> TreeIndex:
+    index = TreeIndex()
+    # ['r:0', 'OOP_DEC', 'As 5h 3s', '0 0 55', '2 children', 'flags: PIO_CFR']
+    node = connection.command("show_node " + root)
+    index.add(root, -1, node[1], node[2].replace(" ", ""), childCount(node[4]))
+    level = [0]
+    while level:
+        expand = [n for n in level if index.childCount[n] > 0 and (chance or index.typeNames[index.types[n]] != chanceNode)]
+        level = []
+        for n, output in zip(expand, showChildren(connection, [index.ids[n] for n in expand])):
+            if output is None:
+                continue
+            for child in parseChildrenToList(output):
+                level.append(index.add(child[1], n, child[2], child[3].replace(" ", ""), childCount(child[5])))
+    return index
+
+
+class TreeIndexStore():
+
+    def __init__(self, folder : str = indexPath, enabled : bool = cacheEnabled) -> None:
+        self.folder = folder
+        self.enabled = enabled
+
+    def path(self, digest : str) -> str:
+        return os.path.join(self.folder, digest + ".json.gz")
+
+    # the index saved for a file's sha256, or None
+    def get(self, digest : str) -> TreeIndex:
+        if not self.enabled or digest is None:
+            return None
+        try:
+            with gzip.open(self.path(digest), "rt", encoding="utf-8") as f:
+                return TreeIndex.fromJSON(json.load(f))
+        except (OSError, ValueError, KeyError, EOFError):
+            return None
+
+    def put(self, digest : str, index : TreeIndex) -> None:
+        if not self.enabled or digest is None or index is None:
+            return
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            temporary = self.path(digest) + ".tmp"
+            with gzip.open(temporary, "wt", encoding="utf-8") as f:
+                json.dump(index.toJSON(), f, separators=(",", ":"))
+            os.replace(temporary, self.path(digest))
+        except OSError:
+            pass
+
+
+class Tests(unittest.TestCase):
+
+    # r:0 (OOP) -> c (IP) -> c (chance, 2 cards) and b10 (IP) -> f, c
+    class Tree():
+        nodes = {
+            "r:0": ("OOP_DEC", ["r:0:c", "r:0:b10"]),
+            "r:0:c": ("IP_DEC", ["r:0:c:c"]),
+            "r:0:b10": ("IP_DEC", ["r:0:b10:f", "r:0:b10:c"]),
+            "r:0:c:c": ("SPLIT_NODE", ["r:0:c:c:2c", "r:0:c:c:2d"]),
+            "r:0:b10:f": ("END_NODE", []),
+            "r:0:b10:c": ("END_NODE", []),
+            "r:0:c:c:2c": ("OOP_DEC", []),
+            "r:0:c:c:2d": ("OOP_DEC", []),
+        }
+
+        def __init__(self, missing : list[str] = None):
+            self.written = []
+            self.pending = []
+            # nodes the solver says don't exist, although their parents list them
+            self.missing = missing or []
+
+        def describe(self, nodeID):
+            return [nodeID, self.nodes[nodeID][0], "As 5h 3s", "0 0 55", str(len(self.nodes[nodeID][1])) + " children", "flags:"]
+
+        def command(self, line):
+            self.write_lines([line])
+            return self.read_until_end()
+
+        def write_lines(self, lines):
+            self.written.append(lines)
+            self.pending.extend(lines)
+
+        def read_until_end(self):
+            line = self.pending.pop(0)
+            # the END that follows an ERROR
+            if line is None:
+                return []
+            verb, nodeID = line.split(" ")
+            if nodeID not in self.nodes or nodeID in self.missing:
+                self.pending.insert(0, None)
+                raise SolverException("ERROR: no such node")
+            if verb == "show_node":
+                return self.describe(nodeID)
+            output = []
+            for i, child in enumerate(self.nodes[nodeID][1]):
+                output.extend(["child " + str(i) + ":"] + self.describe(child) + [""])
+            return output
+
+    def testCrawlAndLookups(self):
+        solver = Tests.Tree()
+        index = crawl(solver)
+        # one show_node, then one pipelined write per level
+        self.assertEqual(len(solver.written), 3)
+        self.assertEqual(solver.written[2], ["show_children r:0:c", "show_children r:0:b10"])
+        self.assertEqual(len(index), 6)
+        self.assertNotIn("r:0:c:c:2c", index)
+
+        family = index.family("r:0:b10")
+        self.assertEqual([family.parent, family.index, family.sisters, family.children], ["r:0", 1, ["r:0:c", "r:0:b10"], ["r:0:b10:f", "r:0:b10:c"]])
+        self.assertEqual(index.line("r:0:b10:c"), ["r:0", "r:0:b10", "r:0:b10:c"])
+        self.assertEqual(index.nodeType("r:0:c:c"), "SPLIT_NODE")
+        self.assertEqual(index.board("r:0:c"), "As5h3s")
+        self.assertEqual(index.walk("r:0:b10"), ["r:0:b10", "r:0:b10:f", "r:0:b10:c"])
+        # the chance node's children aren't indexed, so those are left to the solver
+        self.assertIsNone(index.family("r:0:c:c"))
+        self.assertIsNone(index.family("r:0:c:c:2c"))
+        self.assertRaises(Exception, index.family, "r:0:b20")
+
+        self.assertEqual(len(crawl(Tests.Tree(), chance=True)), 8)
+
+    def testSelectors(self):
+        solver = Tests.Tree()
+        index = crawl(solver)
+        families = selectFamilies(solver, index, "r:0:*:*")
+        self.assertEqual([f.nodeID for f in families], ["r:0:c:c", "r:0:b10:f", "r:0:b10:c"])
+        self.assertEqual([families[2].parent, families[2].index, families[2].children], ["r:0:b10", 1, []])
+        self.assertEqual(families[0].children, ["r:0:c:c:2c", "r:0:c:c:2d"])
+        solver.written = []
+        # past the chance node the index has nothing, so each step is one pipelined round
+        families = selectFamilies(solver, index, "r:0:c:c:*")
+        self.assertEqual([f.nodeID for f in families], ["r:0:c:c:2c", "r:0:c:c:2d"])
+        self.assertEqual(families[1].sisters, ["r:0:c:c:2c", "r:0:c:c:2d"])
+        self.assertEqual(solver.written, [["show_children r:0:c:c"], ["show_children r:0:c:c:2c", "show_children r:0:c:c:2d"]])
+        self.assertEqual([f.nodeID for f in selectFamilies(solver, None, "r:0:b*")], ["r:0:b10"])
+        self.assertRaises(Exception, selectFamilies, solver, index, "r:0:f")
+
+    def testNoSuchNode(self):
+        # the first node of the pipelined round fails; the rest of the round is still read in order
+        solver = Tests.Tree(missing=["r:0:c"])
+        index = crawl(solver)
+        self.assertEqual(solver.pending, [])
+        self.assertIsNone(index.children("r:0:c"))
+        self.assertEqual(index.children("r:0:b10"), ["r:0:b10:f", "r:0:b10:c"])
+        self.assertEqual([f.nodeID for f in selectFamilies(solver, index, "r:0:b10:*")], ["r:0:b10:f", "r:0:b10:c"])
+        self.assertRaises(Exception, selectFamilies, solver, index, "r:0:c:*")
+        self.assertRaises(SolverException, crawl, Tests.Tree(missing=["r:0"]))
+
+    def testStore(self):
+        with tempfile.TemporaryDirectory() as folder:
+            store = TreeIndexStore(folder)
+            store.put("abc", crawl(Tests.Tree()))
+            index = store.get("abc")
+            self.assertEqual(index.family("r:0:c").sisters, ["r:0:c", "r:0:b10"])
+            self.assertIsNone(store.get("def"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,12 @@
 from __future__ import annotations
-from stringFunc import parseStringToList, parseNodeIDtoList, makeNodeIDfromList, parseStrategyToList, makeStrategyFromList, makeString
+from stringFunc import parseStringToList, parseChildrenToList, parseNodeIDtoList, makeNodeIDfromList, parseStrategyToList, makeStrategyFromList, makeString
 from global_var import totalCombos, hand_category_index, draw_category_index, exception_categories
 from decimal import Decimal, getcontext
 from SolverConnection.solver import Solver
 import unittest
 from inputs import WeightsFile
+from combos import getBoardMasks, indexes
+import categories
 
 
 printConsole = False
@@ -48,8 +50,10 @@ class nodeInfo():
         self.pot = pot
         
 class TreeOperator(): 
-    def __init__(self, connection):
+    # index : the treeIndex.TreeIndex of the loaded tree, if there is one; family lookups it covers don't ask the solver
+    def __init__(self, connection, index = None):
         self.connection = connection
+        self.index = index
         if tryPio(self.connection, self.connection.command, ["is_tree_present"]) == "false":
             raise Exception("No tree is loaded; cannot perform tree operations")
         
@@ -57,6 +61,7 @@ class TreeOperator():
     
     # args[0] nodeId
     # args[1] weightsFile
+    # args[2] (optional) the strategy to apply the weights to instead of the parent's current one, e.g. its strategy before an earlier set_strategy
     def set_strategy(self, args : list) :
         nodeID = args[0]
         family = self.get_family(nodeID)
@@ -66,7 +71,10 @@ class TreeOperator():
         
         # the strategy map of the target node and all its sister nodeq
         # format: a list of a list of 1326 floats (one per combo)
-        strategy = self.getCurrentStrategyAsList(family.parent)
+        if len(args) > 2 and args[2]:
+            strategy = [list(s) for s in args[2]]
+        else:
+            strategy = self.getCurrentStrategyAsList(family.parent)
         
         self.alter_strategy(strategy, weightMap, family.index, nodeID)
         
@@ -92,6 +100,10 @@ class TreeOperator():
     # in order to nodelock a particular decision, we need to reference it by its index number as the child of the parent
     # this takes a node and returns both in the form [parentNodeID, [sister node IDs], index]
     def get_family(self, nodeID : str) -> nodeFamily:
+        if self.index is not None:
+            family = self.index.family(nodeID)
+            if family is not None:
+                return family
         family = nodeFamily(nodeID=nodeID)
         
         family.children = self.getChildIDs(nodeID)
@@ -117,22 +129,12 @@ class TreeOperator():
     def getChildIDs (self, nodeID : str) -> list[str] :
         # example output: 
         # ['child 0:', 'r:0:c:b16', 'OOP_DEC', 'As 5h 3s', '0 16 55', '3 children', 'flags: PIO_CFR', '', 'child 1:', 'r:0:c:c', 'SPLIT_NODE', 'As 5h 3s', '0 0 55', '49 children', 'flags:', '']
-        output = self.connection.command("show_children " + nodeID) 
-        childList = []
-        child = []
-        ids = []
-        # split single list into list of lists using delimiter ''
-        for o in output:
-            if (o == ''):
-                childList.append(child)
-                child = []
-            else:
-                child.append(o)
-                
-        for c in childList:
-            ids.append(c[1])
-        
-        return ids
+        if self.index is not None:
+            children = self.index.children(nodeID)
+            if children is not None:
+                return children
+        output = self.connection.command("show_children " + nodeID)
+        return [c[1] for c in parseChildrenToList(output)]
     
     # gets the info at the current node 
     def getNodeInfo(self, nodeID : str) -> str:
@@ -152,34 +154,33 @@ class TreeOperator():
         return [oop_range, ip_range]
        
     def parseCategories(self, nodeID):
-        op = self.connection.command("show_categories " + self.getNodeInfo(nodeID).board)
+        return self.showCategories(self.getNodeInfo(nodeID).board)
+
+    def showCategories(self, board : str):
+        op = self.connection.command("show_categories " + board)
         # a 1326 length list of integers, each referencing the hand category the corresponding combo belongs to.
         hand_per_combo = parseStringToList(op[0])
         draw_per_combo = parseStringToList(op[1])
         return [hand_per_combo, draw_per_combo]
 
-    # checks if category is draw or hand category and updates weights accordingly
+    # applies each weights file key (a category, hand class or combination of them) to the combos it selects
     def alter_strategy(self, strategy : list[list[float]], weightMap : dict[str, int], targetIndex: int, targetNodeID : str) -> list[float]:
 
-        # derives the hand and draw categories (their indexes) of combos in target node from pio output
-        target_categories = self.parseCategories(targetNodeID)
-        target_hand_cats= target_categories[0]
-        target_draw_cats = target_categories[1]
+        # masks are built from the hand and draw categories of the board (computed locally unless categories.categoryMode says otherwise), and cached per board
+        board = self.index.board(targetNodeID) if self.index is not None else None
+        if board is None:
+            board = self.getNodeInfo(targetNodeID).board
+        masks = getBoardMasks(board, lambda: categories.forBoard(board, lambda: self.showCategories(board)))
         
         for category_name in weightMap:
-            # if it is a hand category
             addInsteadOfReplace = category_name in exception_categories
-            
-            if category_name in hand_category_index:
-                # inputs: the current strategy, the index of the target node, the category index corresponding to the category name, the weight of that category)
-                strategy = self.update_weight(strategy, targetIndex, target_hand_cats, hand_category_index.get(category_name), weightMap.get(category_name), addInsteadOfReplace)
-            # if it is a draw category
-            if category_name in draw_category_index:
-                strategy = self.update_weight(strategy, targetIndex, target_draw_cats, draw_category_index.get(category_name), weightMap.get(category_name), addInsteadOfReplace)
+            # inputs: the current strategy, the index of the target node, the combos the key selects, the weight for them
+            strategy = self.update_weight(strategy, targetIndex, masks.mask(category_name), weightMap.get(category_name), addInsteadOfReplace)
+        return strategy
     
-    # alters the combos that belong to the given category to the given weight
+    # alters the combos in the mask to the given weight
     # updates the corresponding combos in the other child nodes to a weight that keeps the proportions of the other strategies the same as before
-    def update_weight(self, strategy : list[list[float]], targetIndex : int, categoriesOfCombos : list[int], category : int, category_weight : float, addWeight : bool) -> list[float]:
+    def update_weight(self, strategy : list[list[float]], targetIndex : int, mask : int, category_weight : float, addWeight : bool) -> list[float]:
         '''
         newWeight = Decimal(normalizeWeight(newWeight))
         
@@ -220,12 +221,8 @@ class TreeOperator():
         category_weight = Decimal(normalizeWeight(category_weight))
         wrongTotal = {}
         
-        #per combo
-        for comboIndex in range(0,totalCombos):
-            
-            # if the category of the combo is equal to the category whose weight we are trying to change
-            if categoriesOfCombos[comboIndex] == category:
-                
+        # only the combos selected by the mask
+        for comboIndex in indexes(mask):
 
                 # add up weights of all child nodes
                 totalWeight = Decimal(0)
@@ -241,13 +238,11 @@ class TreeOperator():
                     
                     #wrongTotal = {}
                     original_target_node_weight = Decimal(strategy[targetIndex][comboIndex])
+                    target_weight = category_weight
                     if addWeight:
-                        category_weight = original_target_node_weight + category_weight
-                    
-                    category_weight = max(min(100, category_weight), 0)
+                        target_weight = original_target_node_weight + category_weight
                     
-                    if category_weight < 0:
-                        raise Exception("Weight adjustment entered is invalid; cannot have negative percentage")
+                    target_weight = max(min(1, target_weight), 0)
                     
 
                     newWeightsTotal = Decimal(0)
@@ -259,16 +254,16 @@ class TreeOperator():
                     for childIndex in range(0,len(strategy)) :
                         weight = 0
                         if childIndex == targetIndex:
-                            weight = category_weight
+                            weight = target_weight
                         else:
                             # if the other decisions were all 0, make them equally likely
                             if (totalWeight - original_target_node_weight) == Decimal(0):
-                                weight = (Decimal(1) - category_weight)/(Decimal(len(strategy) - 1))
+                                weight = (Decimal(1) - target_weight)/(Decimal(len(strategy) - 1))
                                 #print("oldWeight : " + str(original_target_weight))
                                 #print("newWeight : " + str(weight))
                             #  if not, multiply a constant that will maintain their relative proportions
                             else:
-                                k = (Decimal(1) - category_weight)/(Decimal(1) - original_target_node_weight)
+                                k = (Decimal(1) - target_weight)/(Decimal(1) - original_target_node_weight)
                                 weight = Decimal(strategy[childIndex][comboIndex])* Decimal(k)
                             
                         strategy[childIndex][comboIndex] = weight
@@ -0,0 +1,101 @@
+from __future__ import annotations
+from inputs import CFRFolder, WeightsFile, BoardFile, InputType
+import threading
+import unittest
+import copy
+import os
+
+
+# parses user inputs (folders, weights and board files) and remembers the result until the input changes on disk.
+# validation and command submission both go through here so a folder or JSON file is only read once.
+class ValidationCache():
+
+    def __init__(self) -> None:
+        self.parsers = {
+            InputType.cfr_folder.name: CFRFolder().parseInput,
+            InputType.weights_file.name: WeightsFile().parseInput,
+            InputType.board_file.name: BoardFile().parseInput,
+        }
+        # (input type, path) -> [stamp, parsed result, error message]
+        self.entries : dict[tuple[str, str], list] = {}
+        self.lock = threading.Lock()
+
+    # identifies the version of a file or folder on disk; None if it cannot be read
+    @staticmethod
+    def stamp(path : str):
+        try:
+            info = os.stat(path)
+        except (OSError, TypeError, ValueError):
+            return None
+        return (info.st_mtime_ns, info.st_size)
+
+    # returns the parsed input, re-parsing only if the path changed since it was last seen.
+    # raises the same exception the parser raised if the input is invalid.
+    def parse(self, input_type : str, path : str):
+        parser = self.parsers.get(input_type)
+        if parser is None:
+            raise Exception("Unknown input type: " + str(input_type))
+
+        key = (input_type, path)
+        stamp = ValidationCache.stamp(path)
+
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is not None and stamp is not None and entry[0] == stamp:
+            if entry[2] is not None:
+                raise Exception(entry[2])
+            # callers may alter what they get back (e.g. popping from board lists), so hand out a copy
+            return copy.deepcopy(entry[1])
+
+        try:
+            result = parser(path)
+            error = None
+        except Exception as e:
+            result = None
+            error = str(e)
+
+        if stamp is not None:
+            with self.lock:
+                self.entries[key] = [stamp, result, error]
+
+        if error is not None:
+            raise Exception(error)
+        return copy.deepcopy(result)
+
+    # returns the parsed input and an error message instead of raising, for use from worker threads
+    def validate(self, input_type : str, path : str) -> list:
+        try:
+            return [self.parse(input_type, path), None]
+        except Exception as e:
+            return [None, str(e)]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+class Tests(unittest.TestCase):
+
+    def testReusesParsedResult(self):
+        cache = ValidationCache()
+        calls = []
+        parser = cache.parsers[InputType.weights_file.name]
+        cache.parsers[InputType.weights_file.name] = lambda path: calls.append(path) or parser(path)
+
+        path = os.path.join("..", "sample", "weights", "simple_weights.json")
+        first = cache.parse(InputType.weights_file.name, path)
+        second = cache.parse(InputType.weights_file.name, path)
+        self.assertEqual(first, second)
+        self.assertEqual(len(calls), 1)
+
+    def testRemembersInvalidInput(self):
+        cache = ValidationCache()
+        path = os.path.join("..", "sample", "boards", "board_bad.json")
+        result, error = cache.validate(InputType.board_file.name, path)
+        self.assertIsNone(result)
+        self.assertIsNotNone(error)
+        self.assertEqual(cache.validate(InputType.board_file.name, path)[1], error)
+
+
+if __name__ == '__main__':
+    unittest.main()
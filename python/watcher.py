@@ -0,0 +1,187 @@
+from __future__ import annotations
+from typing import Iterator
+import threading
+import tempfile
+import unittest
+import queue
+import time
+import os
+
+# watchdog subscribes to the OS change notifications (inotify on Linux, ReadDirectoryChangesW on Windows).
+# without it, or on shares that don't deliver events, the folder is polled instead.
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+printConsole = False
+
+
+class _EventForwarder(FileSystemEventHandler):
+    def __init__(self, events : queue.Queue) -> None:
+        super().__init__()
+        self.events = events
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.events.put(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.events.put(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.events.put(event.dest_path)
+
+
+# yields the files with the given extension that appear in a folder, once they have finished being written
+class FolderWatcher():
+
+    def __init__(self, folder : str, extension : str, settle_time : float = 5.0, poll_interval : float = 2.0, rescan_interval : float = 60.0) -> None:
+        self.folder = folder
+        self.extension = extension
+        # a file counts as complete once its size and modification time have not changed for this long
+        self.settle_time = settle_time
+        # how often pending files are re-checked (and the folder listed, when polling)
+        self.poll_interval = poll_interval
+        # with OS notifications the folder is still listed now and then in case an event was missed
+        self.rescan_interval = rescan_interval
+        self.use_notifications = Observer is not None
+
+        # file name -> [size, mtime, time the size/mtime was last seen to change]
+        self.pending : dict[str, list] = {}
+        self.seen : set[str] = set()
+        self.events : queue.Queue = queue.Queue()
+        self.observer = None
+
+    def start(self) -> None:
+        if not self.use_notifications:
+            return
+        try:
+            self.observer = Observer()
+            self.observer.schedule(_EventForwarder(self.events), self.folder, recursive=False)
+            self.observer.start()
+        except Exception as e:
+            # e.g. network shares or too many inotify watches; fall back to polling
+            if printConsole:
+                print("Could not subscribe to " + self.folder + ", polling instead: " + str(e))
+            self.observer = None
+            self.use_notifications = False
+
+    def stop(self) -> None:
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+            self.observer = None
+
+    def isCandidate(self, fName : str) -> bool:
+        return fName.endswith(self.extension) and fName not in self.seen
+
+    # lists the folder and adds any new files to the pending set
+    def scan(self) -> None:
+        try:
+            entries = os.listdir(self.folder)
+        except OSError:
+            return
+        for f in sorted(entries):
+            if self.isCandidate(f) and f not in self.pending:
+                self.pending[f] = [None, None, time.monotonic()]
+
+    def drainEvents(self) -> None:
+        while True:
+            try:
+                path = self.events.get_nowait()
+            except queue.Empty:
+                return
+            f = os.path.basename(path)
+            if self.isCandidate(f) and f not in self.pending:
+                self.pending[f] = [None, None, time.monotonic()]
+
+    # returns the pending files that have stopped changing, in the order they were first seen
+    def settled(self, now : float) -> list[str]:
+        ready = []
+        for f, state in list(self.pending.items()):
+            try:
+                info = os.stat(os.path.join(self.folder, f))
+            except OSError:
+                # deleted or renamed before it was finished
+                self.pending.pop(f)
+                continue
+            if [info.st_size, info.st_mtime_ns] != state[:2]:
+                self.pending[f] = [info.st_size, info.st_mtime_ns, now]
+            elif info.st_size > 0 and now - state[2] >= self.settle_time:
+                ready.append(f)
+
+        for f in ready:
+            self.pending.pop(f)
+            self.seen.add(f)
+        return ready
+
+    # blocks, yielding each complete file name until stop_event is set
+    # files listed in skip are treated as already handled
+    def watch(self, stop_event : threading.Event = None, skip : list[str] = None) -> Iterator[str]:
+        stop_event = stop_event or threading.Event()
+        self.seen.update(skip or [])
+        self.start()
+        try:
+            self.scan()
+            lastScan = time.monotonic()
+            while not stop_event.is_set():
+                now = time.monotonic()
+                if not self.use_notifications or now - lastScan >= self.rescan_interval:
+                    self.scan()
+                    lastScan = now
+                self.drainEvents()
+
+                for f in self.settled(now):
+                    if printConsole:
+                        print("Ready: " + f)
+                    yield f
+
+                stop_event.wait(self.poll_interval)
+        finally:
+            self.stop()
+
+
+class Tests(unittest.TestCase):
+
+    def testYieldsSettledFilesOnce(self):
+        with tempfile.TemporaryDirectory() as folder:
+            with open(os.path.join(folder, "a.cfr"), "w") as f:
+                f.write("tree")
+            with open(os.path.join(folder, "notes.txt"), "w") as f:
+                f.write("ignored")
+
+            watcher = FolderWatcher(folder, ".cfr", settle_time = 0.05, poll_interval = 0.01)
+            watcher.use_notifications = False
+            stop = threading.Event()
+            found = []
+            for f in watcher.watch(stop, skip = ["old.cfr"]):
+                found.append(f)
+                if f == "a.cfr":
+                    with open(os.path.join(folder, "b.cfr"), "w") as new:
+                        new.write("tree")
+                else:
+                    stop.set()
+            self.assertEqual(found, ["a.cfr", "b.cfr"])
+
+    def testWaitsWhileFileIsWritten(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "a.cfr")
+            with open(path, "w") as f:
+                f.write("tr")
+            watcher = FolderWatcher(folder, ".cfr", settle_time = 10)
+            watcher.scan()
+            self.assertEqual(watcher.settled(0), [])
+            self.assertEqual(watcher.settled(5), [])
+            with open(path, "a") as f:
+                f.write("ee")
+            self.assertEqual(watcher.settled(11), [])
+            self.assertEqual(watcher.settled(21), ["a.cfr"])
+
+
+if __name__ == '__main__':
+    unittest.main()